@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+
+# computer opponent: negamax with alpha-beta pruning over the bitboard engine,
+# iterative deepening under a time budget and a bounded transposition table
+
+WIN_SCORE = 1000000
+EXACT, LOWER, UPPER = 0, 1, 2
+# how many nodes to search between two clock checks
+TIME_CHECK_NODES = 1024
+
+class SearchTimeout(Exception):
+    pass
+
+class TranspositionTable:
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, depth, value, flag, move):
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+        elif len(entries) >= self.max_entries:
+            # least recently used position goes first
+            entries.popitem(last=False)
+        entries[key] = (depth, value, flag, move)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+def center_order(columns):
+    center = columns // 2
+    return sorted(range(columns), key=lambda col: (abs(col - center), col))
+
+def position_key(board, piece):
+    # scores are from the side to move, so it is part of the key
+    return board.key(piece)
+
+def evaluate(board, piece):
+    # cheap static score: open pairs and triples in every direction, plus the center column
+    opponent = 2 if piece == 1 else 1
+    center_mask = ((1 << board.rows) - 1) << (board.columns // 2 * board.stride)
+    score = 0
+    for sign, bitboard in ((1, board.bitboards[piece]), (-1, board.bitboards[opponent])):
+        total = (bitboard & center_mask).bit_count() * 3
+        for shift in board.directions:
+            pairs = bitboard & (bitboard >> shift)
+            total += pairs.bit_count() * 2
+            total += (pairs & (bitboard >> (2 * shift))).bit_count() * 5
+        score += sign * total
+    return score
+
+class AIPlayer:
+    def __init__(self, max_depth=8, time_ms=500, tt_size=200000, book=None):
+        self.max_depth = max_depth
+        self.time_ms = time_ms
+        self.table = TranspositionTable(tt_size)
+        self.book = book
+        self.nodes = 0
+        self.deadline = None
+
+    def choose_move(self, board, piece):
+        if self.book is not None:
+            entry = self.book.lookup(board, piece)
+            if entry is not None:
+                return entry[0]
+
+        # take a win at once, otherwise block the opponent's immediate win
+        board = board.copy()
+        valid = [col for col in center_order(board.columns) if board.is_valid_location(col)]
+        opponent = 2 if piece == 1 else 1
+        for player in (piece, opponent):
+            for col in valid:
+                if self.wins_with(board, col, player):
+                    return col
+        return self.search(board, piece)[0]
+
+    def search(self, board, piece):
+        # returns the best move and its score for piece, the side to move
+        board = board.copy()
+        valid = [col for col in center_order(board.columns) if board.is_valid_location(col)]
+        if not valid:
+            return None, 0
+
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_ms / 1000 if self.time_ms else None
+        best_move, best_score = valid[0], 0
+        max_depth = min(self.max_depth, board.rows * board.columns - board.moves)
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self.search_root(board, depth, piece, valid)
+            except SearchTimeout:
+                break
+            if move is not None:
+                best_move, best_score = move, score
+            if abs(score) >= WIN_SCORE - board.rows * board.columns:
+                break
+        return best_move, best_score
+
+    def wins_with(self, board, col, piece):
+        board.drop_piece(col, piece)
+        wins = board.winning_move(piece)
+        board.undo_piece(col, piece)
+        return wins
+
+    def search_root(self, board, depth, piece, moves):
+        alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+        best_score, best_move = -WIN_SCORE - 1, None
+        entry = self.table.get(position_key(board, piece))
+        for col in self.ordered_moves(board, moves, entry[3] if entry else None):
+            score = self.play_and_score(board, col, piece, depth, alpha, beta)
+            if score > best_score:
+                best_score, best_move = score, col
+            alpha = max(alpha, score)
+        self.table.put(position_key(board, piece), depth, best_score, EXACT, best_move)
+        return best_score, best_move
+
+    def ordered_moves(self, board, order, first=None):
+        moves = [col for col in order if board.heights[col] < board.rows]
+        if first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def play_and_score(self, board, col, piece, depth, alpha, beta):
+        board.drop_piece(col, piece)
+        try:
+            if board.winning_move(piece):
+                return WIN_SCORE - board.moves
+            if board.is_full():
+                return 0
+            opponent = 2 if piece == 1 else 1
+            return -self.negamax(board, depth - 1, -beta, -alpha, opponent)
+        finally:
+            board.undo_piece(col, piece)
+
+    def negamax(self, board, depth, alpha, beta, piece):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % TIME_CHECK_NODES == 0:
+            if time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+
+        if depth == 0:
+            return evaluate(board, piece)
+
+        key = position_key(board, piece)
+        entry = self.table.get(key)
+        hint = None
+        alpha_orig = alpha
+        if entry is not None:
+            entry_depth, value, flag, hint = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        best_score, best_move = -WIN_SCORE - 1, None
+        for col in self.ordered_moves(board, center_order(board.columns), hint):
+            score = self.play_and_score(board, col, piece, depth, alpha, beta)
+            if score > best_score:
+                best_score, best_move = score, col
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.put(key, depth, best_score, flag, best_move)
+        return best_score
+
+# searches run in worker processes so they never block the network loop; each
+# worker keeps its own players, and with them their transposition tables. a
+# player holds the state of one search at a time, so with a thread pool every
+# thread gets its own
+_local = threading.local()
+
+def search_move(board, piece, max_depth, time_ms, book_path=None):
+    players = getattr(_local, "players", None)
+    if players is None:
+        players = _local.players = {}
+    player = players.get((max_depth, time_ms, book_path))
+    if player is None:
+        book = None
+        if book_path is not None:
+            from opening_book import OpeningBook
+            book = OpeningBook(book_path)
+        player = players[(max_depth, time_ms, book_path)] = AIPlayer(max_depth, time_ms, book=book)
+    return player.choose_move(board, piece)
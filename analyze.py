@@ -0,0 +1,264 @@
+import argparse
+import json
+import mmap
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gamelog import CONNECT_SHIFT, FLAG_POPOUT, FLAG_TIMEOUT, HEADER, RECORD, check_header
+
+# bulk statistics over game logs written by the server
+#
+# the logs are cut into chunks of whole records, and each chunk is replayed in
+# a worker process. a worker replays all games of its chunk at once: every
+# game is a pair of 64 bit boards in a numpy array laid out like engine.Board
+# (one column per stride of rows + 1 bits), and each ply drops one piece in
+# every game still running. the final boards are checked for a line of the
+# game's length with the same shift and mask test as the engine. popout games
+# are not replayed, pops need a whole column shifted per game.
+
+NO_MOVE = 255
+
+def scan_chunks(path, chunk_size):
+    # byte ranges holding chunk_size records each, found by hopping over record headers
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        check_header(data, path)
+        chunks = []
+        start = offset = HEADER.size
+        count = 0
+        while offset + RECORD.size <= len(data):
+            end = offset + RECORD.size + RECORD.unpack_from(data, offset)[-1]
+            if end > len(data):
+                break
+            offset = end
+            count += 1
+            if count == chunk_size:
+                chunks.append((path, start, offset))
+                start, count = offset, 0
+        if count:
+            chunks.append((path, start, offset))
+        return chunks
+    finally:
+        data.close()
+
+def load_chunk(path, start, end):
+    # column arrays for the records in data[start:end], moves padded with NO_MOVE
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        headers = []
+        moves = []
+        offset = start
+        while offset < end:
+            fields = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            headers.append(fields)
+            moves.append(data[offset:offset + fields[-1]])
+            offset += fields[-1]
+    finally:
+        data.close()
+
+    headers = np.array(headers, dtype=np.int64)
+    lengths = headers[:, -1]
+    matrix = np.full((len(headers), max(int(lengths.max(initial=0)), 1)), NO_MOVE, dtype=np.uint8)
+    if lengths.sum():
+        flat = np.frombuffer(b"".join(moves), dtype=np.uint8)
+        starts = np.cumsum(lengths) - lengths
+        games = np.repeat(np.arange(len(headers)), lengths)
+        plies = np.arange(len(flat)) - np.repeat(starts, lengths)
+        matrix[games, plies] = flat
+    return {
+        "rows": headers[:, 2],
+        "columns": headers[:, 3],
+        "first_player": headers[:, 4],
+        "winner": headers[:, 5],
+        "flags": headers[:, 6],
+        "length": lengths,
+        "moves": matrix,
+    }
+
+def has_line(boards, stride, connect):
+    found = np.zeros(len(boards), dtype=bool)
+    for shift in (1, stride, stride + 1, stride - 1):
+        runs = boards
+        length = 1
+        while length * 2 <= connect:
+            runs = runs & (runs >> np.uint64(length * shift))
+            length *= 2
+        if length < connect:
+            runs = runs & (runs >> np.uint64((connect - length) * shift))
+        found |= runs != 0
+    return found
+
+def replay(moves, lengths, first_player, rows, columns, connect=4):
+    # returns the winner of every game from its moves, 0 for none, -1 for an illegal game
+    games = len(lengths)
+    stride = rows + 1
+    boards = np.zeros((2, games), dtype=np.uint64)
+    heights = np.zeros((games, columns), dtype=np.int64)
+    illegal = np.zeros(games, dtype=bool)
+    index = np.arange(games)
+    # pieces alternate from first_player, row 0 of boards is player 1
+    mover = first_player - 1
+
+    for ply in range(moves.shape[1]):
+        active = (lengths > ply) & ~illegal
+        if not active.any():
+            break
+        col = moves[:, ply].astype(np.int64)
+        bad = active & ((col >= columns) | (heights[index, np.minimum(col, columns - 1)] >= rows))
+        illegal |= bad
+        active &= ~bad
+
+        games_now = index[active]
+        col = col[active]
+        bits = np.left_shift(np.uint64(1), (col * stride + heights[games_now, col]).astype(np.uint64))
+        players = mover[active]
+        boards[players, games_now] |= bits
+        heights[games_now, col] += 1
+        mover = 1 - mover
+
+    winner = np.zeros(games, dtype=np.int64)
+    winner[has_line(boards[0], stride, connect)] = 1
+    winner[has_line(boards[1], stride, connect)] = 2
+    winner[illegal] = -1
+    return winner
+
+def analyse_chunk(chunk, opening_plies=3):
+    games = load_chunk(*chunk)
+    stats = {
+        "games": 0, "moves": 0, "first_wins": 0, "second_wins": 0, "draws": 0,
+        "timeouts": 0, "mismatches": 0, "illegal": 0, "skipped": 0,
+        "lengths": Counter(), "openings": Counter(), "first_move_wins": Counter(),
+        "first_move_games": Counter(),
+    }
+
+    popout = (games["flags"] & FLAG_POPOUT) != 0
+    stats["skipped"] += int(popout.sum())
+    connect = games["flags"] >> CONNECT_SHIFT
+    connect[connect == 0] = 4
+    sizes = np.unique(np.stack([games["rows"], games["columns"], connect], axis=1)[~popout], axis=0)
+    for rows, columns, line in sizes:
+        rows, columns, line = int(rows), int(columns), int(line)
+        selected = (games["rows"] == rows) & (games["columns"] == columns) & (connect == line) & ~popout
+        if (rows + 1) * columns > 64 or rows < 1 or columns < 1:
+            stats["skipped"] += int(selected.sum())
+            continue
+
+        length = games["length"][selected]
+        first_player = games["first_player"][selected]
+        recorded = games["winner"][selected]
+        timeout = (games["flags"][selected] & FLAG_TIMEOUT) != 0
+        moves = games["moves"][selected]
+
+        replayed = replay(moves, length, first_player, rows, columns, line)
+        # forfeits end without a line, the log is trusted for those
+        stats["mismatches"] += int(((replayed != recorded) & ~timeout & (replayed >= 0)).sum())
+        stats["illegal"] += int((replayed < 0).sum())
+
+        first_won = recorded == first_player
+        stats["games"] += len(length)
+        stats["moves"] += int(length.sum())
+        stats["first_wins"] += int(first_won.sum())
+        stats["draws"] += int((recorded == 0).sum())
+        stats["second_wins"] += int(((recorded != 0) & ~first_won).sum())
+        stats["timeouts"] += int(timeout.sum())
+        stats["lengths"].update(dict(zip(*map(np.ndarray.tolist, np.unique(length, return_counts=True)))))
+
+        # openings as the first columns played, counted with one np.unique call
+        long_enough = length >= opening_plies
+        if opening_plies and long_enough.any():
+            prefix = moves[long_enough, :opening_plies].astype(np.int64)
+            codes = prefix @ (columns ** np.arange(opening_plies - 1, -1, -1))
+            codes, counts = np.unique(codes, return_counts=True)
+            for code, count in zip(codes.tolist(), counts.tolist()):
+                opening = []
+                for _ in range(opening_plies):
+                    code, col = divmod(code, columns)
+                    opening.append(col)
+                stats["openings"][tuple(reversed(opening))] += count
+
+        opened = length > 0
+        first = moves[opened, 0].astype(np.int64)
+        stats["first_move_games"].update(dict(enumerate(np.bincount(first, minlength=columns).tolist())))
+        stats["first_move_wins"].update(
+            dict(enumerate(np.bincount(first[first_won[opened]], minlength=columns).tolist())))
+    return stats
+
+def merge(total, stats):
+    for key, value in stats.items():
+        if key in total:
+            total[key] += value
+        else:
+            total[key] = value
+    return total
+
+def analyse(paths, chunk_size=100000, workers=None, opening_plies=3):
+    chunks = [chunk for path in paths for chunk in scan_chunks(path, chunk_size)]
+    total = {}
+    if workers == 0:
+        results = (analyse_chunk(chunk, opening_plies) for chunk in chunks)
+        for stats in results:
+            merge(total, stats)
+        return total, len(chunks)
+
+    with ProcessPoolExecutor(workers) as pool:
+        for stats in pool.map(analyse_chunk, chunks, [opening_plies] * len(chunks)):
+            merge(total, stats)
+    return total, len(chunks)
+
+def report(total, top=10):
+    games = max(total.get("games", 0), 1)
+    lengths = total.get("lengths", Counter())
+    print(f"games:            {total.get('games', 0)}")
+    print(f"average length:   {total.get('moves', 0) / games:.1f} moves")
+    if lengths:
+        print(f"shortest/longest: {min(lengths)} / {max(lengths)} moves")
+    print(f"first player:     {total.get('first_wins', 0) / games:.1%} wins")
+    print(f"second player:    {total.get('second_wins', 0) / games:.1%} wins")
+    print(f"draws:            {total.get('draws', 0) / games:.1%}")
+    print(f"timeouts:         {total.get('timeouts', 0)}")
+    print(f"replay mismatch:  {total.get('mismatches', 0)}, illegal games: {total.get('illegal', 0)}, "
+          f"not replayed: {total.get('skipped', 0)} (popout or large boards)")
+
+    print("first move win rate:")
+    played = total.get("first_move_games", Counter())
+    won = total.get("first_move_wins", Counter())
+    for col in sorted(played):
+        if played[col]:
+            print(f"  column {col}: {won[col] / played[col]:.1%} of {played[col]}")
+
+    print("most common openings:")
+    for opening, count in total.get("openings", Counter()).most_common(top):
+        print(f"  {' '.join(map(str, opening))}: {count} ({count / games:.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay game logs and report statistics")
+    parser.add_argument('paths', nargs='+', help="game logs written with --game-log")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="games per work unit")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes, 0 to run in this process")
+    parser.add_argument('--opening-plies', type=int, default=3,
+                        help="moves that make up an opening")
+    parser.add_argument('--top', type=int, default=10, help="openings to list")
+    parser.add_argument('--json', action='store_true', help="print the raw counts as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    total, chunks = analyse(args.paths, args.chunk_size, args.workers, args.opening_plies)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        total["openings"] = {" ".join(map(str, k)): v for k, v in total.get("openings", {}).items()}
+        print(json.dumps(total, sort_keys=True))
+        return
+    report(total, args.top)
+    print(f"analysed in {elapsed:.2f}s over {chunks} chunks "
+          f"({total.get('games', 0) / max(elapsed, 1e-9):.0f} games/s)")
+
+if __name__ == "__main__":
+    main()
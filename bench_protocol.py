@@ -0,0 +1,40 @@
+import argparse
+import time
+
+from protocol import CODECS
+
+# encodes and decodes a stream of moves with every codec and reports the
+# wire size and the cost per move
+def bench_codec(codec, moves, batch):
+    messages = [{"type": "move", "column": i % 7, "piece": i % 2 + 1} for i in range(moves)]
+
+    start = time.perf_counter()
+    frames = [codec.encode(message) for message in messages]
+    encode_time = time.perf_counter() - start
+
+    decoder = codec.decoder()
+    chunks = [b"".join(frames[i:i + batch]) for i in range(0, len(frames), batch)]
+    start = time.perf_counter()
+    decoded = 0
+    for chunk in chunks:
+        decoded += len(decoder.feed(chunk))
+    decode_time = time.perf_counter() - start
+
+    assert decoded == moves
+    return sum(len(frame) for frame in frames) / moves, encode_time, decode_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare wire codecs on move messages")
+    parser.add_argument('--moves', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=16,
+                        help="moves delivered per recv when decoding")
+    args = parser.parse_args()
+
+    print(f"{'codec':<8} {'bytes/move':>10} {'encode us':>10} {'decode us':>10}")
+    for name, codec in CODECS.items():
+        size, encode_time, decode_time = bench_codec(codec, args.moves, args.batch)
+        print(f"{name:<8} {size:>10.1f} {encode_time / args.moves * 1e6:>10.3f} "
+              f"{decode_time / args.moves * 1e6:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import socket
+import threading
+from collections import deque
+
+from logs import get_logger
+
+# outbound side of a connection: messages are queued per client and written by
+# a dedicated thread or task, so a slow peer never blocks the code broadcasting
+#
+# slow consumer policies, applied once a queue holds max_queue messages:
+#   disconnect: the client is dropped at once
+#   block: producers wait up to timeout for the queue to drain before reading
+#          more input, and the client is only dropped at twice max_queue or
+#          when the wait times out
+SLOW_CONSUMER_POLICIES = ("disconnect", "block")
+
+log = get_logger("broadcast")
+
+# non-blocking send flag for the fast path, platforms without it always queue
+DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+class ThreadedSender:
+    def __init__(self, conn, max_queue=256, policy="disconnect", timeout=5.0):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        self.conn = conn
+        self.addr = conn.getpeername()
+        self.max_queue = max_queue
+        self.policy = policy
+        self.timeout = timeout
+        self.limit = max_queue * 2 if policy == "block" else max_queue
+        self.queue = deque()
+        self.condition = threading.Condition()
+        # set while the writer thread is sending data it took off the queue
+        self.busy = False
+        self.writable = threading.Event()
+        self.writable.set()
+        self.closed = False
+        self.finishing = False
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, data):
+        with self.condition:
+            if self.closed:
+                return
+            # write straight through while the socket keeps up, queue only the backlog
+            if not self.queue and not self.busy and DONTWAIT:
+                try:
+                    sent = self.conn.send(data, DONTWAIT)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    self.close()
+                    return
+                if sent == len(data):
+                    return
+                data = data[sent:]
+
+            self.queue.append(data)
+            self.condition.notify()
+            if len(self.queue) >= self.max_queue:
+                self.writable.clear()
+                if self.policy == "disconnect" or len(self.queue) >= self.limit:
+                    log.warning("slow client dropped", addr=self.addr, reason="send queue full")
+                    self.close()
+
+    def wait_writable(self):
+        if not self.writable.wait(self.timeout):
+            log.warning("slow client dropped", addr=self.addr, reason="send queue did not drain in time")
+            self.close()
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    self.busy = False
+                    self.writable.set()
+                    while not self.queue and not self.closed and not self.finishing:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    if not self.queue:
+                        break
+                    # everything queued meanwhile goes out in one send
+                    data = b"".join(self.queue)
+                    self.queue.clear()
+                    self.busy = True
+                self.conn.sendall(data)
+        except OSError:
+            pass
+        self.close()
+
+    def finish(self):
+        # close the connection once everything queued has been written
+        with self.condition:
+            self.finishing = True
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.clear()
+            self.writable.set()
+            self.condition.notify()
+        # wakes up the thread reading from this client, which then cleans up
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class AsyncSender:
+    def __init__(self, writer, max_queue=256, policy="disconnect", timeout=5.0):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self.max_queue = max_queue
+        self.policy = policy
+        self.timeout = timeout
+        self.limit = max_queue * 2 if policy == "block" else max_queue
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.closed = False
+        self.finishing = False
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def send(self, data):
+        if self.closed:
+            return
+        # write straight through while the transport keeps up, queue only the backlog
+        transport = self.writer.transport
+        if not self.queue and transport.get_write_buffer_size() < transport.get_write_buffer_limits()[1]:
+            self.writer.write(data)
+            return
+        self.queue.append(data)
+        self.ready.set()
+        if len(self.queue) >= self.max_queue:
+            self.writable.clear()
+            if self.policy == "disconnect" or len(self.queue) >= self.limit:
+                log.warning("slow client dropped", addr=self.addr, reason="send queue full")
+                self.close()
+
+    async def wait_writable(self):
+        try:
+            await asyncio.wait_for(self.writable.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            log.warning("slow client dropped", addr=self.addr, reason="send queue did not drain in time")
+            self.close()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.queue:
+                    # everything queued meanwhile goes out in one write
+                    data = b"".join(self.queue)
+                    self.queue.clear()
+                    self.writer.write(data)
+                    await self.writer.drain()
+                    self.writable.set()
+                if self.finishing:
+                    self.closed = True
+                    self.writer.close()
+                    return
+        except (ConnectionError, OSError):
+            self.close()
+
+    def finish(self):
+        # close the connection once everything queued has been written
+        if not self.closed:
+            self.finishing = True
+            self.ready.set()
+
+    async def detach(self):
+        # stop sending and flush what is queued, leaving the connection open so
+        # another process can take it over; False if it could not be flushed
+        if self.closed:
+            return False
+        self.closed = True
+        self.task.cancel()
+        if self.queue:
+            self.writer.write(b"".join(self.queue))
+            self.queue.clear()
+        self.writer.transport.set_write_buffer_limits(0)
+        try:
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            self.writer.transport.abort()
+            return False
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.writable.set()
+        self.task.cancel()
+        # the reading side sees the connection drop and cleans up
+        self.writer.transport.abort()
@@ -1,11 +1,16 @@
-import numpy as np
 import pygame
 import sys
 import math
 import socket
-import json
 import threading
 import os
+import time
+import argparse
+from collections import deque
+
+from engine import Board
+from protocol import RECV_SIZE, CODECS, get_codec, hello_message
+from rules import POP, VARIANTS, rules_from_dict
 
 class Connect4Game:
     # color constants
@@ -15,23 +20,66 @@ class Connect4Game:
     YELLOW = (255,255,0)
     WHITE = (255,255,255)
     
-    # game constants
-    ROW_COUNT = 6
-    COLUMN_COUNT = 7
+    # game constants, the board size comes from the server
     SQUARESIZE = 100
+    # largest window side in pixels, big boards get smaller squares
+    MAX_WINDOW = 800
+    FPS = 30
+    RECONNECT_ATTEMPTS = 6
     
-    def __init__(self, host='localhost', port=5000):
+    def __init__(self, host='localhost', port=5000, codec='json', opponent='human',
+                 spectate=False, room=None, name=None, rules=None):
         # initialize network connection
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.codec = get_codec(codec)
+        self.decoder = self.codec.decoder()
+        self.pending_messages = []
+        self.address = (host, port)
+        self.token = None
+        # no data for this long means the server is gone, set from its heartbeat interval
+        self.server_timeout = None
+        self.send_lock = threading.Lock()
+        # messages sent while the connection is being resumed, None when connected
+        self.outbox = None
         try:
-            self.client.connect((host, port))
-            self.player_number = int(self.client.recv(1024).decode())
-            print(f"you are player {self.player_number}")
+            self.client.connect(self.address)
+            if spectate:
+                self.client.sendall(hello_message(self.codec.name, role="spectator", room=room))
+            else:
+                options = {"opponent": opponent}
+                if name:
+                    options["name"] = name
+                if rules:
+                    options["rules"] = rules
+                self.client.sendall(hello_message(self.codec.name, **options))
+            welcome = self.wait_for_message()
+            if welcome.get("type") == "queued":
+                print(f"waiting for an opponent near rating {welcome.get('rating')}...")
+                welcome = self.wait_for_message()
+            if welcome.get("type") != "welcome":
+                raise ConnectionError(f"server refused connection: {welcome.get('type')}")
+            self.player_number = welcome["player"]
+            self.token = welcome.get("token")
+            self.rules = rules_from_dict(welcome.get("rules"))
+            if welcome.get("heartbeat"):
+                self.server_timeout = welcome["heartbeat"] * 3
+                self.client.settimeout(self.server_timeout)
+            if "snapshot" in welcome:
+                # joined a game already in progress
+                self.pending_messages.insert(0, welcome["snapshot"])
+            if self.player_number:
+                print(f"you are player {self.player_number}, playing {self.rules}")
+            else:
+                print(f"you are watching, {self.rules}")
         except Exception as e:
             print(f"connection to server failed: {e}")
             sys.exit(1)
             
         # initialize game state
+        self.ROW_COUNT = self.rules.rows
+        self.COLUMN_COUNT = self.rules.columns
+        self.SQUARESIZE = min(self.SQUARESIZE, self.MAX_WINDOW // max(self.COLUMN_COUNT, self.ROW_COUNT + 1))
+        self.popout = self.rules.variant == "popout"
         self.board = self.create_board()
         self.game_over = False
         self.turn = 0
@@ -53,6 +101,18 @@ class Connect4Game:
         self.screen = pygame.display.set_mode((self.width, self.height))
         pygame.display.set_caption("Connect 4")
         self.myfont = pygame.font.SysFont("monospace", 75)
+        self.button_font = pygame.font.SysFont("monospace", 40)
+        self.text_cache = {}
+        self.board_surface = self.render_board_surface()
+        self.replay_button = pygame.Rect(self.width//2-150, self.height//2, 300, 60)
+        self.quit_button = pygame.Rect(self.width//2-150, self.height//2 + 100, 300, 60)
+        self.clock = pygame.time.Clock()
+        # drawing only marks what changed, the main loop updates the display once per frame
+        self.dirty_rects = []
+        self.full_redraw = False
+        
+        # the receive thread only decodes; messages are applied on the main thread
+        self.incoming = deque()
         
         # start receive thread
         self.receive_thread = threading.Thread(target=self.receive_data)
@@ -62,118 +122,145 @@ class Connect4Game:
         # draw initial board
         self.draw_board()
         
+    def send_message(self, message):
+        # the receive thread answers pings, keep whole messages on the wire
+        with self.send_lock:
+            if self.outbox is not None:
+                self.outbox.append(message)
+                return
+            try:
+                self.client.sendall(self.codec.encode(message))
+            except OSError as e:
+                if self.token is None:
+                    print(f"send failed: {e}")
+                    return
+                # the receive thread is about to resume the session, send it from there
+                self.outbox = [message]
+        
+    def recv_messages(self):
+        try:
+            data = self.client.recv(RECV_SIZE)
+        except socket.timeout:
+            raise ConnectionError("server stopped responding")
+        if not data:
+            raise ConnectionError("connection closed by server")
+        return self.decoder.feed(data)
+        
+    def wait_for_message(self):
+        while not self.pending_messages:
+            self.pending_messages.extend(self.recv_messages())
+        return self.pending_messages.pop(0)
+        
     def create_board(self):
-        return np.zeros((self.ROW_COUNT, self.COLUMN_COUNT))
+        return Board(self.ROW_COUNT, self.COLUMN_COUNT, self.rules.connect)
         
-    def drop_piece(self, row, col, piece):
-        self.board[row][col] = piece
+    def drop_piece(self, col, piece):
+        return self.board.drop_piece(col, piece)
         
     def is_valid_location(self, col):
-        return col >= 0 and col < self.COLUMN_COUNT and self.board[self.ROW_COUNT-1][col] == 0
+        return self.board.is_valid_location(col)
         
     def get_next_open_row(self, col):
-        for r in range(self.ROW_COUNT):
-            if self.board[r][col] == 0:
-                return r
-        return None
+        return self.board.get_next_open_row(col)
         
     def winning_move(self, piece):
-        # horizontal check
-        for c in range(self.COLUMN_COUNT-3):
-            for r in range(self.ROW_COUNT):
-                if (self.board[r][c] == piece and 
-                    self.board[r][c+1] == piece and 
-                    self.board[r][c+2] == piece and 
-                    self.board[r][c+3] == piece):
-                    return True
-
-        # vertical check
-        for c in range(self.COLUMN_COUNT):
-            for r in range(self.ROW_COUNT-3):
-                if (self.board[r][c] == piece and 
-                    self.board[r+1][c] == piece and 
-                    self.board[r+2][c] == piece and 
-                    self.board[r+3][c] == piece):
-                    return True
-
-        # positive diagonal check
-        for c in range(self.COLUMN_COUNT-3):
-            for r in range(self.ROW_COUNT-3):
-                if (self.board[r][c] == piece and 
-                    self.board[r+1][c+1] == piece and 
-                    self.board[r+2][c+2] == piece and 
-                    self.board[r+3][c+3] == piece):
-                    return True
-
-        # negative diagonal check
-        for c in range(self.COLUMN_COUNT-3):
-            for r in range(3, self.ROW_COUNT):
-                if (self.board[r][c] == piece and 
-                    self.board[r-1][c+1] == piece and 
-                    self.board[r-2][c+2] == piece and 
-                    self.board[r-3][c+3] == piece):
-                    return True
-                    
-        return False
+        return self.board.winning_move(piece)
         
-    def draw_board(self):
+    def can_pop(self, col, piece):
+        return (0 <= col < self.COLUMN_COUNT and self.board.heights[col] > 0
+                and self.board.get_piece(0, col) == piece)
+        
+    def pop_winner(self, piece):
+        # a pop can complete lines for both players, the one who popped wins ties
+        other = 2 if piece == 1 else 1
+        if self.winning_move(piece):
+            return piece
+        if self.winning_move(other):
+            return other
+        return None
+        
+    def render_text(self, font, text, color):
+        # text surfaces are rendered once and reused
+        key = (id(font), text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = self.text_cache[key] = font.render(text, 1, color)
+        return surface
+        
+    def render_board_surface(self):
+        # the blue grid with its holes never changes, so it is drawn only once
+        surface = pygame.Surface((self.width, self.ROW_COUNT * self.SQUARESIZE))
+        surface.fill(self.BLUE)
         for c in range(self.COLUMN_COUNT):
             for r in range(self.ROW_COUNT):
-                pygame.draw.rect(self.screen, self.BLUE, 
-                               (c*self.SQUARESIZE, r*self.SQUARESIZE+self.SQUARESIZE, 
-                                self.SQUARESIZE, self.SQUARESIZE))
-                pygame.draw.circle(self.screen, self.BLACK,
+                pygame.draw.circle(surface, self.BLACK,
                                  (int(c*self.SQUARESIZE+self.SQUARESIZE/2), 
-                                  int(r*self.SQUARESIZE+self.SQUARESIZE+self.SQUARESIZE/2)), 
+                                  int(r*self.SQUARESIZE+self.SQUARESIZE/2)), 
                                  self.RADIUS)
+        return surface
+        
+    def piece_color(self, piece):
+        return self.RED if piece == 1 else self.YELLOW
+        
+    def cell_center(self, row, col):
+        return (int(col*self.SQUARESIZE+self.SQUARESIZE/2), 
+                self.height-int(row*self.SQUARESIZE+self.SQUARESIZE/2))
+        
+    def draw_board(self):
+        # full redraw, only needed when the whole window changes
+        self.screen.fill(self.BLACK, (0, 0, self.width, self.SQUARESIZE))
+        self.screen.blit(self.board_surface, (0, self.SQUARESIZE))
         
         for c in range(self.COLUMN_COUNT):
             for r in range(self.ROW_COUNT):        
-                if self.board[r][c] == 1:
-                    pygame.draw.circle(self.screen, self.RED,
-                                     (int(c*self.SQUARESIZE+self.SQUARESIZE/2), 
-                                      self.height-int(r*self.SQUARESIZE+self.SQUARESIZE/2)), 
-                                     self.RADIUS)
-                elif self.board[r][c] == 2: 
-                    pygame.draw.circle(self.screen, self.YELLOW,
-                                     (int(c*self.SQUARESIZE+self.SQUARESIZE/2), 
-                                      self.height-int(r*self.SQUARESIZE+self.SQUARESIZE/2)), 
-                                     self.RADIUS)
-        pygame.display.update()
+                piece = self.board.get_piece(r, c)
+                if piece:
+                    pygame.draw.circle(self.screen, self.piece_color(piece),
+                                     self.cell_center(r, c), self.RADIUS)
+        self.full_redraw = True
+        
+    def draw_piece(self, row, col, piece):
+        # a move only changes one cell, so only that cell goes to the display
+        rect = pygame.draw.circle(self.screen, self.piece_color(piece),
+                                self.cell_center(row, col), self.RADIUS)
+        self.dirty_rects.append(rect)
+        
+    def draw_hover(self, posx):
+        strip = pygame.Rect(0, 0, self.width, self.SQUARESIZE)
+        self.screen.fill(self.BLACK, strip)
+        pygame.draw.circle(self.screen, self.piece_color(self.player_number),
+                         (posx, int(self.SQUARESIZE/2)), self.RADIUS)
+        self.dirty_rects.append(strip)
         
     def draw_end_screen(self):
         self.screen.fill(self.BLACK)
         
         if self.winner is None:
-            winner_text = self.myfont.render("Game Over!", 1, self.WHITE)
+            winner_text = self.render_text(self.myfont, "Game Over!", self.WHITE)
         else:
-            winner_text = self.myfont.render(f"Player {self.winner} wins!", 1, 
-                                           self.RED if self.winner == 1 else self.YELLOW)
+            winner_text = self.render_text(self.myfont, f"Player {self.winner} wins!", 
+                                         self.piece_color(self.winner))
         
         text_rect = winner_text.get_rect(center=(self.width//2, self.height//4))
         self.screen.blit(winner_text, text_rect)
         
-        button_font = pygame.font.SysFont("monospace", 40)
-        
-        replay_button = pygame.draw.rect(self.screen, (0,255,0), 
-                                       (self.width//2-150, self.height//2, 300, 60))
-        replay_text = button_font.render("Play Again", 1, self.BLACK)
-        replay_rect = replay_text.get_rect(center=(self.width//2, self.height//2 + 30))
+        pygame.draw.rect(self.screen, (0,255,0), self.replay_button)
+        replay_text = self.render_text(self.button_font, "Play Again", self.BLACK)
+        replay_rect = replay_text.get_rect(center=self.replay_button.center)
         self.screen.blit(replay_text, replay_rect)
         
-        quit_button = pygame.draw.rect(self.screen, (255,0,0),
-                                     (self.width//2-150, self.height//2 + 100, 300, 60))
-        quit_text = button_font.render("Quit Game", 1, self.BLACK)
-        quit_rect = quit_text.get_rect(center=(self.width//2, self.height//2 + 130))
+        pygame.draw.rect(self.screen, (255,0,0), self.quit_button)
+        quit_text = self.render_text(self.button_font, "Quit Game", self.BLACK)
+        quit_rect = quit_text.get_rect(center=self.quit_button.center)
         self.screen.blit(quit_text, quit_rect)
         
         if self.restart_status == self.RESTART_YES:
-            waiting_text = button_font.render("Waiting for other player...", 1, self.WHITE)
+            waiting_text = self.render_text(self.button_font, "Waiting for other player...", self.WHITE)
             waiting_rect = waiting_text.get_rect(center=(self.width//2, self.height*3//4))
             self.screen.blit(waiting_text, waiting_rect)
         
-        pygame.display.update()
-        return replay_button, quit_button
+        self.full_redraw = True
+        return self.replay_button, self.quit_button
         
     def reset_game(self):
         self.board = self.create_board()
@@ -183,46 +270,96 @@ class Connect4Game:
         self.restart_status = self.RESTART_WAIT
         self.my_turn = self.player_number == 1
         print(f"reset game: turn={self.turn}, my_turn={self.my_turn}, player_number={self.player_number}")
-        self.screen.fill(self.BLACK)
         self.draw_board()
-        pygame.display.update()
         
         reset_confirm = {
             "type": "reset_confirm",
             "player": self.player_number
         }
-        self.client.send(json.dumps(reset_confirm).encode() + b"\n")
+        self.send_message(reset_confirm)
         
     def cleanup(self):
         pygame.quit()
         self.client.close()
         sys.exit()
         
+    def flush_display(self):
+        if self.full_redraw:
+            pygame.display.update()
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+        self.full_redraw = False
+        self.dirty_rects = []
+        
     def receive_data(self):
-        buffer = ""
+        # runs on its own thread: decode and queue, never touch the game or pygame here
+        messages, self.pending_messages = self.pending_messages, []
         while True:
             try:
-                data = self.client.recv(1024).decode()
-                if not data:
-                    break
-                    
-                buffer += data
-                messages = buffer.split("\n")
-                buffer = messages[-1]
-                
-                for msg in messages[:-1]:
-                    if not msg.strip():
-                        continue
-                    try:
-                        message = json.loads(msg)
-                        self.handle_message(message)
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}, data: {msg}")
+                for message in messages:
+                    if message.get("type") == "ping":
+                        self.send_message({"type": "pong"})
+                    elif message.get("type") != "pong":
+                        self.incoming.append(message)
+                messages = self.recv_messages()
                         
+            except ConnectionError:
+                if self.token is None or not self.reconnect():
+                    break
+                messages, self.pending_messages = self.pending_messages, []
             except Exception as e:
                 print(f"receive data error: {e}")
                 break
                 
+    def reconnect(self):
+        # the server keeps our seat for a while, come back with the session token
+        with self.send_lock:
+            if self.outbox is None:
+                self.outbox = []
+        delay = 0.5
+        for attempt in range(self.RECONNECT_ATTEMPTS):
+            time.sleep(delay)
+            delay = min(delay * 2, 8)
+            try:
+                self.client.close()
+                self.client = socket.create_connection(self.address, self.server_timeout)
+                self.decoder = self.codec.decoder()
+                self.client.sendall(hello_message(self.codec.name, resume=self.token))
+                welcome = self.wait_for_message()
+            except OSError as e:
+                print(f"reconnect attempt {attempt + 1} failed: {e}")
+                continue
+            if welcome.get("type") != "welcome":
+                print(f"could not resume the game: {welcome.get('reason', welcome.get('type'))}")
+                return False
+            print("reconnected to server")
+            self.flush_outbox(welcome["snapshot"])
+            return True
+        with self.send_lock:
+            self.outbox = None
+        return False
+        
+    def flush_outbox(self, snapshot):
+        with self.send_lock:
+            self.incoming.append(snapshot)
+            while self.outbox:
+                message = self.outbox[0]
+                try:
+                    self.client.sendall(self.codec.encode(message))
+                except OSError:
+                    # dropped again, the rest goes out after the next resume
+                    return
+                self.outbox.pop(0)
+                if message.get("type") == "move":
+                    # already on our board, but the snapshot replaces the board without it
+                    self.incoming.append(dict(message, piece=self.player_number))
+            self.outbox = None
+                
+    def process_messages(self):
+        # apply every message that arrived since the last frame in one batch
+        while self.incoming:
+            self.handle_message(self.incoming.popleft())
+            
     def handle_message(self, message):
         msg_type = message.get("type")
         
@@ -249,13 +386,79 @@ class Connect4Game:
                 self.restart_status = "QUIT"
                 self.cleanup()
                 
+        elif msg_type == "snapshot":
+            self.handle_snapshot(message)
+            
+        elif msg_type == "room_closed":
+            if message.get("reason") == "opponent_left":
+                print("your opponent left, the room is closed")
+            else:
+                print("the game you were watching has ended")
+            self.restart_status = "QUIT"
+            
+        elif msg_type == "game_over":
+            # the server decides the result, a winner of 0 means a draw
+            self.game_over = True
+            self.winner = message.get("winner") or None
+            if message.get("reason") == "timeout":
+                print("game over: out of time")
+            self.draw_end_screen()
+            
+        elif msg_type == "invalid_move":
+            print(f"server rejected move in column {message.get('column')}: {message.get('reason')}")
+            
+        elif msg_type == "opponent_disconnected":
+            print("opponent lost connection, waiting for them to come back")
+            
+        elif msg_type == "opponent_reconnected":
+            print("opponent is back")
+            
+        elif msg_type == "opponent_left":
+            print("opponent did not come back")
+            
+        elif msg_type == "server_shutdown":
+            print("server is shutting down")
+            self.restart_status = "QUIT"
+                
+    def handle_snapshot(self, message):
+        # spectators and resumed players catch up by replaying the moves of the game in progress
+        self.board = self.create_board()
+        piece = message.get("first_player", 1)
+        for move in message.get("moves", []):
+            if move & POP:
+                self.board.pop_piece(move & ~POP)
+            else:
+                self.drop_piece(move, piece)
+            piece = 2 if piece == 1 else 1
+        self.turn = message.get("turn", 1) - 1
+        
+        winner = message.get("winner")
+        if winner is not None:
+            self.game_over = True
+            self.winner = winner or None
+            self.draw_end_screen()
+        else:
+            self.game_over = False
+            self.winner = None
+            self.my_turn = message.get("turn") == self.player_number
+            self.draw_board()
+            
     def handle_move_message(self, message):
         col = message.get('column')
         piece = message.get('piece')
-        if col is not None and piece is not None:
+        if message.get('pop') and col is not None and self.can_pop(col, piece):
+            self.board.pop_piece(col)
+            self.winner = self.pop_winner(piece)
+            if self.winner is not None:
+                self.game_over = True
+                self.draw_end_screen()
+            else:
+                self.turn = 1 if piece == 1 else 0
+                self.my_turn = self.turn == (self.player_number - 1)
+                self.draw_board()
+        elif col is not None and piece is not None:
             if self.is_valid_location(col):
-                row = self.get_next_open_row(col)
-                self.drop_piece(row, col, piece)
+                row = self.drop_piece(col, piece)
                 
                 if self.winning_move(piece):
                     self.game_over = True
@@ -264,7 +467,7 @@ class Connect4Game:
                 else:
                     self.turn = 1 if piece == 1 else 0
                     self.my_turn = self.turn == (self.player_number - 1)
-                    self.draw_board()
+                    self.draw_piece(row, col, piece)
                 
                 print(f"update turn: turn={self.turn}, my_turn={self.my_turn}, player_number={self.player_number}")
                 
@@ -276,16 +479,26 @@ class Connect4Game:
                 elif self.restart_status == "QUIT":
                     self.cleanup()
                     
+                self.process_messages()
+                
+                # only the last mouse motion of a frame is worth drawing
+                last_motion = None
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
                         self.cleanup()
-                        
-                    if not self.game_over:
+                    
+                    if event.type == pygame.MOUSEMOTION:
+                        last_motion = event
+                    elif not self.game_over:
                         self.handle_game_events(event)
                     else:
                         self.handle_end_game_events(event)
                         
-                pygame.time.wait(50)
+                if last_motion is not None and not self.game_over:
+                    self.handle_game_events(last_motion)
+                    
+                self.flush_display()
+                self.clock.tick(self.FPS)
                 
             except pygame.error:
                 print("Pygame error occurred, attempting to reinitialize...")
@@ -301,41 +514,49 @@ class Connect4Game:
                 
     def handle_game_events(self, event):
         if event.type == pygame.MOUSEMOTION and self.my_turn:
-            pygame.draw.rect(self.screen, self.BLACK, (0,0, self.width, self.SQUARESIZE))
-            posx = event.pos[0]
-            pygame.draw.circle(self.screen, self.RED if self.player_number == 1 else self.YELLOW,
-                             (posx, int(self.SQUARESIZE/2)), self.RADIUS)
-            pygame.display.update()
+            self.draw_hover(event.pos[0])
             
         elif event.type == pygame.MOUSEBUTTONDOWN and self.my_turn:
             posx = event.pos[0]
             col = int(math.floor(posx/self.SQUARESIZE))
             
-            if self.is_valid_location(col):
-                row = self.get_next_open_row(col)
-                if row is not None:
-                    self.drop_piece(row, col, self.player_number)
-                    
-                    move_data = {
-                        'type': 'move',
-                        'column': col,
-                        'piece': self.player_number
-                    }
-                    self.client.send(json.dumps(move_data).encode() + b"\n")
-                    
-                    if self.winning_move(self.player_number):
+            if event.button == 3 and self.popout:
+                # right click pops our own piece out of the bottom of the column
+                if self.can_pop(col, self.player_number):
+                    self.board.pop_piece(col)
+                    self.send_message({'type': 'move', 'column': col, 'pop': True})
+                    self.winner = self.pop_winner(self.player_number)
+                    if self.winner is not None:
                         self.game_over = True
-                        self.winner = self.player_number
                         self.draw_end_screen()
                     else:
                         self.turn = 1 if self.player_number == 1 else 0
                         self.my_turn = self.turn == (self.player_number - 1)
                         self.draw_board()
-                        
-                    print(f"after move: now is player {self.turn + 1}'s turn, I am player {self.player_number}")
+            elif self.is_valid_location(col):
+                row = self.drop_piece(col, self.player_number)
+                
+                move_data = {
+                    'type': 'move',
+                    'column': col,
+                    'piece': self.player_number
+                }
+                self.send_message(move_data)
+                
+                if self.winning_move(self.player_number):
+                    self.game_over = True
+                    self.winner = self.player_number
+                    self.draw_end_screen()
+                else:
+                    self.turn = 1 if self.player_number == 1 else 0
+                    self.my_turn = self.turn == (self.player_number - 1)
+                    self.draw_piece(row, col, self.player_number)
                     
+                print(f"after move: now is player {self.turn + 1}'s turn, I am player {self.player_number}")
+                
     def handle_end_game_events(self, event):
-        replay_button, quit_button = self.draw_end_screen()
+        # the end screen is drawn when the game ends or the vote changes, not per event
+        replay_button, quit_button = self.replay_button, self.quit_button
         
         if event.type == pygame.MOUSEBUTTONDOWN and self.restart_status != self.RESTART_YES:
             mouse_pos = event.pos
@@ -345,7 +566,7 @@ class Connect4Game:
                     "type": "restart",
                     "vote": "YES"
                 }
-                self.client.send(json.dumps(restart_message).encode())
+                self.send_message(restart_message)
                 self.restart_status = self.RESTART_YES
                 self.draw_end_screen()
                 
@@ -354,11 +575,39 @@ class Connect4Game:
                     "type": "restart",
                     "vote": "NO"
                 }
-                self.client.send(json.dumps(quit_message).encode())
+                self.send_message(quit_message)
                 self.cleanup()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Connect 4 client")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json',
+                        help="wire format negotiated with the server")
+    parser.add_argument('--opponent', choices=['human', 'ai'], default='human',
+                        help="play against another player or the server's AI")
+    parser.add_argument('--spectate', action='store_true',
+                        help="watch a game instead of playing (async server)")
+    parser.add_argument('--room', type=int, default=None,
+                        help="room to watch, defaults to the oldest game in progress")
+    parser.add_argument('--name', default=None,
+                        help="player name, the async server keeps a rating per name")
+    parser.add_argument('--rows', type=int, default=None, help="board height to ask the server for")
+    parser.add_argument('--columns', type=int, default=None, help="board width to ask the server for")
+    parser.add_argument('--connect', type=int, default=None, help="pieces in a row that win")
+    parser.add_argument('--variant', choices=VARIANTS, default=None,
+                        help="popout lets players pop their own bottom pieces with a right click")
+    return parser.parse_args(argv)
+
+def requested_rules(args):
+    # only what was asked for, the server fills in the rest from its own defaults
+    rules = {field: getattr(args, field) for field in ("rows", "columns", "connect", "variant")}
+    return {field: value for field, value in rules.items() if value is not None} or None
+
 def main():
-    game = Connect4Game()
+    args = parse_args()
+    game = Connect4Game(args.host, args.port, args.codec, args.opponent,
+                        args.spectate, args.room, args.name, requested_rules(args))
     try:
         game.run()
     except KeyboardInterrupt:
@@ -0,0 +1,221 @@
+from rules import POP, column_lines, get_rules, win_lines
+
+# bitboard connect 4 engine, shared by the client and the server
+#
+# every column uses rows + 1 bits, bottom row first; the extra bit on top of
+# each column stays empty so shifted lines never wrap into the next column
+
+class Board:
+    def __init__(self, rows=6, columns=7, connect=4):
+        if rows < 1 or columns < 1:
+            raise ValueError(f"invalid board size: {rows}x{columns}")
+        self.rows = rows
+        self.columns = columns
+        self.connect = connect
+        self.stride = rows + 1
+        # win line masks through each cell and across each column, shared by
+        # every board of this size
+        self.lines = win_lines(rows, columns, connect)
+        self.column_lines = column_lines(rows, columns, connect)
+
+        # one bitboard per piece, index 0 is unused so pieces 1 and 2 index directly
+        self.bitboards = [0, 0, 0]
+        self.heights = [0] * columns
+        self.moves = 0
+
+        # directions: vertical, horizontal, diagonal /, diagonal \
+        self.directions = (1, self.stride, self.stride + 1, self.stride - 1)
+        self.bottom = sum(1 << (col * self.stride) for col in range(columns))
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.rows = self.rows
+        board.columns = self.columns
+        board.connect = self.connect
+        board.stride = self.stride
+        board.lines = self.lines
+        board.column_lines = self.column_lines
+        board.bitboards = self.bitboards[:]
+        board.heights = self.heights[:]
+        board.moves = self.moves
+        board.directions = self.directions
+        board.bottom = self.bottom
+        return board
+
+    def __getstate__(self):
+        # the line tables are rebuilt from the cache, not pickled with every bot search
+        state = self.__dict__.copy()
+        del state["lines"], state["column_lines"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lines = win_lines(self.rows, self.columns, self.connect)
+        self.column_lines = column_lines(self.rows, self.columns, self.connect)
+
+    def is_valid_location(self, col):
+        return 0 <= col < self.columns and self.heights[col] < self.rows
+
+    def get_next_open_row(self, col):
+        row = self.heights[col]
+        return row if row < self.rows else None
+
+    def drop_piece(self, col, piece):
+        row = self.heights[col]
+        self.bitboards[piece] |= 1 << (col * self.stride + row)
+        self.heights[col] = row + 1
+        self.moves += 1
+        return row
+
+    def pop_piece(self, col):
+        # takes the bottom piece out of col, everything above falls one row
+        mask = ((1 << self.rows) - 1) << (col * self.stride)
+        for piece in (1, 2):
+            bitboard = self.bitboards[piece]
+            self.bitboards[piece] = (bitboard & ~mask) | ((bitboard & mask) >> 1 & mask)
+        self.heights[col] -= 1
+        self.moves -= 1
+
+    def undo_piece(self, col, piece):
+        row = self.heights[col] - 1
+        self.bitboards[piece] &= ~(1 << (col * self.stride + row))
+        self.heights[col] = row
+        self.moves -= 1
+
+    def get_piece(self, row, col):
+        bit = 1 << (col * self.stride + row)
+        if self.bitboards[1] & bit:
+            return 1
+        if self.bitboards[2] & bit:
+            return 2
+        return 0
+
+    def winning_move(self, piece):
+        # any line on the board: runs double in length until they reach connect
+        bitboard = self.bitboards[piece]
+        for shift in self.directions:
+            runs = bitboard
+            length = 1
+            while length * 2 <= self.connect:
+                runs &= runs >> (length * shift)
+                length *= 2
+            if length < self.connect:
+                runs &= runs >> ((self.connect - length) * shift)
+            if runs:
+                return True
+        return False
+
+    def wins_at(self, row, col, piece):
+        # only the lines through one cell, enough right after a piece landed there
+        bitboard = self.bitboards[piece]
+        for line in self.lines[col * self.stride + row]:
+            if bitboard & line == line:
+                return True
+        return False
+
+    def wins_across(self, col, piece):
+        # the lines through a column, after a pop moved all of it
+        bitboard = self.bitboards[piece]
+        for line in self.column_lines[col]:
+            if bitboard & line == line:
+                return True
+        return False
+
+    def key(self, piece):
+        # unique position key from the point of view of piece, the side to move:
+        # its stones plus the occupied cells plus the bottom row
+        return self.bitboards[piece] + (self.bitboards[1] | self.bitboards[2]) + self.bottom
+
+    def is_full(self):
+        return self.moves == self.rows * self.columns
+
+    def valid_moves(self):
+        return [col for col in range(self.columns) if self.heights[col] < self.rows]
+
+    def to_rows(self):
+        # row 0 is the bottom row, like the original numpy board
+        return [[self.get_piece(r, c) for c in range(self.columns)] for r in range(self.rows)]
+
+class InvalidMove(ValueError):
+    pass
+
+# one game on top of a board: whose turn it is and how the game ended
+class Game:
+    def __init__(self, rows=6, columns=7, first_player=1, rules=None):
+        self.rules = rules or get_rules(rows, columns)
+        self.board = Board(self.rules.rows, self.rules.columns, self.rules.connect)
+        self.popout = self.rules.variant == "popout"
+        self.first_player = first_player
+        self.turn = first_player
+        self.over = False
+        # piece that won, 0 for a draw, None while the game is running
+        self.winner = None
+        # columns played so far, pieces alternate starting with first_player.
+        # pops are recorded as the column with the POP bit set
+        self.moves = []
+        # popout only: how often each position was seen, the third time is a draw
+        self.seen = {}
+
+    def play(self, col, piece, pop=False):
+        if self.over:
+            raise InvalidMove("game is over")
+        if piece != self.turn:
+            raise InvalidMove("not your turn")
+        if type(col) is not int or not 0 <= col < self.board.columns:
+            raise InvalidMove(f"illegal column: {col!r}")
+        other = 2 if piece == 1 else 1
+
+        if pop:
+            if not self.popout:
+                raise InvalidMove("pops are only allowed in popout")
+            if not self.can_pop(col, piece):
+                raise InvalidMove(f"no piece of yours to pop in column {col}")
+            self.board.pop_piece(col)
+            self.moves.append(POP | col)
+            row = 0
+            # a pop can complete lines for both players, the popper wins ties
+            if self.board.wins_across(col, piece):
+                return self.end(row, piece)
+            if self.board.wins_across(col, other):
+                return self.end(row, other)
+        else:
+            if not self.board.is_valid_location(col):
+                raise InvalidMove(f"illegal column: {col!r}")
+            row = self.board.drop_piece(col, piece)
+            self.moves.append(col)
+            if self.board.wins_at(row, col, piece):
+                return self.end(row, piece)
+            if self.board.is_full() and not self.popout:
+                return self.end(row, 0)
+
+        self.turn = other
+        if self.popout and (self.repeated() or not self.has_move(other)):
+            return self.end(row, 0)
+        return row
+
+    def replay(self, move):
+        # plays a move as recorded in moves
+        return self.play(move & ~POP, self.turn, pop=bool(move & POP))
+
+    def end(self, row, winner):
+        self.over = True
+        self.winner = winner
+        return row
+
+    def can_pop(self, col, piece):
+        return self.board.heights[col] > 0 and self.board.get_piece(0, col) == piece
+
+    def has_move(self, piece):
+        return (any(self.board.is_valid_location(col) for col in range(self.board.columns))
+                or any(self.can_pop(col, piece) for col in range(self.board.columns)))
+
+    def repeated(self):
+        position = (self.board.bitboards[1], self.board.bitboards[2], self.turn)
+        self.seen[position] = self.seen.get(position, 0) + 1
+        return self.seen[position] >= 3
+
+    def forfeit(self, piece):
+        if self.over:
+            raise InvalidMove("game is over")
+        self.over = True
+        self.winner = 2 if piece == 1 else 1
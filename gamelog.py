@@ -0,0 +1,225 @@
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+from logs import get_logger
+
+# finished games, appended to a binary log
+#
+# the file starts with a header, then one record per game: a fixed size part
+# (end time, room, board size, first player, winner, flags, move count)
+# followed by one byte per move, the column played with POP set for a pop in
+# popout. the flags also hold the line length, 0 for connect 4. records are only ever
+# appended. a record cut short by a crash is ignored by the readers and cut
+# off by the next writer before it appends.
+#
+# the server hands records to a writer thread, which writes them in batches so
+# no file I/O happens on the network path.
+
+MAGIC = b"C4GL"
+VERSION = 1
+HEADER = struct.Struct("<4sH")
+RECORD = struct.Struct("<IIBBBBBH")
+# record flags, the line length goes in the bits above them. FLAG_TIMEOUT marks
+# a forfeit, on time or by a player who left
+FLAG_TIMEOUT = 1
+FLAG_POPOUT = 2
+CONNECT_SHIFT = 2
+
+# none: leave flushing to the OS, batch: fsync after every batch written
+FSYNC_POLICIES = ("none", "batch")
+
+log = get_logger("gamelog")
+
+GameRecord = namedtuple("GameRecord", "ended_at room rows columns first_player winner flags moves")
+
+def encode_game(game, room=0, flags=0, ended_at=None):
+    if ended_at is None:
+        ended_at = int(time.time())
+    board = game.board
+    if game.popout:
+        flags |= FLAG_POPOUT
+    if board.connect != 4:
+        flags |= board.connect << CONNECT_SHIFT
+    return RECORD.pack(ended_at, room, board.rows, board.columns, game.first_player,
+                       game.winner or 0, flags, len(game.moves)) + bytes(game.moves)
+
+def record_connect(flags):
+    return flags >> CONNECT_SHIFT or 4
+
+def parse_records(data, offset):
+    # yields (record, next offset) for every complete record from offset on
+    while offset + RECORD.size <= len(data):
+        fields = RECORD.unpack_from(data, offset)
+        end = offset + RECORD.size + fields[-1]
+        if end > len(data):
+            return
+        yield GameRecord(*fields[:-1], bytes(data[offset + RECORD.size:end])), end
+        offset = end
+
+def check_header(data, path):
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a game log")
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a game log")
+
+def complete_length(file, path):
+    # length of the log up to the end of its last complete record
+    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        check_header(data, path)
+        end = HEADER.size
+        for _, end in parse_records(data, HEADER.size):
+            pass
+        return end
+    finally:
+        data.close()
+
+class GameLogWriter:
+    def __init__(self, path, batch_size=256, flush_interval=1.0, fsync="none"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+            self.file.flush()
+        else:
+            self.file = open(path, "r+b")
+            # a record cut short by a crash would shift every record written after it
+            try:
+                end = complete_length(self.file, path)
+            except ValueError:
+                self.file.close()
+                raise
+            self.file.truncate(end)
+            self.file.seek(end)
+
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.written = 0
+        self.thread = threading.Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, game, room=0, flags=0):
+        # called on the network path, only encodes and queues
+        record = encode_game(game, room, flags)
+        with self.condition:
+            if self.closed:
+                return
+            self.queue.append(record)
+            if len(self.queue) >= self.batch_size:
+                self.condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                if not self.queue and not self.closed:
+                    self.condition.wait(self.flush_interval)
+                if not self.queue:
+                    if self.closed:
+                        return
+                    continue
+                batch = list(self.queue)
+                self.queue.clear()
+
+            try:
+                self.file.write(b"".join(batch))
+                self.file.flush()
+                if self.fsync == "batch":
+                    os.fsync(self.file.fileno())
+                self.written += len(batch)
+            except OSError as e:
+                log.error("game log write failed", path=self.path, error=e)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        self.file.close()
+
+class GameLogReader:
+    # memory maps the log, for random access and repeated passes over large logs
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            check_header(self.data, path)
+        except ValueError:
+            self.data.close()
+            raise
+
+    def __iter__(self):
+        for record, _ in parse_records(self.data, HEADER.size):
+            yield record
+
+    def offsets(self):
+        # byte offset of every record, to jump straight to a game later
+        offset = HEADER.size
+        for _, end in parse_records(self.data, HEADER.size):
+            yield offset
+            offset = end
+
+    def record_at(self, offset):
+        for record, _ in parse_records(self.data, offset):
+            return record
+        return None
+
+    def close(self):
+        self.data.close()
+
+def stream_games(path, chunk_size=1 << 16):
+    # reads the log in chunks, for logs still being written or too big to map
+    with open(path, "rb") as f:
+        check_header(f.read(HEADER.size), path)
+        buffer = b""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            offset = 0
+            for record, offset in parse_records(buffer, 0):
+                yield record
+            buffer = buffer[offset:]
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a game log written by the server")
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    games = moves = timeouts = 0
+    wins = {0: 0, 1: 0, 2: 0}
+    reader = GameLogReader(args.path)
+    for record in reader:
+        games += 1
+        moves += len(record.moves)
+        timeouts += record.flags & FLAG_TIMEOUT
+        # count wins by who moved first rather than by player number
+        if record.winner == 0:
+            wins[0] += 1
+        else:
+            wins[1 if record.winner == record.first_player else 2] += 1
+    reader.close()
+
+    print(f"games:          {games}")
+    print(f"moves:          {moves} ({moves / max(games, 1):.1f} per game)")
+    print(f"first mover:    {wins[1]} wins, {wins[2]} losses, {wins[0]} draws")
+    print(f"timeouts:       {timeouts}")
+    print(f"file size:      {os.path.getsize(args.path)} bytes")
+
+if __name__ == "__main__":
+    main()
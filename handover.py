@@ -0,0 +1,58 @@
+import os
+import socket
+
+from protocol import decode_message, encode_message
+
+# hot restart of the async server. the running server listens on a unix
+# socket; a new server started with the same --restart-socket connects to it
+# and gets the listening socket, every client connection and the state of
+# every room, so live games carry on in the new process and clients never
+# notice. the transfer is a series of messages on a SOCK_SEQPACKET socket, each
+# one JSON object with the descriptors it refers to attached (SCM_RIGHTS),
+# ending with a done message.
+
+# descriptors per message, the kernel refuses more than 253
+MAX_FDS = 200
+# seconds the new process waits for each part, the old one flushes every
+# client first
+RECEIVE_TIMEOUT = 60.0
+# seqpacket messages are read whole, large enough for a room with its spectators
+MAX_PART = 1 << 20
+
+def listen(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    sock.bind(path)
+    sock.listen(1)
+    sock.setblocking(False)
+    return sock
+
+def connect(path):
+    # the channel to the server currently running, None if there is none
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+def send_part(channel, message, fds=()):
+    socket.send_fds(channel, [encode_message(message)], list(fds))
+
+def receive_parts(channel):
+    # yields (message, sockets) until the old server is done
+    channel.settimeout(RECEIVE_TIMEOUT)
+    while True:
+        data, fds, _, _ = socket.recv_fds(channel, MAX_PART, MAX_FDS)
+        if not data:
+            raise ConnectionError("old server closed the channel before it was done")
+        message = decode_message(data)
+        if message.get("type") == "done":
+            return
+        yield message, [socket.socket(fileno=fd) for fd in fds]
+
+def chunks(items, size=MAX_FDS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,167 @@
+import os
+import selectors
+import signal
+import socket
+
+from logs import get_logger, setup_logging, stop_logging
+from protocol import RECV_SIZE, decode_message, encode_message
+from server import build_parser, make_async_server, open_game_log, serve_stats
+
+# runs one async server per core. the workers accept on the same port, with
+# SO_REUSEPORT where the platform has it or else a listening socket shared
+# before the fork. a room lives on the worker that created it.
+#
+# this process is the coordinator. each worker has a unix socket pair to it,
+# and a connection that belongs elsewhere is passed over it as a file
+# descriptor (SCM_RIGHTS):
+#   seek:     a player needs an opponent and nobody waits on its worker, it is
+#             sent to the worker holding a waiting room for the same rules or
+#             back to its own
+#   route:    a spectator or resumed player whose room is on another worker
+#   hosting / unhosted: a worker opened or closed its waiting room for a set of rules
+
+log = get_logger("launcher")
+
+def rules_key(message):
+    # rules travel as Rules.key(), a list once encoded
+    return tuple(message.get("rules") or ())
+
+class Coordinator:
+    def __init__(self, channels):
+        self.channels = channels
+        # per set of rules, the worker with a player waiting for an opponent
+        self.holders = {}
+        self.live = len(channels)
+        self.selector = selectors.DefaultSelector()
+        for worker, channel in enumerate(channels):
+            self.selector.register(channel, selectors.EVENT_READ, worker)
+
+    def run(self):
+        while self.live:
+            for key, _ in self.selector.select():
+                worker = key.data
+                try:
+                    data, fds, _, _ = socket.recv_fds(key.fileobj, RECV_SIZE, 1)
+                except OSError as e:
+                    log.error("worker channel error", worker=worker, error=e)
+                    data, fds = b"", []
+                if not data:
+                    log.warning("worker is gone", worker=worker)
+                    self.selector.unregister(key.fileobj)
+                    self.live -= 1
+                    for rules, holder in list(self.holders.items()):
+                        if holder == worker:
+                            del self.holders[rules]
+                    continue
+                self.handle(worker, decode_message(data), fds)
+
+    def handle(self, worker, message, fds):
+        msg_type = message.get("type")
+        rules = rules_key(message)
+        if msg_type == "hosting":
+            self.holders[rules] = worker
+        elif msg_type == "unhosted":
+            if self.holders.get(rules) == worker:
+                del self.holders[rules]
+        elif msg_type == "seek" and fds:
+            holder = self.holders.get(rules)
+            if holder is not None and holder != worker:
+                # the forwarded player fills that room
+                target = self.holders.pop(rules)
+            else:
+                target = self.holders[rules] = worker
+            self.adopt(target, message["hello"], fds[0])
+        elif msg_type == "route" and fds:
+            target = message.get("worker")
+            if not isinstance(target, int) or not 0 <= target < len(self.channels):
+                target = worker
+            self.adopt(target, message["hello"], fds[0])
+        else:
+            for fd in fds:
+                os.close(fd)
+
+    def adopt(self, worker, hello, fd):
+        try:
+            socket.send_fds(self.channels[worker], [encode_message({"type": "adopt", "hello": hello})],
+                            [fd])
+        except OSError as e:
+            log.error("hand over failed", worker=worker, error=e)
+        finally:
+            # the worker holds its own copy now, or the client sees the drop
+            os.close(fd)
+
+def run_worker(args, worker, channel, sock):
+    # one game log per worker, appending from several processes would interleave
+    game_log = open_game_log(args, f"{args.game_log}.{worker}") if args.game_log else None
+    server = make_async_server(args, worker=worker, workers=args.workers,
+                               coordinator=channel, sock=sock, game_log=game_log)
+    serve_stats(args, server.metrics, worker)
+    log.info("worker started", worker=worker, pid=os.getpid())
+    try:
+        server.run()
+    finally:
+        stop_logging()
+
+def build_launcher_parser():
+    parser = build_parser()
+    parser.description = "Connect 4 game server, one async worker process per core"
+    parser.set_defaults(mode='async')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes sharing the port")
+    return parser
+
+def main():
+    args = build_launcher_parser().parse_args()
+    restart_socket, args.restart_socket = args.restart_socket, None
+
+    sock = None
+    if not hasattr(socket, "SO_REUSEPORT"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((args.host, args.port))
+        sock.listen(1024)
+
+    pids = []
+    channels = []
+    for worker in range(args.workers):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            parent.close()
+            for channel in channels:
+                channel.close()
+            try:
+                # the log writer thread does not survive the fork, each worker starts its own
+                setup_logging(args.log_level, args.log_format)
+                run_worker(args, worker, child, sock)
+            finally:
+                os._exit(0)
+        child.close()
+        channels.append(parent)
+        pids.append(pid)
+
+    setup_logging(args.log_level, args.log_format)
+    if args.mode != 'async':
+        log.warning("the launcher always runs async workers, --mode is ignored")
+    if restart_socket is not None:
+        log.warning("hot restarts need a single server process, --restart-socket is ignored")
+
+    def stop(sig, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        Coordinator(channels).run()
+    except KeyboardInterrupt:
+        log.info("stopping workers")
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            os.waitpid(pid, 0)
+        stop_logging()
+
+if __name__ == "__main__":
+    main()
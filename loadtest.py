@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from engine import Board
+from protocol import RECV_SIZE, CODECS, get_codec, hello_message
+
+# headless load generator: simulated players connect in pairs, play full
+# games with restart votes and random disconnects, and report throughput,
+# relay latency, connection setup time and server memory per connection
+
+class Stats:
+    def __init__(self):
+        self.setup_times = []
+        self.relay_latencies = []
+        self.moves = 0
+        self.games = 0
+        self.disconnects = 0
+        self.errors = 0
+        # server memory once every pair is connected, and how many connections that was
+        self.rss_open = None
+        self.open_connections = 0
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def server_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+class HeadlessClient:
+    def __init__(self, host, port, codec='json', timeout=10.0):
+        self.host = host
+        self.port = port
+        self.codec = get_codec(codec)
+        self.decoder = self.codec.decoder()
+        self.timeout = timeout
+        self.pending = []
+        self.player_number = None
+        self.reader = self.writer = None
+
+    async def connect(self):
+        await self.open()
+        await self.wait_for_welcome()
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(hello_message(self.codec.name))
+
+    async def wait_for_welcome(self):
+        # the server only welcomes a player once the matchmaker found an opponent
+        welcome = await self.receive()
+        if welcome.get("type") != "welcome":
+            raise ConnectionError(f"server refused connection: {welcome.get('type')}")
+        self.player_number = welcome["player"]
+
+    async def receive(self):
+        while True:
+            while not self.pending:
+                data = await asyncio.wait_for(self.reader.read(RECV_SIZE), self.timeout)
+                if not data:
+                    raise ConnectionError("connection closed by server")
+                self.pending.extend(self.decoder.feed(data))
+            message = self.pending.pop(0)
+            if message.get("type") == "ping":
+                self.send({"type": "pong"})
+            elif message.get("type") != "queued":
+                return message
+
+    def send(self, message):
+        self.writer.write(self.codec.encode(message))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class SimulatedPlayer(HeadlessClient):
+    def __init__(self, host, port, stats, codec='json', think_ms=0, disconnect_rate=0.0):
+        super().__init__(host, port, codec)
+        self.stats = stats
+        self.think_ms = think_ms
+        self.disconnect_rate = disconnect_rate
+        self.opponent = None
+        self.disconnected = False
+        # send time of the last move, read by the opponent when it arrives
+        self.sent_at = None
+
+    async def play(self, games):
+        try:
+            for game in range(games):
+                if not await self.play_game(game):
+                    return
+                last = game == games - 1
+                self.send({"type": "restart", "vote": "NO" if last else "YES"})
+                if not await self.wait_for_restart():
+                    return
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            # waiting on an opponent that dropped out on purpose is expected
+            if self.opponent is None or not self.opponent.disconnected:
+                self.stats.errors += 1
+        finally:
+            self.close()
+
+    async def play_game(self, game):
+        board = Board()
+        # the first game starts with player 1, rematches alternate
+        turn = 1 if game % 2 == 0 else 2
+        finished = False
+        while True:
+            # once the board shows a result, only wait for the server's game_over
+            if turn == self.player_number and not finished:
+                if random.random() < self.disconnect_rate:
+                    self.stats.disconnects += 1
+                    self.disconnected = True
+                    return False
+                if self.think_ms:
+                    await asyncio.sleep(self.think_ms / 1000)
+                col = random.choice(board.valid_moves())
+                board.drop_piece(col, self.player_number)
+                finished = board.winning_move(self.player_number) or board.is_full()
+                self.sent_at = time.perf_counter()
+                self.send({"type": "move", "column": col, "piece": self.player_number})
+                turn = 2 if turn == 1 else 1
+
+            message = await self.receive()
+            msg_type = message.get("type")
+            if msg_type == "move":
+                if self.opponent is not None and self.opponent.sent_at is not None:
+                    self.stats.relay_latencies.append(time.perf_counter() - self.opponent.sent_at)
+                board.drop_piece(message["column"], message["piece"])
+                finished = board.winning_move(message["piece"]) or board.is_full()
+                self.stats.moves += 1
+                turn = self.player_number
+            elif msg_type == "game_over":
+                if self.player_number == 1:
+                    self.stats.games += 1
+                return True
+            elif msg_type == "invalid_move":
+                self.stats.errors += 1
+                return False
+
+    async def wait_for_restart(self):
+        while True:
+            message = await self.receive()
+            if message.get("type") == "reset":
+                if message.get("result") != "YES":
+                    return False
+            elif message.get("type") == "game_start":
+                return True
+
+async def run_load(args, stats):
+    pair_lock = asyncio.Lock()
+    # games only start once every pair is connected, so the server's memory is
+    # sampled with all the connections open
+    pairs_left = args.players // 2
+    all_connected = asyncio.Event()
+
+    def pair_ready():
+        nonlocal pairs_left
+        pairs_left -= 1
+        if pairs_left == 0:
+            if args.server_pid:
+                stats.rss_open = server_rss_kb(args.server_pid)
+                stats.open_connections = len(stats.setup_times)
+            all_connected.set()
+
+    async def start_pair():
+        # pairs connect one after another so the server matches them together
+        async with pair_lock:
+            players = [SimulatedPlayer(args.host, args.port, stats, args.codec,
+                                       args.think_ms, args.disconnect_rate) for _ in range(2)]
+            start = time.perf_counter()
+            try:
+                for player in players:
+                    await player.open()
+                await asyncio.gather(*(player.wait_for_welcome() for player in players))
+            except (ConnectionError, OSError, asyncio.TimeoutError):
+                stats.errors += 1
+                for player in players:
+                    player.close()
+                pair_ready()
+                return
+            stats.setup_times.extend([time.perf_counter() - start] * 2)
+        pair_ready()
+        await all_connected.wait()
+        first, second = players
+        first.opponent, second.opponent = second, first
+        await asyncio.gather(first.play(args.games), second.play(args.games))
+
+    pairs = [asyncio.create_task(start_pair()) for _ in range(args.players // 2)]
+    await asyncio.gather(*pairs)
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Connect 4 server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--players', type=int, default=1000, help="simulated players, paired two by two")
+    parser.add_argument('--games', type=int, default=3, help="games per pair, with restart votes between them")
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json')
+    parser.add_argument('--think-ms', type=int, default=0, help="delay before each move")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help="probability of dropping the connection instead of moving")
+    parser.add_argument('--server-pid', type=int, default=None,
+                        help="pid of a running server, to report its memory per connection")
+    parser.add_argument('--spawn-server', action='store_true',
+                        help="start an async server on --port for the duration of the test")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    server = None
+    if args.spawn_server:
+        # simulated players move as fast as the relay allows, so no rate limit
+        server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        server = subprocess.Popen([sys.executable, server_path, "--mode", "async",
+                                   "--host", args.host, "--port", str(args.port),
+                                   "--rate-limit", "0"],
+                                  stdout=subprocess.DEVNULL)
+        args.server_pid = server.pid
+        time.sleep(1)
+
+    try:
+        rss_before = server_rss_kb(args.server_pid) if args.server_pid else None
+        stats = Stats()
+        start = time.perf_counter()
+        asyncio.run(run_load(args, stats))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    connections = len(stats.setup_times)
+    print(f"connections:      {connections}")
+    print(f"games finished:   {stats.games}")
+    print(f"moves relayed:    {stats.moves} in {elapsed:.2f}s ({stats.moves / elapsed:.0f} moves/s)")
+    print(f"relay latency:    p50 {percentile(stats.relay_latencies, 0.5) * 1000:.2f}ms"
+          f"  p99 {percentile(stats.relay_latencies, 0.99) * 1000:.2f}ms")
+    print(f"connection setup: p50 {percentile(stats.setup_times, 0.5) * 1000:.2f}ms"
+          f"  p99 {percentile(stats.setup_times, 0.99) * 1000:.2f}ms")
+    print(f"disconnects:      {stats.disconnects}")
+    print(f"errors:           {stats.errors}")
+    if rss_before is not None and stats.rss_open is not None and stats.open_connections:
+        print(f"server memory:    {rss_before} -> {stats.rss_open} KiB"
+              f" with {stats.open_connections} connections open"
+              f" ({(stats.rss_open - rss_before) / stats.open_connections:.1f} KiB per connection)")
+
+if __name__ == "__main__":
+    main()
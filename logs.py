@@ -0,0 +1,107 @@
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# structured logging for the servers. every line is an event name plus
+# key=value fields, and records go through a bounded queue to a listener
+# thread that formats and writes them, so the network path never blocks on
+# stdout. when the queue is full records are dropped and counted instead.
+
+ROOT = "connect4"
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL + 10,
+}
+FORMATS = ("text", "json")
+
+class EventLogger:
+    def __init__(self, name):
+        self.logger = logging.getLogger(f"{ROOT}.{name}")
+
+    def log(self, level, event, fields):
+        # checked first so a disabled level costs one call and no formatting
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, fields)
+
+def get_logger(name):
+    return EventLogger(name)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname.lower()} {record.name} {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname.lower(),
+                 "logger": record.name, "event": record.getMessage()}
+        entry.update(getattr(record, "fields", None) or {})
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+handler = None
+listener = None
+
+def setup_logging(level="info", fmt="text", stream=None, max_queue=10000):
+    global handler, listener
+    stop_logging()
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(LEVELS[level])
+    logger.propagate = False
+    if level == "off":
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    records = queue.Queue(max_queue)
+    handler = DroppingQueueHandler(records)
+    logger.addHandler(handler)
+    listener = QueueListener(records, output)
+    listener.start()
+
+def stop_logging():
+    # writes out whatever is still queued
+    global handler, listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+    if handler is not None:
+        logging.getLogger(ROOT).removeHandler(handler)
+        handler = None
+
+def dropped_records():
+    return handler.dropped if handler is not None else 0
@@ -0,0 +1,187 @@
+import bisect
+import itertools
+import time
+from collections import deque
+
+# skill based pairing. waiting players sit in a queue split into rating buckets,
+# and only the non-empty buckets are kept in a sorted list, so finding the
+# closest opponent is a bisect plus a walk over neighbouring buckets. a player
+# first accepts opponents within base_window rating points, and the window
+# widens the longer they wait, up to max_window.
+
+INITIAL_RATING = 1500.0
+# elo K factor, higher for the first games so new players settle quickly
+K_FACTOR = 16
+PROVISIONAL_K_FACTOR = 32
+PROVISIONAL_GAMES = 20
+
+class RatingStore:
+    def __init__(self, initial=INITIAL_RATING):
+        self.initial = initial
+        # name -> [rating, games played]
+        self.ratings = {}
+
+    def get(self, name):
+        entry = self.ratings.get(name)
+        return entry[0] if entry is not None else self.initial
+
+    def record(self, first, second, score):
+        # score is 1 when first won, 0 when second won, 0.5 for a draw
+        a = self.ratings.setdefault(first, [self.initial, 0])
+        b = self.ratings.setdefault(second, [self.initial, 0])
+        expected = 1 / (1 + 10 ** ((b[0] - a[0]) / 400))
+        a[0] += self.k_factor(a) * (score - expected)
+        b[0] += self.k_factor(b) * (expected - score)
+        a[1] += 1
+        b[1] += 1
+        return a[0], b[0]
+
+    def k_factor(self, entry):
+        return PROVISIONAL_K_FACTOR if entry[1] < PROVISIONAL_GAMES else K_FACTOR
+
+class Ticket:
+    __slots__ = ("player", "rating", "bucket", "joined", "cancelled")
+
+    def __init__(self, player, rating, bucket, joined):
+        self.player = player
+        self.rating = rating
+        self.bucket = bucket
+        self.joined = joined
+        self.cancelled = False
+
+class Matchmaker:
+    def __init__(self, on_match, bucket_width=50, base_window=100, widen_rate=25,
+                 max_window=600, clock=time.monotonic, max_samples=10000):
+        # on_match(first, second) gets the tickets of each pair, longest waiting first
+        self.on_match = on_match
+        self.bucket_width = bucket_width
+        self.base_window = base_window
+        # rating points per second of waiting
+        self.widen_rate = widen_rate
+        self.max_window = max_window
+        self.clock = clock
+        # bucket -> tickets oldest first, and the sorted keys of non-empty buckets
+        self.buckets = {}
+        self.keys = []
+        self.queued = 0
+        self.matched = 0
+        # recent wait times in seconds, for stats()
+        self.waits = deque(maxlen=max_samples)
+
+    def window(self, ticket, now):
+        return min(self.base_window + self.widen_rate * (now - ticket.joined), self.max_window)
+
+    def join(self, player, rating):
+        now = self.clock()
+        ticket = Ticket(player, rating, int(rating // self.bucket_width), now)
+        opponent = self.find_opponent(ticket, now)
+        if opponent is not None:
+            self.remove(opponent)
+            self.pair(opponent, ticket, now)
+            return ticket
+
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is None:
+            bucket = self.buckets[ticket.bucket] = deque()
+            bisect.insort(self.keys, ticket.bucket)
+        bucket.append(ticket)
+        self.queued += 1
+        return ticket
+
+    def cancel(self, ticket):
+        # the player left before being matched; the ticket is skipped lazily
+        if not ticket.cancelled:
+            ticket.cancelled = True
+            self.queued -= 1
+
+    def find_opponent(self, ticket, now):
+        # walk outwards from the ticket's bucket, nearest buckets first
+        right = bisect.bisect_left(self.keys, ticket.bucket)
+        left = right - 1
+        reach = self.max_window // self.bucket_width + 1
+        while left >= 0 or right < len(self.keys):
+            if right < len(self.keys) and (left < 0 or
+                    self.keys[right] - ticket.bucket <= ticket.bucket - self.keys[left]):
+                key = self.keys[right]
+                right += 1
+            else:
+                key = self.keys[left]
+                left -= 1
+            if abs(key - ticket.bucket) > reach:
+                break
+            candidate = self.head(key)
+            if candidate is ticket:
+                candidate = self.next_live(key)
+            if candidate is None:
+                continue
+            # either side's window is enough, the one waiting longer is less picky
+            limit = max(self.window(ticket, now), self.window(candidate, now))
+            if abs(candidate.rating - ticket.rating) <= limit:
+                return candidate
+        return None
+
+    def head(self, key):
+        # oldest live ticket of a bucket, dropping cancelled ones on the way.
+        # emptied buckets stay listed until the next sweep so searches can walk keys safely
+        bucket = self.buckets.get(key)
+        while bucket and bucket[0].cancelled:
+            bucket.popleft()
+        return bucket[0] if bucket else None
+
+    def next_live(self, key):
+        # the oldest live ticket behind the head, for a head looking in its own bucket
+        for ticket in itertools.islice(self.buckets[key], 1, None):
+            if not ticket.cancelled:
+                return ticket
+        return None
+
+    def remove(self, ticket):
+        bucket = self.buckets[ticket.bucket]
+        if bucket[0] is ticket:
+            bucket.popleft()
+        else:
+            bucket.remove(ticket)
+        if not bucket:
+            self.drop_bucket(ticket.bucket)
+        self.queued -= 1
+
+    def drop_bucket(self, key):
+        if self.buckets.pop(key, None) is not None:
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def pair(self, first, second, now):
+        self.matched += 1
+        self.waits.append(now - first.joined)
+        self.waits.append(now - second.joined)
+        self.on_match(first, second)
+
+    def sweep(self):
+        # windows widen over time, so players already queued may now accept each other
+        # a bucket keeps pairing its oldest ticket until nobody is left in reach
+        now = self.clock()
+        for key in list(self.keys):
+            while True:
+                ticket = self.head(key)
+                if ticket is None:
+                    self.drop_bucket(key)
+                    break
+                opponent = self.find_opponent(ticket, now)
+                if opponent is None:
+                    break
+                self.remove(ticket)
+                self.remove(opponent)
+                if opponent.joined < ticket.joined:
+                    ticket, opponent = opponent, ticket
+                self.pair(ticket, opponent, now)
+
+    def stats(self):
+        waits = sorted(self.waits)
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+        return {
+            "queued": self.queued,
+            "matched": self.matched,
+            "wait_p50": percentile(0.5),
+            "wait_p99": percentile(0.99),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
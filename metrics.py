@@ -0,0 +1,143 @@
+import bisect
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# counters, gauges and histograms for the servers, served as JSON over a local
+# HTTP port or unix socket. counters are plain dict updates on the hot path.
+# once a second sample(), called from the server's own loop, reads the gauges,
+# copies the counters and histograms and computes rates. the stats endpoint
+# only serves that copy, so it never walks live server state from its thread.
+
+# upper bounds, in seconds for latencies and in messages for queue depths
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+# seconds players wait in the matchmaking queue
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# seconds of samples behind the per second rates
+RATE_WINDOW = 10
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # one count per bucket, the last one for values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        # upper bound of the bucket holding the p-th value
+        if not self.count:
+            return 0
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.bounds] + ["inf"], self.counts)),
+        }
+
+class Metrics:
+    def __init__(self, counters=()):
+        self.started = time.monotonic()
+        # registering counters up front keeps the dict's keys fixed while it is read
+        self.counters = dict.fromkeys(counters, 0)
+        self.histograms = {}
+        self.gauges = {}
+        self.gauge_values = {}
+        self.samples = deque(maxlen=RATE_WINDOW + 1)
+        # what the stats endpoint serves, replaced whole by sample()
+        self.published = self.collect(dict(self.counters))
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def histogram(self, name, bounds=LATENCY_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        return histogram
+
+    def observe(self, name, value):
+        # a histogram observed off the sampling thread must be registered up front,
+        # like the counters, or sample() may see the dict grow under it
+        self.histogram(name).observe(value)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def sample(self):
+        self.gauge_values = {name: read() for name, read in self.gauges.items()}
+        counters = dict(self.counters)
+        self.samples.append((time.monotonic(), counters))
+        self.published = self.collect(counters)
+
+    def rates(self):
+        if len(self.samples) < 2:
+            return {}
+        (start, first), (end, last) = self.samples[0], self.samples[-1]
+        return {name: (value - first.get(name, 0)) / (end - start) for name, value in last.items()}
+
+    def collect(self, counters):
+        return {
+            "counters": counters,
+            "rates": self.rates(),
+            "gauges": self.gauge_values,
+            "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+    def snapshot(self):
+        # safe from any thread, it only reads the last sample
+        return dict(self.published, uptime=time.monotonic() - self.started)
+
+class StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.metrics.snapshot(), indent=2).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TcpStatsServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class UnixStatsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def start_stats_server(metrics, port=None, path=None, host="127.0.0.1"):
+    # GET on either gives the JSON snapshot, e.g. curl --unix-socket PATH http://stats/
+    if path is not None:
+        if os.path.exists(path):
+            os.unlink(path)
+        server = UnixStatsServer(path, StatsHandler)
+    else:
+        server = TcpStatsServer((host, port), StatsHandler)
+    server.metrics = metrics
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,147 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ai import AIPlayer
+from engine import Board
+
+# precomputed best moves for every position in the first plies of a game
+#
+# the file is an open addressing hash table: a header followed by fixed size
+# slots of (position key, best move, score), so it can be memory mapped and
+# probed in place without loading anything into Python objects
+
+MAGIC = b"C4BK"
+# version 1 books were searched with a wrong root window, and version 2 ones
+# with a table that mixed up the side to move; both must be regenerated
+VERSION = 3
+HEADER = struct.Struct("<4sHBBBxQ")
+SLOT = struct.Struct("<Qbi")
+EMPTY_KEY = 0
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+KEY_MASK = (1 << 64) - 1
+
+def slot_index(key, slots):
+    return ((key * HASH_MULTIPLIER) & KEY_MASK) % slots
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.rows, self.columns, self.plies, self.slots = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError(f"{path} is not an opening book")
+        if version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is an old opening book (version {version}), generate it again")
+
+    def lookup(self, board, piece):
+        # returns (move, score) for piece, the side to move, or None when not in the book
+        # books are built for connect 4 only
+        if (board.moves > self.plies or board.rows != self.rows or board.columns != self.columns
+                or board.connect != 4):
+            return None
+
+        key = board.key(piece)
+        slot = slot_index(key, self.slots)
+        for _ in range(self.slots):
+            entry_key, move, score = SLOT.unpack_from(self.data, HEADER.size + slot * SLOT.size)
+            if entry_key == key:
+                return move, score
+            if entry_key == EMPTY_KEY:
+                return None
+            slot = (slot + 1) % self.slots
+        return None
+
+    def close(self):
+        self.data.close()
+
+def enumerate_positions(rows, columns, plies):
+    # every unfinished position reachable in at most plies moves, each once
+    seen = set()
+    positions = []
+
+    def visit(board, piece):
+        key = board.key(piece)
+        if key in seen:
+            return
+        seen.add(key)
+        positions.append((board.copy(), piece))
+        if board.moves == plies:
+            return
+
+        opponent = 2 if piece == 1 else 1
+        for col in board.valid_moves():
+            board.drop_piece(col, piece)
+            if not board.winning_move(piece) and not board.is_full():
+                visit(board, opponent)
+            board.undo_piece(col, piece)
+
+    visit(Board(rows, columns), 1)
+    return positions
+
+_players = {}
+
+def analyse_position(position, depth, time_ms):
+    board, piece = position
+    player = _players.get((depth, time_ms))
+    if player is None:
+        player = _players[(depth, time_ms)] = AIPlayer(depth, time_ms)
+    move, score = player.search(board, piece)
+    return board.key(piece), move, score
+
+def write_book(path, entries, rows, columns, plies, load_factor=0.5):
+    slots = max(1, int(len(entries) / load_factor))
+    data = bytearray(HEADER.size + slots * SLOT.size)
+    HEADER.pack_into(data, 0, MAGIC, VERSION, rows, columns, plies, slots)
+
+    for key, move, score in entries:
+        slot = slot_index(key, slots)
+        while SLOT.unpack_from(data, HEADER.size + slot * SLOT.size)[0] != EMPTY_KEY:
+            slot = (slot + 1) % slots
+        SLOT.pack_into(data, HEADER.size + slot * SLOT.size, key, move, score)
+
+    # write next to the target and swap, so a running server never maps a half written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def generate(path, rows=6, columns=7, plies=4, depth=10, time_ms=0, workers=None):
+    if (rows + 1) * columns > 64:
+        raise ValueError(f"a {rows}x{columns} board does not fit a 64 bit book key")
+
+    positions = enumerate_positions(rows, columns, plies)
+    with ProcessPoolExecutor(workers) as pool:
+        entries = list(pool.map(analyse_position, positions,
+                                [depth] * len(positions), [time_ms] * len(positions),
+                                chunksize=16))
+    write_book(path, entries, rows, columns, plies)
+    return len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the AI opening book")
+    parser.add_argument('output', nargs='?', default='opening_book.bin')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--columns', type=int, default=7)
+    parser.add_argument('--plies', type=int, default=4,
+                        help="book every position with at most this many moves played")
+    parser.add_argument('--depth', type=int, default=10, help="search depth per position")
+    parser.add_argument('--time-ms', type=int, default=0,
+                        help="time budget per position in milliseconds, 0 for no limit")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate(args.output, args.rows, args.columns, args.plies,
+                     args.depth, args.time_ms, args.workers)
+    print(f"wrote {count} positions to {args.output} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import json
+import struct
+
+# every JSON message on the wire is one object terminated by a newline
+DELIMITER = b"\n"
+RECV_SIZE = 4096
+
+class ProtocolError(ValueError):
+    pass
+
+# raised by a decoder whose connection sent more messages than its bucket allows
+class RateLimited(ProtocolError):
+    pass
+
+def encode_message(message):
+    return json.dumps(message, separators=(',', ':')).encode() + DELIMITER
+
+def decode_message(frame):
+    return json.loads(frame)
+
+class MessageBuffer:
+    # max_size bounds a frame, and the partial frame kept while waiting for its
+    # delimiter; limiter is a ratelimit.TokenBucket charged one token per frame.
+    # both are checked before anything is parsed
+    def __init__(self, max_size=None, limiter=None):
+        self.buffer = bytearray()
+        # bytes already searched for a delimiter, so a partial frame is never rescanned
+        self.scanned = 0
+        self.max_size = max_size
+        self.limiter = limiter
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        start = 0
+        pos = self.scanned
+        while True:
+            end = self.buffer.find(DELIMITER, pos)
+            if end < 0:
+                break
+            if self.max_size is not None and end - start > self.max_size:
+                raise ProtocolError(f"message too large: {end - start} bytes")
+            frame = bytes(self.buffer[start:end])
+            if frame.strip():
+                if self.limiter is not None and not self.limiter.take():
+                    raise RateLimited("too many messages")
+                frames.append(frame)
+            start = pos = end + 1
+
+        if start:
+            del self.buffer[:start]
+        if self.max_size is not None and len(self.buffer) > self.max_size:
+            raise ProtocolError(f"message too large: over {len(self.buffer)} bytes")
+        self.scanned = len(self.buffer)
+        return frames
+
+    def pending(self):
+        return len(self.buffer)
+
+    def take_remaining(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        self.scanned = 0
+        return data
+
+class JsonDecoder:
+    def __init__(self, max_size=None, limiter=None):
+        self.buffer = MessageBuffer(max_size, limiter)
+
+    def feed(self, data):
+        messages = []
+        for frame in self.buffer.feed(data):
+            try:
+                message = decode_message(frame)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise ProtocolError(f"invalid JSON frame: {e}")
+            if not isinstance(message, dict):
+                raise ProtocolError(f"expected an object, got: {frame[:64]!r}")
+            messages.append(message)
+        return messages
+
+    def take_remaining(self):
+        return self.buffer.take_remaining()
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message):
+        return encode_message(message)
+
+    def decoder(self, max_size=None, limiter=None):
+        return JsonDecoder(max_size, limiter)
+
+# binary frames start with a one byte tag; the common messages have a fixed
+# layout of unsigned bytes and anything else is carried as length-prefixed JSON
+TAG_JSON = 0xFF
+JSON_HEADER = struct.Struct(">BH")
+VOTES = ("NO", "YES")
+
+BINARY_MESSAGES = {
+    1: ("move", ("column", "piece")),
+    2: ("restart", ("vote",)),
+    3: ("reset", ("result",)),
+    4: ("game_start", ("turn", "first_player")),
+    5: ("welcome", ("player",)),
+    6: ("game_over", ("winner",)),
+    7: ("ping", ()),
+    8: ("pong", ()),
+}
+
+class BinaryDecoder:
+    def __init__(self, layouts, max_size=None, limiter=None):
+        self.buffer = bytearray()
+        self.layouts = layouts
+        self.max_size = max_size
+        self.limiter = limiter
+
+    def feed(self, data):
+        self.buffer += data
+        buffer = self.buffer
+        messages = []
+        pos = 0
+        limiter = self.limiter
+        while pos < len(buffer):
+            tag = buffer[pos]
+            if tag == TAG_JSON:
+                if len(buffer) - pos < JSON_HEADER.size:
+                    break
+                _, length = JSON_HEADER.unpack_from(buffer, pos)
+                # the length is known from the header, refuse before waiting for the body
+                if self.max_size is not None and length > self.max_size:
+                    raise ProtocolError(f"message too large: {length} bytes")
+                end = pos + JSON_HEADER.size + length
+                if end > len(buffer):
+                    break
+                if limiter is not None and not limiter.take():
+                    raise RateLimited("too many messages")
+                try:
+                    message = decode_message(bytes(buffer[pos + JSON_HEADER.size:end]))
+                except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                    raise ProtocolError(f"invalid JSON frame: {e}")
+                if not isinstance(message, dict):
+                    raise ProtocolError("expected an object in JSON frame")
+                messages.append(message)
+                pos = end
+                continue
+
+            layout = self.layouts.get(tag)
+            if layout is None:
+                raise ProtocolError(f"unknown message tag: {tag}")
+            msg_type, fields, packer = layout
+            end = pos + packer.size
+            if end > len(buffer):
+                break
+            if limiter is not None and not limiter.take():
+                raise RateLimited("too many messages")
+            message = {"type": msg_type}
+            for field, value in zip(fields, packer.unpack_from(buffer, pos)[1:]):
+                if field in ("vote", "result"):
+                    if value >= len(VOTES):
+                        raise ProtocolError(f"invalid {field}: {value}")
+                    value = VOTES[value]
+                message[field] = value
+            messages.append(message)
+            pos = end
+
+        if pos:
+            del buffer[:pos]
+        return messages
+
+    def take_remaining(self):
+        # the start of a frame not received in full yet
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+class BinaryCodec:
+    name = "binary"
+
+    def __init__(self):
+        self.layouts = {}
+        self.tags = {}
+        for tag, (msg_type, fields) in BINARY_MESSAGES.items():
+            packer = struct.Struct(">" + "B" * (len(fields) + 1))
+            self.layouts[tag] = (msg_type, fields, packer)
+            self.tags[msg_type] = (tag, fields, packer)
+
+    def encode(self, message):
+        layout = self.tags.get(message.get("type"))
+        if layout is not None and len(message) == len(layout[1]) + 1:
+            tag, fields, packer = layout
+            values = []
+            for field in fields:
+                value = message.get(field)
+                if field in ("vote", "result") and value in VOTES:
+                    value = VOTES.index(value)
+                if type(value) is not int or not 0 <= value <= 0xFF:
+                    break
+                values.append(value)
+            else:
+                return packer.pack(tag, *values)
+
+        payload = json.dumps(message, separators=(',', ':')).encode()
+        if len(payload) > 0xFFFF:
+            raise ProtocolError(f"message too large: {len(payload)} bytes")
+        return JSON_HEADER.pack(TAG_JSON, len(payload)) + payload
+
+    def decoder(self, max_size=None, limiter=None):
+        return BinaryDecoder(self.layouts, max_size, limiter)
+
+CODECS = {
+    JsonCodec.name: JsonCodec(),
+    BinaryCodec.name: BinaryCodec(),
+}
+
+def get_codec(name):
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ProtocolError(f"unknown codec: {name}")
+    return codec
+
+# the handshake is always JSON: the client names its codec in a hello message
+# and waits for the welcome, which is the first message in that codec
+def hello_message(codec_name, **options):
+    return encode_message(dict(options, type="hello", codec=codec_name))
+
+# hello options and the type each must have when given
+HELLO_FIELDS = {
+    "codec": str,
+    "role": str,
+    "room": int,
+    "resume": str,
+    "opponent": str,
+    "name": str,
+    "rules": dict,
+}
+
+def parse_hello(frame):
+    try:
+        hello = decode_message(frame)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"invalid hello: {e}")
+    if not isinstance(hello, dict) or hello.get("type") != "hello":
+        raise ProtocolError(f"expected hello, got: {frame!r}")
+    for field, kind in HELLO_FIELDS.items():
+        value = hello.get(field)
+        if value is not None and not isinstance(value, kind):
+            raise ProtocolError(f"invalid hello: {field} must be a {kind.__name__}")
+    return get_codec(hello.get("codec", JsonCodec.name)), hello
+
+def accept_hello(buffer, frames):
+    # returns the negotiated codec, its decoder, any messages already received
+    # and the hello itself, which may carry connection options. the decoder
+    # keeps the limits of the handshake buffer
+    codec, hello = parse_hello(frames[0])
+    if len(frames) > 1:
+        raise ProtocolError("client sent messages before the welcome")
+    decoder = codec.decoder(buffer.max_size, buffer.limiter)
+    return codec, decoder, decoder.feed(buffer.take_remaining()), hello
@@ -0,0 +1,31 @@
+import time
+
+# per connection token bucket. a client may send `burst` messages at once and
+# `rate` per second after that; the bucket is refilled from the clock on every
+# take, so an idle connection costs nothing and needs no timer.
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "clock")
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def take(self):
+        now = self.clock()
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+def make_bucket(rate, burst):
+    # None when rate limiting is off
+    if rate <= 0:
+        return None
+    return TokenBucket(rate, max(burst, 1))
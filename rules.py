@@ -0,0 +1,98 @@
+from functools import lru_cache
+
+# rules of a game, shared by the server and the client: board size, how many
+# pieces in a row win, and the variant
+#
+#   standard: pieces are dropped into columns, a full board is a draw
+#   popout:   a player may instead pop one of its own pieces out of the bottom
+#             of a column and everything above falls one row. a full board
+#             is not a draw, a position seen a third time is
+#
+# cells are numbered like the bitboards in engine.Board, col * (rows + 1) + row.
+# every line of `connect` cells is a bit mask, precomputed once per board size
+# and line length and listed under each cell it passes through, so a move only
+# tests the lines through the cell it filled instead of scanning the board
+
+VARIANTS = ("standard", "popout")
+MAX_SIZE = 20
+# moves are recorded as the column played, with this bit set for a pop
+POP = 0x80
+
+class Rules:
+    def __init__(self, rows=6, columns=7, connect=4, variant="standard"):
+        if type(rows) is not int or type(columns) is not int or not (
+                1 <= rows <= MAX_SIZE and 1 <= columns <= MAX_SIZE):
+            raise ValueError(f"invalid board size: {rows}x{columns}")
+        if type(connect) is not int or not 2 <= connect <= max(rows, columns):
+            raise ValueError(f"invalid line length for a {rows}x{columns} board: {connect}")
+        if variant not in VARIANTS:
+            raise ValueError(f"unknown variant: {variant}")
+        self.rows = rows
+        self.columns = columns
+        self.connect = connect
+        self.variant = variant
+
+    def to_dict(self):
+        return {"rows": self.rows, "columns": self.columns, "connect": self.connect,
+                "variant": self.variant}
+
+    def key(self):
+        return (self.rows, self.columns, self.connect, self.variant)
+
+    def __eq__(self, other):
+        return isinstance(other, Rules) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"{self.rows}x{self.columns} connect {self.connect} {self.variant}"
+
+@lru_cache(maxsize=64)
+def get_rules(rows=6, columns=7, connect=4, variant="standard"):
+    # one shared instance per set of rules for the common cases
+    return Rules(rows, columns, connect, variant)
+
+def rules_from_dict(options, default=None):
+    # rules named in a message, any field left out comes from default
+    default = default or STANDARD
+    if options is None:
+        return default
+    if not isinstance(options, dict):
+        raise ValueError(f"invalid rules: {options!r}")
+    fields = default.to_dict()
+    fields.update(options)
+    for name, value in fields.items():
+        # checked before get_rules, whose cache would fail to hash a list
+        if not isinstance(value, (int, str)):
+            raise ValueError(f"invalid rules, {name}: {value!r}")
+    return get_rules(fields["rows"], fields["columns"], fields["connect"], fields["variant"])
+
+@lru_cache(maxsize=64)
+def win_lines(rows, columns, connect):
+    # per cell, the masks of every line through it
+    stride = rows + 1
+    cells = [[] for _ in range(columns * stride)]
+    for col in range(columns):
+        for row in range(rows):
+            # lines are listed from their first cell: up, right, up-right, down-right
+            for dc, dr in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                last_col = col + dc * (connect - 1)
+                last_row = row + dr * (connect - 1)
+                if not (last_col < columns and 0 <= last_row < rows):
+                    continue
+                line = [(col + dc * i) * stride + row + dr * i for i in range(connect)]
+                mask = sum(1 << cell for cell in line)
+                for cell in line:
+                    cells[cell].append(mask)
+    return tuple(tuple(masks) for masks in cells)
+
+@lru_cache(maxsize=64)
+def column_lines(rows, columns, connect):
+    # per column, every line crossing it, which is what a pop can complete
+    lines = win_lines(rows, columns, connect)
+    stride = rows + 1
+    return tuple(tuple(set(mask for row in range(rows) for mask in lines[col * stride + row]))
+                 for col in range(columns))
+
+STANDARD = get_rules()
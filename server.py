@@ -1,179 +1,526 @@
 import socket
 import threading
-import json
+import asyncio
+import argparse
 import signal
 import sys
 import time
 import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+from ai import search_move
+from broadcast import AsyncSender, ThreadedSender, SLOW_CONSUMER_POLICIES
+from engine import Game, InvalidMove
+import handover
+from gamelog import FLAG_TIMEOUT, FSYNC_POLICIES, GameLogWriter
+from logs import FORMATS, LEVELS, dropped_records, get_logger, setup_logging, stop_logging
+from matchmaking import Matchmaker, RatingStore
+from metrics import DEPTH_BUCKETS, WAIT_BUCKETS, Metrics, start_stats_server
+from opening_book import OpeningBook
+from protocol import (MessageBuffer, ProtocolError, RateLimited, RECV_SIZE, accept_hello,
+                      decode_message, encode_message, get_codec)
+from ratelimit import make_bucket
+from rules import STANDARD, VARIANTS, get_rules, rules_from_dict
+from timers import TimerWheel
+
+log = get_logger("server")
+
+COUNTERS = ("connections", "messages_in", "messages_out", "moves", "invalid_moves",
+            "games_finished", "idle_drops", "turn_timeouts", "rate_limited", "protocol_errors")
+
+def game_snapshot(game, votes):
+    # everything a client needs to catch up with a game in a single message
+    return {
+        "type": "snapshot",
+        "rules": game.rules.to_dict(),
+        "first_player": game.first_player,
+        "moves": game.moves,
+        "turn": game.turn,
+        "winner": game.winner,
+        "votes": vote_counts(votes),
+    }
+
+def vote_counts(votes):
+    # restart votes are kept per player, clients are sent the tallies
+    counts = {"YES": 0, "NO": 0}
+    for vote in votes.values():
+        counts[vote] += 1
+    return counts
+
+def new_token():
+    return secrets.token_hex(16)
+
+def welcome_message(player, token, heartbeat_interval, rules):
+    welcome = {"type": "welcome", "player": player, "token": token, "rules": rules.to_dict()}
+    if heartbeat_interval > 0:
+        # lets the client notice a dead server too
+        welcome["heartbeat"] = heartbeat_interval
+    return welcome
 
 class GameServer:
-    def __init__(self, host='localhost', port=5000):
+    def __init__(self, host='localhost', port=5000, send_queue=256,
+                 slow_consumer='disconnect', send_timeout=5.0, resume_timeout=60.0,
+                 heartbeat_interval=10.0, idle_timeout=30.0, turn_timeout=0, game_log=None,
+                 metrics=None, drain_timeout=30.0, rules=None, max_message=1024, rate_limit=50,
+                 rate_burst=100):
         self.host = host
         self.port = port
+        # limits on what each client sends, checked before a message is parsed
+        self.max_message = max_message
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        # every game on this server is played by the same rules
+        self.rules = rules or STANDARD
+        self.resume_timeout = resume_timeout
+        self.drain_timeout = drain_timeout
+        self.send_queue = send_queue
+        self.slow_consumer = slow_consumer
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.turn_timeout = turn_timeout
+        # GameLogWriter for finished games, or None
+        self.game_log = game_log
+        # counters are bumped from every client thread without a lock, so they
+        # may miss the odd increment under contention
+        self.metrics = metrics or Metrics(COUNTERS)
+        self.metrics.gauge("clients", lambda: len(self.clients))
+        self.metrics.gauge("send_queue_max", lambda: max(self.queue_depths(), default=0))
+        self.metrics.gauge("log_dropped", dropped_records)
+        # registered here, the wheel thread walks them while client threads observe
+        self.metrics.histogram("relay_latency")
+        self.metrics.histogram("send_queue_depth", DEPTH_BUCKETS)
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((self.host, self.port))
         self.server.listen(2)
         
         self.clients = []
-        self.restart_votes = {"YES": 0, "NO": 0}
+        self.codecs = {}
+        self.senders = {}
+        self.players = {}
+        # session token -> player number, and the seats of disconnected players
+        # that can still be resumed: player number -> (token, expiry timer)
+        self.sessions = {}
+        self.suspended = {}
+        # when each connection last sent anything, checked by the reaper
+        self.last_seen = {}
+        # heartbeats, turn clocks and seat expiry all share one wheel
+        self.wheel = TimerWheel()
+        self.turn_timer = None
+        self.restart_votes = {}
         self.lock = threading.Lock()
+        # notified whenever a game ends or a player leaves, for shutdown to drain
+        self.idle = threading.Condition(self.lock)
         self.running = True
+        self.accepting = True
         self.shutdown_event = threading.Event()
         self.first_player = 1
+        self.game = Game(first_player=self.first_player, rules=self.rules)
         
-    def cleanup(self):
-        self.running = False
-        self.shutdown_event.set()
-        
+    def queue_depths(self):
         with self.lock:
-            for client in self.clients[:]:
-                try:
-                    client.send("SERVER_SHUTDOWN".encode())
-                except:
-                    pass
+            return [len(sender.queue) for sender in self.senders.values()]
+            
+    def sample_metrics(self):
+        # once a second on the wheel thread, and on schedule even if a sample fails
+        try:
+            self.metrics.sample()
+            depths = self.metrics.histogram("send_queue_depth")
+            for depth in self.queue_depths():
+                depths.observe(depth)
+        finally:
+            self.wheel.schedule(1.0, self.sample_metrics)
         
-        time.sleep(0.5)
+    def send_to(self, client, message):
+        sender = self.senders.get(client)
+        if sender is None:
+            # released by a takeover or a closed game, its reads drain until the close
+            return
+        sender.send(self.codecs[client].encode(message))
+        self.metrics.count("messages_out")
         
+    def send_to_clients(self, message, exclude=None):
+        # encode once per codec in use, not once per client
+        encoded = {}
+        for client in self.clients:
+            if client is exclude:
+                continue
+            codec = self.codecs[client]
+            data = encoded.get(codec.name)
+            if data is None:
+                data = encoded[codec.name] = codec.encode(message)
+            self.senders[client].send(data)
+            self.metrics.count("messages_out")
+        
+    def cleanup(self, drain=True):
+        # stop taking players, give the game in progress time to finish, then
+        # close every connection once the shutdown notice has been written
+        self.close_listener()
+        if drain and self.drain_timeout > 0:
+            with self.lock:
+                if self.game_in_progress():
+                    log.info("waiting for the game in progress", timeout=self.drain_timeout)
+                self.idle.wait_for(lambda: not self.game_in_progress(), self.drain_timeout)
+        
+        self.running = False
+        self.shutdown_event.set()
         with self.lock:
-            for client in self.clients[:]:
-                try:
-                    client.close()
-                except:
-                    pass
-            self.clients.clear()
+            self.send_to_clients({"type": "server_shutdown"})
+            senders = list(self.senders.values())
+        for sender in senders:
+            sender.finish()
+        for sender in senders:
+            sender.thread.join(self.send_timeout)
         
+        if self.game_log is not None:
+            self.game_log.close()
+            
+    def close_listener(self):
+        self.accepting = False
         try:
-            self.server.close()
-        except:
+            # wakes up the thread blocked in accept
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
             pass
+        self.server.close()
+            
+    def game_in_progress(self):
+        # callers hold self.lock; a dropped player cannot come back once the
+        # listener is closed, so only a game between two connected players counts
+        return len(self.players) == 2 and bool(self.game.moves) and not self.game.over
             
     def reset_game_state(self):
         with self.lock:
-            self.restart_votes = {"YES": 0, "NO": 0}
-            self.first_player = 2 if self.first_player == 1 else 1
+            self.start_new_game()
+            
+    def start_new_game(self):
+        # callers hold self.lock
+        self.restart_votes = {}
+        self.first_player = 2 if self.first_player == 1 else 1
+        self.game = Game(first_player=self.first_player, rules=self.rules)
+        self.start_turn_timer()
+        
+        self.send_to_clients({
+            "type": "game_start",
+            "turn": self.first_player - 1,
+            "first_player": self.first_player
+        })
+                
+    def reset_if_empty(self):
+        # callers hold self.lock; once every seat is gone the next two players
+        # start from an empty board instead of the one left behind
+        if self.players or self.suspended:
+            return
+        if self.turn_timer is not None:
+            self.turn_timer.cancel()
+            self.turn_timer = None
+        self.restart_votes = {}
+        self.first_player = 1
+        self.game = Game(first_player=self.first_player, rules=self.rules)
+                
+    def handshake(self, conn):
+        buffer = MessageBuffer(self.max_message, make_bucket(self.rate_limit, self.rate_burst))
+        while True:
+            chunk = conn.recv(RECV_SIZE)
+            if not chunk:
+                return None, None, [], None
+            frames = buffer.feed(chunk)
+            if frames:
+                return accept_hello(buffer, frames)
+                
+    def join(self, conn, addr, codec, hello):
+        try:
+            rules = rules_from_dict(hello.get("rules"), self.rules)
+        except ValueError:
+            rules = None
+        if rules != self.rules:
+            conn.sendall(codec.encode({"type": "error", "reason": f"this server plays {self.rules}"}))
+            return False
+        with self.lock:
+            token = hello.get("resume")
+            if token is not None:
+                player_number = self.sessions.get(token)
+                old = next((c for c, p in self.players.items() if p == player_number), None)
+                if player_number is None or (player_number not in self.suspended and old is None):
+                    conn.sendall(codec.encode({"type": "error", "reason": "session expired"}))
+                    return False
+                if old is not None:
+                    # the old connection is half open, the new one takes over. its
+                    # handler finds it unregistered and leaves the seat alone
+                    self.clients.remove(old)
+                    self.codecs.pop(old)
+                    self.players.pop(old)
+                    self.last_seen.pop(old)
+                    self.senders.pop(old).close()
+                else:
+                    self.suspended.pop(player_number)[1].cancel()
+            else:
+                taken = set(self.players.values()) | set(self.suspended)
+                if len(taken) >= 2:
+                    conn.sendall(codec.encode({"type": "full"}))
+                    return False
+                player_number = 1 if 1 not in taken else 2
+                token = new_token()
+                self.sessions[token] = player_number
             
-            start_message = json.dumps({
-                "type": "game_start",
-                "turn": self.first_player - 1,
-                "first_player": self.first_player
-            }) + "\n"
+            self.clients.append(conn)
+            self.codecs[conn] = codec
+            self.senders[conn] = ThreadedSender(conn, self.send_queue, self.slow_consumer,
+                                                self.send_timeout)
+            self.players[conn] = player_number
+            self.last_seen[conn] = time.monotonic()
+            if self.heartbeat_interval > 0:
+                self.wheel.schedule(self.heartbeat_interval, self.check_peer, conn)
+            welcome = welcome_message(player_number, token, self.heartbeat_interval, self.rules)
+            if self.game.moves or hello.get("resume"):
+                welcome["snapshot"] = game_snapshot(self.game, self.restart_votes)
+            self.send_to(conn, welcome)
+            if hello.get("resume"):
+                self.send_to_clients({"type": "opponent_reconnected", "player": player_number},
+                                     exclude=conn)
+            elif len(self.players) == 2:
+                self.start_turn_timer()
+            self.metrics.count("connections")
+            log.info("client connected", addr=addr, player=player_number, codec=codec.name,
+                     resumed=bool(hello.get("resume")))
+            return True
             
-            for client in self.clients:
-                client.send(start_message.encode())
+    def suspend_seat(self, player_number):
+        # callers hold self.lock; the seat stays reserved for a while so the player can resume
+        token = next(t for t, p in self.sessions.items() if p == player_number)
+        timer = self.wheel.schedule(self.resume_timeout, self.expire_seat, player_number, token)
+        self.suspended[player_number] = (token, timer)
+        self.send_to_clients({"type": "opponent_disconnected", "player": player_number})
+        
+    def expire_seat(self, player_number, token):
+        with self.lock:
+            if self.suspended.get(player_number, (None,))[0] != token:
+                return
+            del self.suspended[player_number]
+            self.sessions.pop(token, None)
+            self.idle.notify_all()
+            log.info("seat expired", player=player_number)
+            self.abandon_seat(player_number)
+            
+    def abandon_seat(self, player_number):
+        # callers hold self.lock; the seat is gone for good. as when the async
+        # server closes a room, a game in progress is forfeited and the player
+        # left is sent away, so the next two players start afresh
+        self.send_to_clients({"type": "opponent_left", "player": player_number})
+        if self.game.moves and not self.game.over:
+            self.game.forfeit(player_number)
+            self.finish_game("forfeit")
+        self.send_to_clients({"type": "room_closed", "reason": "opponent_left"})
+        for conn in list(self.clients):
+            # unregistered first, so its handler leaves the seat alone
+            self.clients.remove(conn)
+            self.codecs.pop(conn)
+            self.players.pop(conn)
+            self.last_seen.pop(conn)
+            self.senders.pop(conn).finish()
+        for token, timer in self.suspended.values():
+            timer.cancel()
+        self.suspended.clear()
+        self.sessions.clear()
+        self.reset_if_empty()
+            
+    def check_peer(self, conn):
+        # runs on the wheel thread every heartbeat interval for each connection
+        with self.lock:
+            last_seen = self.last_seen.get(conn)
+            if last_seen is None:
+                return
+            idle = time.monotonic() - last_seen
+            if idle >= self.idle_timeout:
+                log.info("idle client dropped", player=self.players.get(conn), idle=round(idle))
+                self.metrics.count("idle_drops")
+                self.senders[conn].close()
+                return
+            if idle >= self.heartbeat_interval:
+                self.send_to(conn, {"type": "ping"})
+        self.wheel.schedule(self.heartbeat_interval, self.check_peer, conn)
+        
+    def start_turn_timer(self):
+        # callers hold self.lock
+        if self.turn_timer is not None:
+            self.turn_timer.cancel()
+            self.turn_timer = None
+        if self.turn_timeout > 0 and not self.game.over:
+            self.turn_timer = self.wheel.schedule(self.turn_timeout, self.turn_expired,
+                                                  self.game, len(self.game.moves))
+            
+    def turn_expired(self, game, moves):
+        with self.lock:
+            if game is not self.game or game.over or len(game.moves) != moves:
+                return
+            log.info("turn timed out", player=game.turn)
+            self.metrics.count("turn_timeouts")
+            game.forfeit(game.turn)
+            self.finish_game("timeout")
+            
+    def finish_game(self, reason=None):
+        # callers hold self.lock
+        log.info("game over", winner=self.game.winner, moves=len(self.game.moves), reason=reason)
+        self.metrics.count("games_finished")
+        if self.game_log is not None:
+            flags = FLAG_TIMEOUT if reason in ("timeout", "forfeit") else 0
+            self.game_log.append(self.game, flags=flags)
+        message = {"type": "game_over", "winner": self.game.winner}
+        if reason is not None:
+            message["reason"] = reason
+        self.send_to_clients(message)
+        self.idle.notify_all()
                 
     def handle_client(self, conn, addr):
         try:
+            codec, decoder, messages, hello = self.handshake(conn)
+            if codec is None or not self.join(conn, addr, codec, hello):
+                return
+            
             while self.running and not self.shutdown_event.is_set():
-                message = conn.recv(1024).decode()
-                if not message:
-                    break
-                
-                print(f"receive message from client {addr}: {message}")
-                try:
-                    data = json.loads(message.strip())
-                    print(f"parsed message: {data}")
+                for data in messages:
+                    log.debug("message received", addr=addr, message=data)
+                    self.metrics.count("messages_in")
                     
-                    if data.get("type") == "restart":
+                    if data.get("type") == "ping":
+                        self.send_to(conn, {"type": "pong"})
+                    elif data.get("type") == "restart":
                         self.handle_restart_vote(data, conn)
                     elif data.get("type") == "move":
                         self.handle_move(data, conn)
-                        
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}, data: {message}")
+                
+                if self.slow_consumer == "block":
+                    self.wait_for_peers(conn)
+                chunk = conn.recv(RECV_SIZE)
+                if not chunk:
+                    break
+                self.last_seen[conn] = time.monotonic()
+                messages = decoder.feed(chunk)
                     
+        except RateLimited:
+            self.metrics.count("rate_limited")
+            log.warning("rate limited", addr=addr)
+        except ProtocolError as e:
+            self.metrics.count("protocol_errors")
+            log.warning("protocol error", addr=addr, error=e)
         except Exception as e:
-            print(f"handle client error: {e}")
+            log.error("client handler failed", addr=addr, error=repr(e))
         finally:
+            log.info("client disconnected", addr=addr)
             with self.lock:
                 if conn in self.clients:
                     self.clients.remove(conn)
-                conn.close()
+                self.codecs.pop(conn, None)
+                player_number = self.players.pop(conn, None)
+                sender = self.senders.pop(conn, None)
+                self.last_seen.pop(conn, None)
+                if player_number is not None and self.running:
+                    if self.resume_timeout > 0 and self.clients:
+                        self.suspend_seat(player_number)
+                    else:
+                        self.sessions = {t: p for t, p in self.sessions.items() if p != player_number}
+                        if self.clients:
+                            self.abandon_seat(player_number)
+                    self.reset_if_empty()
+                self.idle.notify_all()
+            if sender is not None:
+                sender.close()
+            conn.close()
+                
+    def wait_for_peers(self, conn):
+        # backpressure: stop reading from this client while a peer is behind
+        with self.lock:
+            peers = [self.senders[client] for client in self.clients if client is not conn]
+        for sender in peers:
+            sender.wait_writable()
                 
     def handle_restart_vote(self, data, conn):
         vote = data.get("vote")
-        if vote in ["YES", "NO"]:
-            with self.lock:
-                self.restart_votes[vote] += 1
-                print(f"current vote status: {self.restart_votes}")
-                
-                vote_status = json.dumps({
-                    "type": "vote_status",
-                    "votes": self.restart_votes
-                }) + "\n"
-                
-                for client in self.clients:
-                    client.send(vote_status.encode())
-                
-                if sum(self.restart_votes.values()) == 2:
-                    if self.restart_votes["YES"] == 2:
-                        result = json.dumps({
-                            "type": "reset",
-                            "result": "YES"
-                        }) + "\n"
-                        
-                        for client in self.clients:
-                            client.send(result.encode())
-                        
-                        self.reset_game_state()
-                    else:
-                        result = json.dumps({
-                            "type": "reset",
-                            "result": "NO"
-                        }) + "\n"
-                        
-                        for client in self.clients:
-                            client.send(result.encode())
-                        
-                        self.restart_votes = {"YES": 0, "NO": 0}
-                        
+        if vote not in ["YES", "NO"]:
+            return
+        with self.lock:
+            player = self.players.get(conn)
+            # one vote per player, and only once the game is decided
+            if not self.game.over or player in self.restart_votes:
+                log.debug("restart vote refused", player=player, vote=vote)
+                return
+            self.restart_votes[player] = vote
+            log.debug("restart vote", vote=vote, votes=self.restart_votes)
+
+            self.send_to_clients({
+                "type": "vote_status",
+                "votes": vote_counts(self.restart_votes)
+            })
+
+            if len(self.restart_votes) == 2:
+                result = "YES" if all(v == "YES" for v in self.restart_votes.values()) else "NO"
+                self.send_to_clients({
+                    "type": "reset",
+                    "result": result
+                })
+                self.restart_votes = {}
+                if result == "YES":
+                    self.start_new_game()
+
     def handle_move(self, data, conn):
         with self.lock:
-            move_message = json.dumps({
+            column = data.get('column')
+            pop = bool(data.get('pop'))
+            piece = self.players.get(conn)
+            try:
+                if len(self.clients) < 2:
+                    raise InvalidMove("waiting for opponent")
+                self.game.play(column, piece, pop)
+            except InvalidMove as e:
+                log.debug("move rejected", player=piece, column=column, reason=e)
+                self.metrics.count("invalid_moves")
+                self.send_to(conn, {"type": "invalid_move", "column": column, "reason": str(e)})
+                return
+            
+            move_message = {
                 "type": "move",
-                "column": data.get('column'),
-                "piece": data.get('piece')
-            }) + "\n"
-            print(f"forward move message: {move_message}")
-            for client in self.clients:
-                if client != conn:
-                    client.send(move_message.encode())
+                "column": column,
+                "piece": piece
+            }
+            if pop:
+                move_message["pop"] = True
+            self.send_to_clients(move_message, exclude=conn)
+            self.start_turn_timer()
+            self.metrics.count("moves")
+            # time from the move arriving to its relay being handed to the senders
+            self.metrics.observe("relay_latency", time.monotonic() - self.last_seen[conn])
+            log.debug("move relayed", player=piece, column=column, pop=pop)
+            
+            if self.game.over:
+                self.finish_game()
                     
     def accept_connections(self):
-        while self.running and not self.shutdown_event.is_set():
+        while self.accepting:
             try:
-                self.server.settimeout(0.5)
-                try:
-                    conn, addr = self.server.accept()
-                    with self.lock:
-                        if len(self.clients) >= 2:
-                            conn.send("FULL".encode())
-                            conn.close()
-                            continue
-                        
-                        self.clients.append(conn)
-                        player_number = len(self.clients)
-                        conn.send(str(player_number).encode())
-                        print(f"client connected: {addr}, player number: {player_number}")
-                        
-                        client_thread = threading.Thread(target=self.handle_client, 
-                                                       args=(conn, addr))
-                        client_thread.daemon = True
-                        client_thread.start()
-                except socket.timeout:
-                    if not self.running:
-                        break
-                    continue
-            except Exception as e:
-                if self.running:
-                    print(f"accept connection error: {e}")
+                conn, addr = self.server.accept()
+            except OSError as e:
+                # close_listener makes a blocked accept fail
+                if self.accepting:
+                    log.error("accept failed", error=e)
+                continue
+            client_thread = threading.Thread(target=self.handle_client, 
+                                           args=(conn, addr))
+            client_thread.daemon = True
+            client_thread.start()
                     
     def run(self):
-        print("server started...")
+        log.info("server started", host=self.host, port=self.port, mode="threaded")
+        self.wheel.schedule(1.0, self.sample_metrics)
         
         accept_thread = threading.Thread(target=self.accept_connections)
         accept_thread.daemon = True
         accept_thread.start()
         
+        wheel_thread = threading.Thread(target=self.wheel.run, args=(self.shutdown_event,))
+        wheel_thread.daemon = True
+        wheel_thread.start()
+        
         try:
             while self.running and not self.shutdown_event.is_set():
                 command = input()
@@ -181,22 +528,1263 @@ class GameServer:
                     self.cleanup()
                     break
         except KeyboardInterrupt:
-            print("shutting down server...")
+            log.info("shutting down")
             self.cleanup()
         except Exception as e:
-            print(f"main loop error: {e}")
+            log.error("main loop failed", error=repr(e))
             self.cleanup()
 
+class Room:
+    def __init__(self, room_id, rules=STANDARD):
+        self.room_id = room_id
+        self.rules = rules
+        self.clients = []
+        self.spectators = []
+        self.restart_votes = {}
+        self.first_player = 1
+        self.game = Game(first_player=self.first_player, rules=rules)
+        self.turn_timer = None
+
+    def snapshot(self):
+        snapshot = game_snapshot(self.game, self.restart_votes)
+        snapshot["room"] = self.room_id
+        return snapshot
+
+    def free_player(self):
+        taken = {client.player for client in self.clients}
+        return 1 if 1 not in taken else 2
+
+    def is_full(self):
+        return len(self.clients) >= 2
+
+    def is_empty(self):
+        # a room with nobody but bots left is done
+        return all(client.is_bot for client in self.clients)
+
+    def reset_votes(self):
+        self.restart_votes = {}
+
+    def new_game(self):
+        self.first_player = 2 if self.first_player == 1 else 1
+        self.game = Game(first_player=self.first_player, rules=self.rules)
+
+class Client:
+    is_bot = False
+
+    def __init__(self, writer, codec, sender):
+        self.writer = writer
+        self.codec = codec
+        self.sender = sender
+        self.player = None
+        self.spectator = False
+        # restored seats of players that were away during a hot restart have no connection
+        self.addr = writer.get_extra_info('peername') if writer is not None else None
+        self.token = None
+        # optional player name from the hello, ratings are kept per name
+        self.name = None
+        # rules asked for in the hello, players are only matched with the same rules
+        self.rules = STANDARD
+        # resolves to the room once the matchmaker found an opponent
+        self.match = None
+        # a dropped player keeps its seat until expiry fires or it resumes
+        self.connected = True
+        self.replaced = False
+        self.expiry = None
+        self.last_seen = time.monotonic()
+        # input not parsed yet when the connection is handed to a new process
+        self.pending = b""
+
+    def send(self, data):
+        if self.connected:
+            self.sender.send(data)
+
+# bots live in the server process, so their messages are handed over as dicts
+class LocalCodec:
+    name = "local"
+
+    def encode(self, message):
+        return message
+
+class BotClient:
+    is_bot = True
+    codec = LocalCodec()
+
+    def __init__(self, server, room):
+        self.server = server
+        self.room = room
+        self.player = None
+        self.addr = "bot"
+        self.thinking = False
+
+    def send(self, message):
+        loop = asyncio.get_running_loop()
+        if message.get("type") == "game_over":
+            # always up for a rematch, the human decides
+            loop.call_soon(self.server.handle_restart_vote, self.room, {"vote": "YES"}, self)
+        else:
+            loop.call_soon(self.maybe_move)
+
+    def maybe_move(self):
+        room = self.room
+        game = room.game
+        if self.thinking or room.room_id not in self.server.rooms or self.server.handing_over:
+            return
+        if game.over or game.turn != self.player or not room.is_full():
+            return
+
+        loop = asyncio.get_running_loop()
+        self.thinking = True
+        book = self.server.opening_book
+        entry = book.lookup(game.board, self.player) if book is not None else None
+        if entry is not None:
+            # book moves need no search, play them on the next loop iteration
+            future = loop.create_future()
+            future.set_result(entry[0])
+        else:
+            future = loop.run_in_executor(
+                self.server.get_bot_pool(), search_move, game.board.copy(), self.player,
+                self.server.bot_depth, self.server.bot_time_ms, self.server.opening_book_path)
+        future.add_done_callback(lambda f: self.on_move(game, f))
+
+    def on_move(self, game, future):
+        self.thinking = False
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            log.error("bot search failed", room=self.room.room_id, error=repr(future.exception()))
+            return
+        # the game may have been restarted or abandoned while searching, or the
+        # room handed over, in which case the new process searches again
+        if self.room.game is not game or self.room.room_id not in self.server.rooms:
+            return
+        if self.server.handing_over:
+            return
+        self.server.handle_move(self.room, {"column": future.result()}, self)
+
+class AsyncGameServer:
+    def __init__(self, host='localhost', port=5000, backlog=1024,
+                 bot_depth=8, bot_time_ms=500, bot_workers=None, opening_book=None,
+                 send_queue=256, slow_consumer='disconnect', send_timeout=5.0,
+                 resume_timeout=60.0, heartbeat_interval=10.0, idle_timeout=30.0,
+                 turn_timeout=0, game_log=None, worker=0, workers=1, coordinator=None,
+                 sock=None, metrics=None, drain_timeout=30.0, restart_socket=None, rules=None,
+                 max_message=1024, rate_limit=50, rate_burst=100):
+        self.host = host
+        self.port = port
+        # limits on what each client sends, checked before a message is parsed
+        self.max_message = max_message
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        # rules for players whose hello names none
+        self.rules = rules or STANDARD
+        self.backlog = backlog
+        self.server = None
+        # when sharded by launcher.py: this worker's index, the number of workers,
+        # the unix socket to the coordinator and the listening socket if shared
+        self.worker = worker
+        self.workers = workers
+        self.coordinator = coordinator
+        self.sock = sock
+        self.adopted = set()
+        # servers for any listening sockets besides self.sock taken over in a hot restart
+        self.extra_servers = []
+
+        # shutdown waits up to drain_timeout for games in progress; a new
+        # server started with the same restart_socket path takes over from this one
+        self.drain_timeout = drain_timeout
+        self.restart_socket = restart_socket
+        self.restart_listener = None
+        self.shutdown_task = None
+        self.draining = False
+        self.handing_over = False
+        # reader of every connection being handled, by writer
+        self.streams = {}
+        # queued players and unfinished handshakes set aside for a hand over
+        self.detached = []
+
+        self.send_queue = send_queue
+        self.slow_consumer = slow_consumer
+        self.send_timeout = send_timeout
+        self.resume_timeout = resume_timeout
+        self.sessions = {}
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.turn_timeout = turn_timeout
+        # one wheel driven by a single task instead of a loop timer per connection
+        self.wheel = TimerWheel()
+        self.game_log = game_log
+
+        self.bot_depth = bot_depth
+        self.bot_time_ms = bot_time_ms
+        self.bot_workers = bot_workers
+        self.bot_pool = None
+        self.opening_book_path = opening_book
+        self.opening_book = OpeningBook(opening_book) if opening_book else None
+
+        self.rooms = {}
+        self.ratings = RatingStore()
+        # one queue per set of rules asked for
+        self.matchmakers = {}
+        # rules the coordinator was told this worker has players queued for
+        self.hosting = set()
+        # room ids are unique across workers, a room lives on worker (id - 1) % workers
+        self.next_room_id = worker + 1
+        self.running = True
+
+        # open connections, players and spectators alike
+        self.connections = set()
+        self.metrics = metrics or Metrics(COUNTERS)
+        self.metrics.gauge("connections", lambda: len(self.connections))
+        self.metrics.gauge("rooms", lambda: len(self.rooms))
+        self.metrics.gauge("queued", self.queued)
+        self.metrics.gauge("send_queue_max", lambda: max(self.queue_depths(), default=0))
+        self.metrics.gauge("send_queue_total", lambda: sum(self.queue_depths()))
+        self.metrics.gauge("log_dropped", dropped_records)
+        # registered here, so the stats snapshot lists them before the first observation
+        self.metrics.histogram("relay_latency")
+        self.metrics.histogram("send_queue_depth", DEPTH_BUCKETS)
+        self.metrics.histogram("queue_wait", WAIT_BUCKETS)
+
+    def queue_depths(self):
+        return [len(client.sender.queue) for client in self.connections]
+
+    def sample_metrics(self):
+        # on schedule even if a sample fails
+        try:
+            self.metrics.sample()
+            depths = self.metrics.histogram("send_queue_depth")
+            for depth in self.queue_depths():
+                depths.observe(depth)
+        finally:
+            self.wheel.schedule(1.0, self.sample_metrics)
+
+    def get_bot_pool(self):
+        # searches are CPU bound, keep them off the event loop; 0 workers means threads
+        if self.bot_pool is None and self.bot_workers != 0:
+            self.bot_pool = ProcessPoolExecutor(self.bot_workers)
+        return self.bot_pool
+
+    def create_room(self, rules):
+        room = Room(self.next_room_id, rules)
+        self.next_room_id += self.workers
+        self.rooms[room.room_id] = room
+        return room
+
+    def take_seat(self, room, client):
+        client.player = room.free_player()
+        room.clients.append(client)
+        if not client.is_bot:
+            client.token = new_token()
+            if self.coordinator is not None:
+                # resumes land on any worker, the token says which one has the seat
+                client.token = f"{self.worker}.{client.token}"
+            self.sessions[client.token] = (room, client)
+
+    def start_bot_game(self, client):
+        room = self.create_room(client.rules)
+        self.take_seat(room, client)
+        self.take_seat(room, BotClient(self, room))
+        self.start_turn_timer(room)
+        return room
+
+    async def wait_for_match(self, client, reader, decoder):
+        # queue the player by rating; the room only exists once an opponent is found.
+        # the client is still read meanwhile: pings are answered and anything else is
+        # kept for the room. returns the room and those messages, or None, [] if the
+        # client left first
+        client.match = asyncio.get_running_loop().create_future()
+        rating = self.ratings.get(client.name)
+        matchmaker = self.matchmaker_for(client.rules)
+        ticket = matchmaker.join(client, rating)
+        self.update_hosting()
+        if client.match.done():
+            return client.match.result(), []
+
+        client.send(client.codec.encode({"type": "queued", "rating": round(rating)}))
+        messages = []
+        read = None
+        try:
+            while True:
+                read = asyncio.ensure_future(reader.read(RECV_SIZE))
+                await asyncio.wait((client.match, read), return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    # matched; a read finishing while it is cancelled still counts
+                    read.cancel()
+                    await asyncio.wait((read,))
+                if not read.cancelled():
+                    chunk = read.result()
+                    if not chunk:
+                        return (client.match.result(), messages) if client.match.done() else (None, [])
+                    client.last_seen = time.monotonic()
+                    for data in decoder.feed(chunk):
+                        self.metrics.count("messages_in")
+                        if data.get("type") == "ping":
+                            client.send(client.codec.encode({"type": "pong"}))
+                        else:
+                            messages.append(data)
+                if client.match.done():
+                    return client.match.result(), messages
+        finally:
+            if read is not None and not read.done():
+                read.cancel()
+            if not client.match.done():
+                matchmaker.cancel(ticket)
+                self.update_hosting()
+
+    def on_match(self, first, second):
+        room = self.create_room(first.player.rules)
+        now = time.monotonic()
+        for ticket in (first, second):
+            self.metrics.observe("queue_wait", now - ticket.joined)
+            self.take_seat(room, ticket.player)
+            ticket.player.match.set_result(room)
+        self.start_turn_timer(room)
+
+    def matchmaker_for(self, rules):
+        matchmaker = self.matchmakers.get(rules)
+        if matchmaker is None:
+            matchmaker = self.matchmakers[rules] = Matchmaker(self.on_match)
+        return matchmaker
+
+    def queued(self):
+        return sum(matchmaker.queued for matchmaker in self.matchmakers.values())
+
+    def sweep_queue(self):
+        for rules, matchmaker in list(self.matchmakers.items()):
+            matchmaker.sweep()
+            if not matchmaker.queued and rules != self.rules:
+                # queues for rarely played rules come and go with their players
+                del self.matchmakers[rules]
+        self.update_hosting()
+        self.wheel.schedule(1.0, self.sweep_queue)
+
+    def update_hosting(self):
+        hosting = {rules for rules, matchmaker in self.matchmakers.items() if matchmaker.queued}
+        # a seeker is only sent to a worker queueing players for the same rules
+        for rules in hosting - self.hosting:
+            self.notify_coordinator({"type": "hosting", "rules": rules.key()})
+        for rules in self.hosting - hosting:
+            self.notify_coordinator({"type": "unhosted", "rules": rules.key()})
+        self.hosting = hosting
+
+    def record_result(self, room):
+        # rate games between two named players
+        players = sorted(room.clients, key=lambda client: client.player)
+        if len(players) != 2 or any(client.is_bot or client.name is None for client in players):
+            return
+        score = {0: 0.5, 1: 1, 2: 0}[room.game.winner]
+        first, second = self.ratings.record(players[0].name, players[1].name, score)
+        log.info("ratings updated", room=room.room_id, first=players[0].name, first_rating=round(first),
+                 second=players[1].name, second_rating=round(second))
+
+    def resume_session(self, client, token):
+        entry = self.sessions.get(token)
+        if entry is None:
+            client.send(client.codec.encode({"type": "error", "reason": "session expired"}))
+            client.sender.finish()
+            return None
+
+        room, old = entry
+        if old.expiry is not None:
+            old.expiry.cancel()
+        if old.connected:
+            # the old connection is half open, the new one takes over
+            old.replaced = True
+            old.sender.close()
+
+        client.player = old.player
+        client.token = token
+        # the hello of a resume carries only the token, the rest is the seat's
+        client.name = old.name
+        client.rules = old.rules
+        room.clients[room.clients.index(old)] = client
+        self.sessions[token] = (room, client)
+        self.broadcast(room, {"type": "opponent_reconnected", "player": client.player}, exclude=client)
+        return room
+
+    def suspend_seat(self, room, client):
+        client.connected = False
+        client.expiry = self.wheel.schedule(self.resume_timeout, self.expire_seat, room, client)
+        self.broadcast(room, {"type": "opponent_disconnected", "player": client.player}, exclude=client)
+        self.check_drained()
+
+    def expire_seat(self, room, client):
+        # the opponent is told first, leaving then forfeits the game and closes the room
+        log.info("seat expired", room=room.room_id, player=client.player)
+        self.broadcast(room, {"type": "opponent_left", "player": client.player}, exclude=client)
+        self.leave_room(room, client)
+
+    def check_peer(self, client):
+        if client.sender.closed:
+            return
+        idle = time.monotonic() - client.last_seen
+        if idle >= self.idle_timeout:
+            log.info("idle client dropped", addr=client.addr, idle=round(idle))
+            self.metrics.count("idle_drops")
+            client.sender.close()
+            return
+        if idle >= self.heartbeat_interval:
+            client.send(client.codec.encode({"type": "ping"}))
+        self.wheel.schedule(self.heartbeat_interval, self.check_peer, client)
+
+    def start_turn_timer(self, room, delay=None):
+        if room.turn_timer is not None:
+            room.turn_timer.cancel()
+            room.turn_timer = None
+        if self.turn_timeout > 0 and not room.game.over:
+            room.turn_timer = self.wheel.schedule(self.turn_timeout if delay is None else delay,
+                                                  self.turn_expired, room, room.game,
+                                                  len(room.game.moves))
+
+    def turn_expired(self, room, game, moves):
+        if room.game is not game or game.over or len(game.moves) != moves:
+            return
+        if room.room_id not in self.rooms:
+            return
+        log.info("turn timed out", room=room.room_id, player=game.turn)
+        self.metrics.count("turn_timeouts")
+        game.forfeit(game.turn)
+        self.finish_game(room, "timeout")
+
+    def finish_game(self, room, reason=None):
+        log.info("game over", room=room.room_id, winner=room.game.winner,
+                 moves=len(room.game.moves), reason=reason)
+        self.metrics.count("games_finished")
+        self.record_result(room)
+        if self.game_log is not None:
+            self.game_log.append(room.game, room.room_id,
+                                 FLAG_TIMEOUT if reason in ("timeout", "forfeit") else 0)
+        message = {"type": "game_over", "winner": room.game.winner}
+        if reason is not None:
+            message["reason"] = reason
+        self.broadcast(room, message)
+        self.check_drained()
+
+    def find_room(self, room_id=None):
+        # the requested room, or the oldest game in progress
+        if room_id is not None:
+            return self.rooms.get(room_id)
+        for room in self.rooms.values():
+            if room.is_full():
+                return room
+        return None
+
+    def leave_room(self, room, client):
+        if client.spectator:
+            if client in room.spectators:
+                room.spectators.remove(client)
+            return
+
+        if client.token is not None:
+            self.sessions.pop(client.token, None)
+        # nobody takes the seat back: a game in progress is lost by the one who left,
+        # and a player left alone is not kept waiting in a room nobody can join
+        abandoned = (self.running and room.room_id in self.rooms and not client.is_bot
+                     and any(not other.is_bot for other in room.clients if other is not client))
+        if abandoned and room.is_full() and room.game.moves and not room.game.over:
+            room.game.forfeit(client.player)
+            self.finish_game(room, "forfeit")
+        if client in room.clients:
+            room.clients.remove(client)
+        if room.is_empty():
+            self.close_room(room)
+        elif abandoned:
+            self.close_room(room, "opponent_left")
+        self.check_drained()
+
+    def close_room(self, room, reason=None):
+        if room.turn_timer is not None:
+            room.turn_timer.cancel()
+        self.rooms.pop(room.room_id, None)
+        self.close_spectators(room, reason)
+        # players still seated were told with the spectators, their connections close too
+        for client in room.clients:
+            if client.is_bot:
+                continue
+            self.sessions.pop(client.token, None)
+            if client.expiry is not None:
+                client.expiry.cancel()
+            if client.connected:
+                client.sender.finish()
+        room.clients.clear()
+
+    def close_spectators(self, room, reason=None):
+        message = {"type": "room_closed", "room": room.room_id}
+        if reason is not None:
+            message["reason"] = reason
+        self.broadcast(room, message)
+        for spectator in room.spectators:
+            spectator.sender.finish()
+        room.spectators.clear()
+
+    def broadcast(self, room, message, exclude=None):
+        # encode once per codec in use, not once per client; every spectator
+        # using a codec shares the same bytes object
+        encoded = {}
+        for client in room.clients:
+            if client is exclude:
+                continue
+            data = encoded.get(client.codec.name)
+            if data is None:
+                data = encoded[client.codec.name] = client.codec.encode(message)
+            client.send(data)
+
+        for spectator in room.spectators:
+            data = encoded.get(spectator.codec.name)
+            if data is None:
+                data = encoded[spectator.codec.name] = spectator.codec.encode(message)
+            spectator.sender.send(data)
+        self.metrics.count("messages_out", len(room.clients) + len(room.spectators) - (exclude is not None))
+
+    def add_spectator(self, client, room_id):
+        room = self.find_room(room_id)
+        if room is None:
+            client.send(client.codec.encode({"type": "error", "reason": "no such room"}))
+            client.sender.finish()
+            return None
+
+        client.spectator = True
+        client.player = 0
+        room.spectators.append(client)
+        client.send(client.codec.encode({"type": "welcome", "player": 0, "rules": room.rules.to_dict()}))
+        client.send(client.codec.encode(room.snapshot()))
+        log.info("spectator connected", addr=client.addr, room=room.room_id, codec=client.codec.name)
+        return room
+
+    def new_buffer(self):
+        return MessageBuffer(self.max_message, make_bucket(self.rate_limit, self.rate_burst))
+
+    def new_decoder(self, codec):
+        return codec.decoder(self.max_message, make_bucket(self.rate_limit, self.rate_burst))
+
+    async def handshake(self, reader, buffer):
+        while True:
+            chunk = await reader.read(RECV_SIZE)
+            if not chunk:
+                return None, None, [], None
+            frames = buffer.feed(chunk)
+            if frames:
+                return accept_hello(buffer, frames)
+
+    def route(self, hello):
+        # the coordinator message that sends this connection to another worker,
+        # None to serve it here
+        if hello.get("role") == "spectator":
+            room_id = hello.get("room")
+            if type(room_id) is int and room_id > 0 and (room_id - 1) % self.workers != self.worker:
+                return {"type": "route", "worker": (room_id - 1) % self.workers}
+            return None
+        if hello.get("resume"):
+            worker = str(hello["resume"]).partition(".")[0]
+            if worker.isdigit() and int(worker) != self.worker:
+                return {"type": "route", "worker": int(worker)}
+            return None
+        try:
+            rules = rules_from_dict(hello.get("rules"), self.rules)
+        except ValueError:
+            # refused here
+            return None
+        matchmaker = self.matchmakers.get(rules)
+        if hello.get("opponent") != "ai" and (matchmaker is None or matchmaker.queued == 0):
+            # nobody waiting here, the coordinator knows who is waiting elsewhere
+            return {"type": "seek", "rules": rules.key()}
+        return None
+
+    def hand_off(self, writer, message):
+        # pass the socket itself to the coordinator, the client never notices
+        sock = writer.get_extra_info('socket')
+        try:
+            socket.send_fds(self.coordinator, [encode_message(message)], [sock.fileno()])
+        except OSError as e:
+            log.warning("hand off failed, serving here", error=e)
+            return False
+        writer.transport.abort()
+        return True
+
+    def notify_coordinator(self, message):
+        if self.coordinator is not None:
+            self.coordinator.send(encode_message(message))
+
+    def on_coordinator(self):
+        try:
+            data, fds, _, _ = socket.recv_fds(self.coordinator, RECV_SIZE, 1)
+        except BlockingIOError:
+            return
+        if not data:
+            log.error("coordinator is gone, stopping")
+            asyncio.get_running_loop().remove_reader(self.coordinator)
+            self.stop()
+            return
+
+        message = decode_message(data)
+        if message.get("type") == "adopt" and fds:
+            sock = socket.socket(fileno=fds[0])
+            self.spawn(self.adopt(sock, message["hello"]))
+
+    def spawn(self, coro):
+        # connection tasks started outside start_server, kept referenced until done
+        task = asyncio.create_task(coro)
+        self.adopted.add(task)
+        task.add_done_callback(self.adopted.discard)
+
+    async def adopt(self, sock, hello):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle_connection(reader, writer, hello)
+
+    async def handle_connection(self, reader, writer, hello=None, restored=None):
+        room = client = decoder = None
+        # set when the client broke the protocol or its limits, it is dropped without a flush
+        abusive = False
+        buffer = self.new_buffer()
+        self.streams[writer] = reader
+        try:
+            if restored is not None:
+                # seated player or spectator carried over from the previous process
+                client, room = restored
+                codec, decoder, messages = client.codec, self.new_decoder(client.codec), []
+                self.connections.add(client)
+            else:
+                if hello is None:
+                    codec, decoder, messages, hello = await self.handshake(reader, buffer)
+                    if codec is None:
+                        return
+                    message = self.route(hello) if self.coordinator is not None else None
+                    if message is not None and self.hand_off(writer, dict(message, hello=hello)):
+                        return
+                else:
+                    # handed over by another worker or process after its handshake
+                    codec = get_codec(hello.get("codec", "json"))
+                    decoder, messages = self.new_decoder(codec), []
+
+                sender = AsyncSender(writer, self.send_queue, self.slow_consumer, self.send_timeout)
+                client = Client(writer, codec, sender)
+                self.connections.add(client)
+                self.metrics.count("connections")
+                if hello.get("role") == "spectator":
+                    room = self.add_spectator(client, hello.get("room"))
+                    if room is None:
+                        return
+                else:
+                    if isinstance(hello.get("name"), str):
+                        client.name = hello["name"]
+                    try:
+                        client.rules = rules_from_dict(hello.get("rules"), self.rules)
+                    except ValueError as e:
+                        client.send(codec.encode({"type": "error", "reason": str(e)}))
+                        client.sender.finish()
+                        return
+                    if hello.get("opponent") == "ai" and client.rules.variant != "standard":
+                        client.send(codec.encode({"type": "error",
+                                                  "reason": "the ai only plays standard rules"}))
+                        client.sender.finish()
+                        return
+                    if hello.get("resume"):
+                        room = self.resume_session(client, hello["resume"])
+                        if room is None:
+                            return
+                    elif hello.get("opponent") == "ai":
+                        room = self.start_bot_game(client)
+                    else:
+                        room, received = await self.wait_for_match(client, reader, decoder)
+                        if room is None:
+                            return
+                        messages = messages + received
+
+                    welcome = welcome_message(client.player, client.token, self.heartbeat_interval,
+                                              room.rules)
+                    if hello.get("resume"):
+                        welcome["snapshot"] = room.snapshot()
+                    client.send(codec.encode(welcome))
+                    log.info("client connected", addr=client.addr, room=room.room_id, player=client.player,
+                             codec=codec.name, resumed=bool(hello.get("resume")))
+            if self.heartbeat_interval > 0:
+                self.wheel.schedule(self.heartbeat_interval, self.check_peer, client)
+
+            while self.running:
+                for data in messages:
+                    log.debug("message received", addr=client.addr, message=data)
+                    self.metrics.count("messages_in")
+                    if data.get("type") == "ping":
+                        client.send(codec.encode({"type": "pong"}))
+                    elif client.spectator:
+                        # spectators are read only
+                        continue
+                    elif data.get("type") == "restart":
+                        self.handle_restart_vote(room, data, client)
+                    elif data.get("type") == "move":
+                        self.handle_move(room, data, client)
+
+                if self.slow_consumer == "block":
+                    await self.wait_for_peers(room, client)
+                chunk = await reader.read(RECV_SIZE)
+                if not chunk:
+                    break
+                client.last_seen = time.monotonic()
+                messages = decoder.feed(chunk)
+
+        except RateLimited:
+            abusive = True
+            self.metrics.count("rate_limited")
+            log.warning("rate limited", addr=writer.get_extra_info('peername'))
+        except ProtocolError as e:
+            abusive = True
+            self.metrics.count("protocol_errors")
+            log.warning("protocol error", addr=writer.get_extra_info('peername'), error=e)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            log.info("connection lost", addr=writer.get_extra_info('peername'), error=e)
+        except Exception as e:
+            abusive = True
+            log.error("client handler failed", addr=writer.get_extra_info('peername'), error=repr(e))
+        finally:
+            del self.streams[writer]
+            if client is not None:
+                self.connections.discard(client)
+            if self.handing_over and reader.at_eof() and not writer.transport.is_closing():
+                # hand_over stopped the reading, the connection goes to the new process as is
+                pending = (decoder or buffer).take_remaining()
+                if room is not None and not client.replaced:
+                    client.pending = pending
+                else:
+                    self.detached.append((writer, client, hello, pending))
+            else:
+                if client is not None:
+                    log.info("client disconnected", addr=client.addr)
+                if room is not None and not client.replaced:
+                    if self.can_resume(room, client):
+                        self.suspend_seat(room, client)
+                    else:
+                        self.leave_room(room, client)
+                if client is not None and not client.sender.finishing:
+                    client.sender.close()
+                if abusive:
+                    # nothing more is owed to it, drop whatever it would still be sent
+                    writer.transport.abort()
+                else:
+                    writer.close()
+            if self.handing_over and not self.streams:
+                self.all_detached.set()
+
+    def can_resume(self, room, client):
+        # only seated players of a game in progress get to come back
+        return (self.running and self.resume_timeout > 0 and not client.spectator
+                and room.room_id in self.rooms and room.is_full())
+
+    async def wait_for_peers(self, room, client):
+        # backpressure: stop reading from this client while a peer is behind
+        for peer in room.clients:
+            if peer is not client and not peer.is_bot:
+                await peer.sender.wait_writable()
+
+    def handle_restart_vote(self, room, data, client):
+        vote = data.get("vote")
+        if vote not in ["YES", "NO"]:
+            return
+
+        # one vote per seat, and only once the game is decided
+        if not room.game.over or client.player in room.restart_votes:
+            log.debug("restart vote refused", room=room.room_id, player=client.player, vote=vote)
+            return
+        room.restart_votes[client.player] = vote
+        self.broadcast(room, {
+            "type": "vote_status",
+            "votes": vote_counts(room.restart_votes)
+        })
+
+        if len(room.restart_votes) == len(room.clients) == 2:
+            result = "YES" if all(v == "YES" for v in room.restart_votes.values()) else "NO"
+            self.broadcast(room, {
+                "type": "reset",
+                "result": result
+            })
+            room.reset_votes()
+
+            if result == "YES":
+                room.new_game()
+                self.start_turn_timer(room)
+                self.broadcast(room, {
+                    "type": "game_start",
+                    "turn": room.first_player - 1,
+                    "first_player": room.first_player
+                })
+
+    def handle_move(self, room, data, client):
+        column = data.get('column')
+        pop = bool(data.get('pop'))
+        try:
+            if not room.is_full():
+                raise InvalidMove("waiting for opponent")
+            room.game.play(column, client.player, pop)
+        except InvalidMove as e:
+            log.debug("move rejected", room=room.room_id, player=client.player, column=column, reason=e)
+            self.metrics.count("invalid_moves")
+            client.send(client.codec.encode({
+                "type": "invalid_move",
+                "column": column,
+                "reason": str(e)
+            }))
+            return
+
+        message = {
+            "type": "move",
+            "column": column,
+            "piece": client.player
+        }
+        if pop:
+            message["pop"] = True
+        self.broadcast(room, message, exclude=client)
+        self.start_turn_timer(room)
+        self.metrics.count("moves")
+        if not client.is_bot:
+            # time from the move arriving to its relay being handed to the senders
+            self.metrics.observe("relay_latency", time.monotonic() - client.last_seen)
+        log.debug("move relayed", room=room.room_id, player=client.player, column=column, pop=pop)
+
+        if room.game.over:
+            self.finish_game(room)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.all_detached = asyncio.Event()
+        listeners = []
+        if self.restart_socket is not None:
+            channel = handover.connect(self.restart_socket)
+            if channel is not None:
+                with channel:
+                    listeners = await self.take_over(channel)
+                self.sock = listeners[0]
+
+        if self.sock is not None:
+            self.server = await asyncio.start_server(self.handle_connection, sock=self.sock,
+                                                     backlog=self.backlog)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection,
+                                                     self.host, self.port,
+                                                     backlog=self.backlog,
+                                                     reuse_port=self.workers > 1)
+        for sock in listeners[1:]:
+            self.extra_servers.append(await asyncio.start_server(self.handle_connection, sock=sock,
+                                                                 backlog=self.backlog))
+        if self.coordinator is not None:
+            self.coordinator.setblocking(False)
+            loop.add_reader(self.coordinator, self.on_coordinator)
+        if self.restart_socket is not None:
+            self.restart_listener = handover.listen(self.restart_socket)
+            loop.add_reader(self.restart_listener, self.on_restart_request)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        log.info("server started", host=self.host, port=self.port, mode="async", worker=self.worker)
+        self.wheel_task = asyncio.create_task(self.run_wheel())
+        self.wheel.schedule(1.0, self.sweep_queue)
+        self.wheel.schedule(1.0, self.sample_metrics)
+        try:
+            await self.stopping.wait()
+        finally:
+            self.wheel_task.cancel()
+            self.close_listeners()
+
+    def close_listeners(self):
+        for server in [self.server] + self.extra_servers:
+            server.close()
+        if self.restart_listener is not None:
+            asyncio.get_running_loop().remove_reader(self.restart_listener)
+            self.restart_listener.close()
+            self.restart_listener = None
+            if not self.handing_over:
+                os.unlink(self.restart_socket)
+
+    def stop(self):
+        # the first signal drains the games in progress, a second one stops at once
+        if self.shutdown_task is None:
+            self.shutdown_task = asyncio.create_task(self.shutdown())
+        else:
+            self.drained.set()
+
+    def games_in_progress(self):
+        # a dropped player cannot come back once the listeners are closed
+        return sum(1 for room in self.rooms.values()
+                   if room.game.moves and not room.game.over
+                   and all(client.is_bot or client.connected for client in room.clients))
+
+    def check_drained(self):
+        if self.draining and not self.games_in_progress():
+            self.drained.set()
+
+    async def shutdown(self):
+        self.close_listeners()
+        if self.drain_timeout > 0 and self.games_in_progress():
+            log.info("waiting for games in progress", games=self.games_in_progress(),
+                     timeout=self.drain_timeout)
+            self.draining = True
+            try:
+                await asyncio.wait_for(self.drained.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        log.info("shutting down")
+        self.running = False
+        clients = list(self.connections)
+        for client in clients:
+            client.send(client.codec.encode({"type": "server_shutdown"}))
+            client.sender.finish()
+        if clients:
+            await asyncio.wait([client.sender.task for client in clients], timeout=self.send_timeout)
+        self.stopping.set()
+
+    def on_restart_request(self):
+        try:
+            channel, _ = self.restart_listener.accept()
+        except BlockingIOError:
+            return
+        if self.shutdown_task is not None:
+            # already stopping, the new server starts on its own once this one is gone
+            channel.close()
+            return
+        self.handing_over = True
+        self.shutdown_task = asyncio.create_task(self.hand_over(channel))
+
+    async def hand_over(self, channel):
+        log.info("handing over to a new process", rooms=len(self.rooms),
+                 connections=len(self.streams))
+        self.wheel_task.cancel()
+        # the listening sockets outlive the servers, new connections wait in the backlog
+        listeners = [socket.socket(fileno=os.dup(sock.fileno()))
+                     for server in [self.server] + self.extra_servers for sock in server.sockets]
+        self.close_listeners()
+        for writer, reader in self.streams.items():
+            writer.transport.pause_reading()
+            reader.feed_eof()
+        if self.streams:
+            await self.all_detached.wait()
+
+        # nothing runs on the connections anymore, flush what they were sent
+        clients = [client for room in self.rooms.values() for client in room.clients + room.spectators
+                   if not client.is_bot and client.connected]
+        clients += [client for _, client, _, _ in self.detached if client is not None]
+        flushed = await asyncio.gather(*(client.sender.detach() for client in clients))
+        for client, ok in zip(clients, flushed):
+            if not ok:
+                client.connected = False
+        if self.game_log is not None:
+            self.game_log.close()
+            self.game_log = None
+
+        channel.setblocking(True)
+        try:
+            self.send_state(channel, listeners)
+        except OSError as e:
+            log.error("hand over failed", error=e)
+        finally:
+            for sock in listeners:
+                sock.close()
+            # closes only this process' copy of each connection
+            for client in clients:
+                client.writer.transport.abort()
+            for writer, client, _, _ in self.detached:
+                if client is None:
+                    writer.transport.abort()
+            channel.close()
+        self.running = False
+        self.stopping.set()
+
+    def send_state(self, channel, listeners):
+        handover.send_part(channel, {"type": "server", "next_room_id": self.next_room_id},
+                           [sock.fileno() for sock in listeners])
+        ratings = list(self.ratings.ratings.items())
+        for part in handover.chunks(ratings, 1000):
+            handover.send_part(channel, {"type": "ratings", "ratings": dict(part)})
+
+        for room in self.rooms.values():
+            seats = []
+            fds = []
+            for client in room.clients:
+                seat = {"player": client.player}
+                if client.is_bot:
+                    seat["bot"] = True
+                else:
+                    seat.update(token=client.token, name=client.name, codec=client.codec.name,
+                                expires_in=self.time_left(client.expiry))
+                    if client.connected:
+                        seat.update(fd=len(fds), input=client.pending.hex())
+                        fds.append(client.writer.get_extra_info('socket').fileno())
+                seats.append(seat)
+            handover.send_part(channel, {
+                "type": "room",
+                "room": room.room_id,
+                "rules": room.rules.to_dict(),
+                "first_player": room.first_player,
+                "moves": room.game.moves,
+                "winner": room.game.winner,
+                # json keys are strings
+                "votes": {str(player): vote for player, vote in room.restart_votes.items()},
+                "turn_left": self.time_left(room.turn_timer),
+                "seats": seats,
+            }, fds)
+
+            spectators = [client for client in room.spectators if client.connected]
+            for part in handover.chunks(spectators):
+                handover.send_part(channel, {
+                    "type": "spectators",
+                    "room": room.room_id,
+                    "spectators": [{"codec": client.codec.name, "input": client.pending.hex()}
+                                   for client in part],
+                }, [client.writer.get_extra_info('socket').fileno() for client in part])
+
+        # queued players start over in the new queue, unfinished handshakes carry on
+        detached = [entry for entry in self.detached if entry[1] is None or entry[1].connected]
+        for part in handover.chunks(detached):
+            handover.send_part(channel, {
+                "type": "connections",
+                "connections": [{"hello": hello, "input": pending.hex()} for _, _, hello, pending in part],
+            }, [writer.get_extra_info('socket').fileno() for writer, _, _, _ in part])
+        handover.send_part(channel, {"type": "done"})
+
+    def time_left(self, timer):
+        if timer is None or timer.cancelled:
+            return None
+        return max(timer.deadline - self.wheel.clock(), 0)
+
+    async def take_over(self, channel):
+        # blocks until the old server sent everything, nothing is served meanwhile
+        log.info("taking over from the running server", path=self.restart_socket)
+        listeners = []
+        connections = []
+        bots = []
+        for message, socks in handover.receive_parts(channel):
+            msg_type = message["type"]
+            if msg_type == "server":
+                listeners = socks
+                self.next_room_id = message["next_room_id"]
+            elif msg_type == "ratings":
+                self.ratings.ratings.update(message["ratings"])
+            elif msg_type == "room":
+                room = await self.restore_room(message, socks, connections, bots)
+                self.rooms[room.room_id] = room
+            elif msg_type == "spectators":
+                room = self.rooms[message["room"]]
+                for entry, sock in zip(message["spectators"], socks):
+                    reader, client = await self.restore_client(sock, entry)
+                    client.spectator = True
+                    client.player = 0
+                    room.spectators.append(client)
+                    connections.append((reader, client, room))
+            elif msg_type == "connections":
+                for entry, sock in zip(message["connections"], socks):
+                    reader, writer = await asyncio.open_connection(sock=sock)
+                    reader.feed_data(bytes.fromhex(entry["input"]))
+                    self.spawn(self.handle_connection(reader, writer, entry["hello"]))
+
+        # the rooms are complete, their connections can start reading
+        for reader, client, room in connections:
+            self.spawn(self.handle_connection(reader, client.writer, restored=(client, room)))
+        for bot in bots:
+            bot.maybe_move()
+        log.info("took over", rooms=len(self.rooms), connections=len(connections))
+        return listeners
+
+    async def restore_room(self, state, socks, connections, bots):
+        room = Room(state["room"], rules_from_dict(state.get("rules")))
+        room.first_player = state["first_player"]
+        room.game = Game(first_player=room.first_player, rules=room.rules)
+        for move in state["moves"]:
+            room.game.replay(move)
+        if state["winner"] is not None and not room.game.over:
+            # lost on time
+            room.game.forfeit(2 if state["winner"] == 1 else 1)
+        room.restart_votes = {int(player): vote for player, vote in state["votes"].items()}
+
+        for seat in state["seats"]:
+            if seat.get("bot"):
+                client = BotClient(self, room)
+                bots.append(client)
+            elif "fd" in seat:
+                reader, client = await self.restore_client(socks[seat["fd"]], seat)
+                connections.append((reader, client, room))
+            else:
+                # away, or lost while the old process flushed it: the seat waits for a resume
+                client = Client(None, get_codec(seat["codec"]), None)
+                client.connected = False
+                expires_in = seat["expires_in"]
+                client.expiry = self.wheel.schedule(self.resume_timeout if expires_in is None else expires_in,
+                                                    self.expire_seat, room, client)
+            if not client.is_bot:
+                client.token = seat["token"]
+                client.name = seat["name"]
+                self.sessions[client.token] = (room, client)
+            client.player = seat["player"]
+            room.clients.append(client)
+
+        if state["turn_left"] is not None:
+            self.start_turn_timer(room, state["turn_left"])
+        return room
+
+    async def restore_client(self, sock, entry):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        # input the old process had read but not parsed yet
+        reader.feed_data(bytes.fromhex(entry["input"]))
+        sender = AsyncSender(writer, self.send_queue, self.slow_consumer, self.send_timeout)
+        return reader, Client(writer, get_codec(entry["codec"]), sender)
+
+    async def run_wheel(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            self.wheel.advance()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            log.info("shutting down")
+        finally:
+            self.running = False
+            for rules, matchmaker in self.matchmakers.items():
+                log.info("matchmaking stats", rules=rules, **matchmaker.stats())
+            if self.game_log is not None:
+                self.game_log.close()
+            if self.bot_pool is not None:
+                self.bot_pool.shutdown(cancel_futures=True)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Connect 4 game server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--mode', choices=['threaded', 'async'], default='threaded',
+                        help="threaded: one game per process, async: many rooms per process")
+    parser.add_argument('--bot-depth', type=int, default=8,
+                        help="maximum search depth of the AI opponent (async mode)")
+    parser.add_argument('--bot-time-ms', type=int, default=500,
+                        help="time budget per AI move in milliseconds, 0 for no limit")
+    parser.add_argument('--bot-workers', type=int, default=None,
+                        help="processes running AI searches, 0 to search in threads")
+    parser.add_argument('--opening-book', default=None,
+                        help="opening book file written by opening_book.py")
+    parser.add_argument('--rows', type=int, default=6,
+                        help="board height for players who do not ask for other rules")
+    parser.add_argument('--columns', type=int, default=7,
+                        help="board width for players who do not ask for other rules")
+    parser.add_argument('--connect', type=int, default=4,
+                        help="pieces in a row that win")
+    parser.add_argument('--variant', choices=VARIANTS, default='standard',
+                        help="standard, or popout where players may also pop their own bottom pieces")
+    parser.add_argument('--max-message', type=int, default=1024,
+                        help="largest message in bytes a client may send, larger ones drop it")
+    parser.add_argument('--rate-limit', type=float, default=50,
+                        help="messages per second a client may send on average, 0 for no limit")
+    parser.add_argument('--rate-burst', type=int, default=100,
+                        help="messages a client may send at once before --rate-limit applies")
+    parser.add_argument('--send-queue', type=int, default=256,
+                        help="messages queued per client before the slow consumer policy applies")
+    parser.add_argument('--slow-consumer', choices=SLOW_CONSUMER_POLICIES, default='disconnect',
+                        help="disconnect slow clients, or block their peers until they catch up")
+    parser.add_argument('--send-timeout', type=float, default=5.0,
+                        help="seconds a blocked peer waits before the slow client is dropped")
+    parser.add_argument('--resume-timeout', type=float, default=60.0,
+                        help="seconds a dropped player's seat is kept for it to reconnect, 0 to disable")
+    parser.add_argument('--heartbeat-interval', type=float, default=10.0,
+                        help="seconds of silence before a client is pinged, 0 to disable heartbeats")
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                        help="seconds of silence before a client is considered dead and dropped")
+    parser.add_argument('--turn-timeout', type=float, default=0,
+                        help="seconds a player has for each move before losing the game, 0 for no limit")
+    parser.add_argument('--game-log', default=None,
+                        help="append finished games to this file, see gamelog.py")
+    parser.add_argument('--log-batch', type=int, default=256,
+                        help="games buffered before the log writer wakes up")
+    parser.add_argument('--log-flush-interval', type=float, default=1.0,
+                        help="seconds a finished game may wait in memory before it is written")
+    parser.add_argument('--log-fsync', choices=FSYNC_POLICIES, default='none',
+                        help="fsync the log after every batch, or leave it to the OS")
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help="seconds games in progress get to finish on shutdown, a second signal skips the wait")
+    parser.add_argument('--restart-socket', default=None,
+                        help="unix socket path for hot restarts (async mode): a new server started "
+                             "with the same path takes over the listening socket, connections and rooms")
+    parser.add_argument('--log-level', choices=LEVELS, default='info',
+                        help="least severe events written to stdout, off to disable logging")
+    parser.add_argument('--log-format', choices=FORMATS, default='text',
+                        help="one key=value line or one JSON object per event")
+    parser.add_argument('--stats-port', type=int, default=None,
+                        help="serve counters and histograms as JSON over HTTP on this local port")
+    parser.add_argument('--stats-unix', default=None,
+                        help="serve the same stats on this unix socket path instead")
+    return parser
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+def open_game_log(args, path=None):
+    path = path or args.game_log
+    if not path:
+        return None
+    return GameLogWriter(path, batch_size=args.log_batch, flush_interval=args.log_flush_interval,
+                         fsync=args.log_fsync)
+
+def serve_stats(args, metrics, worker=None):
+    # workers each get their own endpoint: the next ports up, or the path suffixed
+    port, path = args.stats_port, args.stats_unix
+    if port is None and path is None:
+        return None
+    if worker is not None:
+        port = port + worker if port is not None else None
+        path = f"{path}.{worker}" if path is not None else None
+    server = start_stats_server(metrics, port=port, path=path)
+    log.info("stats endpoint started", port=port, path=path)
+    return server
+
+def rules_from_args(args):
+    try:
+        return get_rules(args.rows, args.columns, args.connect, args.variant)
+    except ValueError as e:
+        sys.exit(f"invalid rules: {e}")
+
+def make_async_server(args, **options):
+    if "game_log" not in options:
+        options["game_log"] = open_game_log(args)
+    return AsyncGameServer(args.host, args.port, bot_depth=args.bot_depth,
+                           bot_time_ms=args.bot_time_ms, bot_workers=args.bot_workers,
+                           opening_book=args.opening_book, send_queue=args.send_queue,
+                           slow_consumer=args.slow_consumer, send_timeout=args.send_timeout,
+                           resume_timeout=args.resume_timeout,
+                           heartbeat_interval=args.heartbeat_interval,
+                           idle_timeout=args.idle_timeout, turn_timeout=args.turn_timeout,
+                           drain_timeout=args.drain_timeout, restart_socket=args.restart_socket,
+                           rules=rules_from_args(args), max_message=args.max_message,
+                           rate_limit=args.rate_limit, rate_burst=args.rate_burst, **options)
+
 def main():
-    server = GameServer()
+    args = parse_args()
+    setup_logging(args.log_level, args.log_format)
+    if args.mode == 'async':
+        server = make_async_server(args)
+        serve_stats(args, server.metrics)
+        try:
+            server.run()
+        finally:
+            stop_logging()
+        return
+
+    server = GameServer(args.host, args.port, send_queue=args.send_queue,
+                        slow_consumer=args.slow_consumer, send_timeout=args.send_timeout,
+                        resume_timeout=args.resume_timeout,
+                        heartbeat_interval=args.heartbeat_interval, idle_timeout=args.idle_timeout,
+                        turn_timeout=args.turn_timeout, game_log=open_game_log(args),
+                        drain_timeout=args.drain_timeout, rules=rules_from_args(args),
+                        max_message=args.max_message, rate_limit=args.rate_limit,
+                        rate_burst=args.rate_burst)
+    serve_stats(args, server.metrics)
     
     def signal_handler(sig, frame):
-        print("\nclosing server...")
-        server.cleanup()
+        # a second signal while draining closes at once
+        log.info("closing server")
+        server.cleanup(drain=server.accepting)
+        stop_logging()
         os._exit(0)
         
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
     server.run()
+    stop_logging()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+# the modules live flat at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import get_codec, hello_message
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+class WireClient:
+    # blocking client speaking the wire protocol, for tests against a live server
+    def __init__(self, port, codec="json", timeout=5.0, send_hello=True, **hello):
+        self.sock = socket.create_connection(("localhost", port), timeout)
+        self.codec = get_codec(codec)
+        self.decoder = self.codec.decoder()
+        self.messages = []
+        if send_hello:
+            self.sock.sendall(hello_message(codec, **hello))
+
+    def send(self, message):
+        self.sock.sendall(self.codec.encode(message))
+
+    def send_raw(self, data):
+        self.sock.sendall(data)
+
+    def recv(self):
+        while not self.messages:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("closed by server")
+            self.messages.extend(self.decoder.feed(data))
+        return self.messages.pop(0)
+
+    def expect(self, kind):
+        # skips anything else, e.g. pings and vote updates
+        while True:
+            message = self.recv()
+            if message.get("type") == kind:
+                return message
+
+    def closed(self):
+        # true once the server closed the connection, skipping what it sent before
+        try:
+            while True:
+                if not self.sock.recv(65536):
+                    return True
+        except ConnectionResetError:
+            return True
+        except socket.timeout:
+            return False
+
+    def close(self):
+        self.sock.close()
+
+def wait_for_port(port, process, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            socket.create_connection(("localhost", port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+@pytest.fixture
+def start_server():
+    # starts server.py with the given options on a free port, returns the port
+    processes = []
+
+    def start(*options):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port),
+             "--log-level", "off", *options], cwd=ROOT,
+            # the threaded server reads commands from stdin and stops at its end
+            stdin=subprocess.PIPE)
+        processes.append(process)
+        wait_for_port(port, process)
+        return port
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+@pytest.fixture
+def clients():
+    opened = []
+
+    def connect(port, **options):
+        client = WireClient(port, **options)
+        opened.append(client)
+        return client
+
+    yield connect
+    for client in opened:
+        client.close()
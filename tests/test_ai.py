@@ -0,0 +1,88 @@
+import random
+import threading
+
+import ai
+from ai import WIN_SCORE, AIPlayer, evaluate, search_move
+from engine import Board
+
+def minimax(board, depth, piece):
+    # plain negamax without pruning or tables, the reference for the search
+    if depth == 0:
+        return evaluate(board, piece)
+    opponent = 2 if piece == 1 else 1
+    best = -WIN_SCORE - 1
+    for col in board.valid_moves():
+        board.drop_piece(col, piece)
+        if board.winning_move(piece):
+            score = WIN_SCORE - board.moves
+        elif board.is_full():
+            score = 0
+        else:
+            score = -minimax(board, depth - 1, opponent)
+        board.undo_piece(col, piece)
+        best = max(best, score)
+    return best
+
+def random_position(rng, rows, columns, plies):
+    while True:
+        board = Board(rows, columns)
+        piece = 1
+        for _ in range(plies):
+            col = rng.choice(board.valid_moves())
+            board.drop_piece(col, piece)
+            if board.winning_move(piece) or board.is_full():
+                break
+            piece = 2 if piece == 1 else 1
+        else:
+            return board, piece
+
+def test_root_search_matches_minimax():
+    rng = random.Random(6)
+    for _ in range(60):
+        board, piece = random_position(rng, 5, 5, rng.randrange(0, 10))
+        depth = rng.randrange(1, 5)
+        player = AIPlayer(max_depth=depth, time_ms=0)
+        score, move = player.search_root(board, depth, piece, board.valid_moves())
+        assert score == minimax(board, depth, piece)
+
+        # the move chosen must be worth that score too
+        board.drop_piece(move, piece)
+        if board.winning_move(piece):
+            value = WIN_SCORE - board.moves
+        elif board.is_full():
+            value = 0
+        else:
+            value = -minimax(board, depth - 1, 2 if piece == 1 else 1)
+        assert value == score
+
+def test_takes_a_win_and_blocks_one():
+    board = Board()
+    for col in (0, 0, 1, 1, 2, 2):
+        board.drop_piece(col, board.moves % 2 + 1)
+    player = AIPlayer(max_depth=4, time_ms=0)
+    assert player.choose_move(board, 1) == 3
+    assert player.choose_move(board, 2) == 3
+
+def test_table_tells_the_side_to_move_apart():
+    # a player reused across rooms meets the same stones with either colour to move
+    rng = random.Random(11)
+    for _ in range(40):
+        board, _ = random_position(rng, 5, 5, 2 * rng.randrange(0, 5))
+        warm = AIPlayer(max_depth=4, time_ms=0)
+        warm.search(board, 1)
+        assert warm.search(board, 2) == AIPlayer(max_depth=4, time_ms=0).search(board, 2)
+
+def test_each_thread_gets_its_own_player():
+    board = Board()
+    players = []
+
+    def search():
+        search_move(board, 1, 2, 0)
+        players.append(ai._local.players[(2, 0, None)])
+
+    threads = [threading.Thread(target=search) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert players[0] is not players[1]
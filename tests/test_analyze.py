@@ -0,0 +1,58 @@
+import random
+
+from analyze import analyse, scan_chunks
+from engine import Game
+from gamelog import FLAG_TIMEOUT, GameLogWriter
+from rules import get_rules
+
+def random_game(rng, rules):
+    game = Game(first_player=rng.choice((1, 2)), rules=rules)
+    while not game.over:
+        game.play(rng.choice(game.board.valid_moves()), game.turn)
+    return game
+
+def write_log(path, games):
+    writer = GameLogWriter(str(path), batch_size=16)
+    for game, flags in games:
+        writer.append(game, flags=flags)
+    writer.close()
+
+def test_replays_agree_with_the_engine(tmp_path):
+    rng = random.Random(7)
+    games = [random_game(rng, rules) for rules in
+             [get_rules()] * 40 + [get_rules(5, 5, 3)] * 20 + [get_rules(6, 8, 5)] * 20]
+    write_log(tmp_path / "games.log", [(game, 0) for game in games])
+
+    total, chunks = analyse([str(tmp_path / "games.log")], chunk_size=7, workers=0)
+    assert chunks == 12
+    assert total["games"] == 80
+    assert total["mismatches"] == 0 and total["illegal"] == 0 and total["skipped"] == 0
+    assert total["moves"] == sum(len(game.moves) for game in games)
+    assert total["first_wins"] == sum(game.winner == game.first_player for game in games)
+    assert total["draws"] == sum(game.winner == 0 for game in games)
+    assert sum(total["first_move_games"].values()) == 80
+
+def test_wrong_results_are_counted_unless_forfeited(tmp_path):
+    rng = random.Random(3)
+    wrong, forfeited = random_game(rng, get_rules()), random_game(rng, get_rules())
+    for game in (wrong, forfeited):
+        game.winner = 0 if game.winner else 1
+    popout = Game(rules=get_rules(variant="popout"))
+    popout.play(3, 1)
+    popout.forfeit(2)
+    # too big for a 64 bit board
+    large = random_game(rng, get_rules(8, 9, 5))
+    write_log(tmp_path / "games.log", [(wrong, 0), (forfeited, FLAG_TIMEOUT), (popout, FLAG_TIMEOUT),
+                                       (large, 0)])
+
+    total, _ = analyse([str(tmp_path / "games.log")], workers=0)
+    assert total["mismatches"] == 1
+    assert total["timeouts"] == 1
+    assert total["skipped"] == 2
+
+def test_chunks_hold_whole_records(tmp_path):
+    rng = random.Random(1)
+    write_log(tmp_path / "games.log", [(random_game(rng, get_rules()), 0) for _ in range(10)])
+    chunks = scan_chunks(str(tmp_path / "games.log"), 4)
+    assert len(chunks) == 3
+    assert all(first[2] == second[1] for first, second in zip(chunks, chunks[1:]))
@@ -0,0 +1,154 @@
+import json
+import time
+import urllib.request
+
+import pytest
+
+from conftest import free_port
+
+def pair(clients, port, **options):
+    first = clients(port, **options)
+    second = clients(port, **options)
+    seats = {}
+    for client in (first, second):
+        welcome = client.expect("welcome")
+        seats[welcome["player"]] = client
+    return seats[1], seats[2]
+
+@pytest.fixture
+def port(start_server):
+    return start_server("--mode", "async", "--bot-workers", "0")
+
+def test_moves_are_relayed(clients, port):
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    assert second.expect("move") == {"type": "move", "column": 3, "piece": 1}
+
+def stats(stats_port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{stats_port}/") as response:
+        return json.load(response)
+
+def wait_for_stats(stats_port, ready, timeout=5.0):
+    # the endpoint serves the last sample, taken once a second
+    deadline = time.monotonic() + timeout
+    while True:
+        snapshot = stats(stats_port)
+        if ready(snapshot) or time.monotonic() >= deadline:
+            return snapshot
+        time.sleep(0.05)
+
+def test_malformed_binary_frame_drops_only_that_client(clients, start_server):
+    stats_port = free_port()
+    port = start_server("--mode", "async", "--stats-port", str(stats_port))
+    first, second = pair(clients, port, codec="binary")
+    first.send_raw(bytes([2, 5]))
+    assert first.closed()
+    # refused as a protocol error, not a crash of the connection task
+    counters = wait_for_stats(stats_port, lambda snapshot: snapshot["counters"]["protocol_errors"])["counters"]
+    assert counters["protocol_errors"] == 1
+
+    # the server is still serving
+    third, fourth = pair(clients, port)
+    third.send({"type": "move", "column": 0})
+    assert fourth.expect("move")["column"] == 0
+
+def test_queue_waits_are_on_the_stats_endpoint(clients, start_server):
+    stats_port = free_port()
+    port = start_server("--mode", "async", "--stats-port", str(stats_port))
+    histograms = wait_for_stats(stats_port, lambda snapshot: snapshot["histograms"])["histograms"]
+    assert histograms["queue_wait"]["count"] == 0
+    pair(clients, port)
+    waits = wait_for_stats(stats_port, lambda snapshot: snapshot["histograms"]["queue_wait"]["count"])
+    assert waits["histograms"]["queue_wait"]["count"] == 2
+
+def test_player_left_alone_is_told_and_released(clients, start_server):
+    port = start_server("--mode", "async", "--resume-timeout", "0")
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+
+    # the game in progress is lost by the one who left, then the room closes
+    assert second.expect("game_over") == {"type": "game_over", "winner": 2, "reason": "forfeit"}
+    assert second.expect("room_closed")["reason"] == "opponent_left"
+    assert second.closed()
+
+def test_player_left_after_the_game_is_released(clients, start_server):
+    port = start_server("--mode", "async", "--resume-timeout", "0")
+    first, second = pair(clients, port)
+    for col in (0, 1, 0, 1, 0, 1):
+        (first if col == 0 else second).send({"type": "move", "column": col})
+        (second if col == 0 else first).expect("move")
+    first.send({"type": "move", "column": 0})
+    second.expect("game_over")
+    first.send({"type": "restart", "vote": "NO"})
+    first.close()
+    assert second.expect("room_closed")["reason"] == "opponent_left"
+
+def test_expired_seat_forfeits_and_releases_the_opponent(clients, start_server):
+    port = start_server("--mode", "async", "--resume-timeout", "1")
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+
+    assert second.expect("opponent_disconnected")["player"] == 1
+    assert second.expect("opponent_left")["player"] == 1
+    assert second.expect("game_over") == {"type": "game_over", "winner": 2, "reason": "forfeit"}
+    assert second.expect("room_closed")["reason"] == "opponent_left"
+    assert second.closed()
+
+def test_queued_player_is_read_while_waiting(clients, port):
+    first = clients(port)
+    first.expect("queued")
+    first.send({"type": "ping"})
+    assert first.expect("pong") == {"type": "pong"}
+    # a move sent before the match is played once the room exists
+    first.send({"type": "move", "column": 2})
+    second = clients(port)
+    assert first.expect("welcome")["player"] == 1
+    assert second.expect("move") == {"type": "move", "column": 2, "piece": 1}
+
+def test_players_are_matched_by_rules(clients, port):
+    popout = {"rows": 6, "columns": 7, "connect": 4, "variant": "popout"}
+    first = clients(port, rules=popout)
+    first.expect("queued")
+    standard = clients(port)
+    standard.expect("queued")
+    second = clients(port, rules=popout)
+    assert first.expect("welcome")["rules"] == popout
+    assert second.expect("welcome")["rules"] == popout
+    first.send({"type": "move", "column": 2})
+    second.expect("move")
+    second.send({"type": "move", "column": 2, "pop": True})
+    assert second.expect("invalid_move")["column"] == 2
+    second.send({"type": "move", "column": 3})
+    first.expect("move")
+    first.send({"type": "move", "column": 2, "pop": True})
+    assert second.expect("move") == {"type": "move", "column": 2, "piece": 1, "pop": True}
+
+def test_malformed_rules_are_refused(clients, port):
+    client = clients(port, rules={"rows": [1]})
+    assert client.expect("error")["reason"].startswith("invalid rules")
+    assert client.closed()
+
+def test_flooding_client_is_dropped(clients, start_server):
+    stats_port = free_port()
+    port = start_server("--mode", "async", "--rate-limit", "1", "--rate-burst", "5",
+                        "--stats-port", str(stats_port))
+    first, second = pair(clients, port)
+    first.send_raw(first.codec.encode({"type": "ping"}) * 20)
+    assert first.closed()
+    counters = wait_for_stats(stats_port, lambda snapshot: snapshot["counters"]["rate_limited"])["counters"]
+    assert counters["rate_limited"] == 1
+    # its opponent is still served
+    second.send({"type": "ping"})
+    assert second.expect("pong") == {"type": "pong"}
+
+def test_bot_answers_moves(clients, start_server):
+    port = start_server("--mode", "async", "--bot-workers", "0", "--bot-depth", "2")
+    player = clients(port, opponent="ai")
+    assert player.expect("welcome")["player"] == 1
+    player.send({"type": "move", "column": 3})
+    reply = player.expect("move")
+    assert reply["piece"] == 2 and 0 <= reply["column"] < 7
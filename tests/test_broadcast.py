@@ -0,0 +1,72 @@
+import asyncio
+import socket
+
+import pytest
+
+from broadcast import AsyncSender, ThreadedSender
+
+CHUNK = b"x" * 65536
+
+def read_all(sock):
+    sock.settimeout(5)
+    data = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+@pytest.fixture
+def conns():
+    server, client = socket.socketpair()
+    yield server, client
+    server.close()
+    client.close()
+
+def test_threaded_sender_delivers_in_order_then_finishes(conns):
+    server, client = conns
+    # more than the socket buffer holds, the rest waits in the queue
+    sender = ThreadedSender(server, max_queue=10000)
+    messages = [(b"%d" % i).rjust(99, b"x") + b"\n" for i in range(5000)]
+    for message in messages:
+        sender.send(message)
+    sender.finish()
+    assert read_all(client) == b"".join(messages)
+
+def test_threaded_sender_drops_a_client_that_does_not_read(conns):
+    server, client = conns
+    sender = ThreadedSender(server, max_queue=4)
+    for _ in range(100):
+        sender.send(CHUNK)
+        if sender.closed:
+            break
+    assert sender.closed
+    assert not sender.queue
+
+def test_blocking_policy_gives_up_after_the_timeout(conns):
+    server, client = conns
+    sender = ThreadedSender(server, max_queue=4, policy="block", timeout=0.1)
+    while sender.writable.is_set():
+        sender.send(CHUNK)
+    assert not sender.closed
+    sender.wait_writable()
+    assert sender.closed
+
+def test_unknown_policy_is_refused(conns):
+    with pytest.raises(ValueError):
+        ThreadedSender(conns[0], policy="wait")
+
+def test_async_sender_delivers_in_order_then_finishes(conns):
+    server, client = conns
+    messages = [(b"%d" % i).rjust(99, b"x") + b"\n" for i in range(5000)]
+
+    async def send():
+        received = asyncio.get_running_loop().run_in_executor(None, read_all, client)
+        _, writer = await asyncio.open_connection(sock=server)
+        sender = AsyncSender(writer, max_queue=10000)
+        for message in messages:
+            sender.send(message)
+        sender.finish()
+        return await received
+
+    assert asyncio.run(send()) == b"".join(messages)
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import deque
+
+# no window needed, pygame draws to memory
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+from connect4 import Connect4Game
+from protocol import get_codec
+
+class FakeSocket:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.sent = []
+
+    def sendall(self, data):
+        if self.broken:
+            raise ConnectionResetError("connection reset")
+        self.sent.append(data)
+
+def make_client(sock):
+    # only the networking state, no window
+    game = Connect4Game.__new__(Connect4Game)
+    game.client = sock
+    game.codec = get_codec("json")
+    game.send_lock = threading.Lock()
+    game.outbox = None
+    game.token = "token"
+    game.player_number = 1
+    game.incoming = deque()
+    return game
+
+def test_messages_sent_while_reconnecting_go_out_after_the_resume():
+    game = make_client(FakeSocket(broken=True))
+    move = {"type": "move", "column": 3, "piece": 1}
+    vote = {"type": "restart", "vote": "YES"}
+    game.send_message(move)
+    game.send_message(vote)
+    assert game.outbox == [move, vote]
+
+    game.client = FakeSocket()
+    snapshot = {"type": "snapshot", "moves": []}
+    game.flush_outbox(snapshot)
+    assert game.client.sent == [game.codec.encode(move), game.codec.encode(vote)]
+    # the move is played again over the snapshot, which does not have it yet
+    assert list(game.incoming) == [snapshot, move]
+    assert game.outbox is None
+
+    game.send_message(vote)
+    assert game.client.sent[-1] == game.codec.encode(vote)
+
+def test_unsent_messages_wait_for_the_next_resume():
+    game = make_client(FakeSocket(broken=True))
+    move = {"type": "move", "column": 3, "piece": 1}
+    game.send_message(move)
+    game.flush_outbox({"type": "snapshot", "moves": []})
+    assert game.outbox == [move]
+
+@pytest.fixture
+def players(start_server):
+    port = start_server()
+    opened = [Connect4Game(port=port), Connect4Game(port=port)]
+    yield opened
+    for game in opened:
+        game.client.close()
+    pygame.quit()
+
+def wait_for_messages(game):
+    deadline = time.monotonic() + 5
+    while not game.incoming and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_a_click_reaches_the_other_client(players):
+    first, second = players
+    assert first.my_turn and not second.my_turn
+    click = pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(3 * first.SQUARESIZE + 5, 5), button=1)
+    first.handle_game_events(click)
+    assert first.board.get_piece(0, 3) == 1 and not first.my_turn
+
+    # the receive thread only queues the move, the main thread applies it
+    wait_for_messages(second)
+    assert second.board.get_piece(0, 3) == 0
+    second.flush_display()
+    second.process_messages()
+    assert second.board.get_piece(0, 3) == 1 and second.my_turn
+    # only the new piece is redrawn
+    assert second.dirty_rects and not second.full_redraw
+    second.flush_display()
+    assert second.dirty_rects == []
@@ -0,0 +1,111 @@
+import pickle
+import random
+
+import pytest
+
+from engine import Board, Game, InvalidMove
+from rules import get_rules
+
+def has_line(rows, piece, connect):
+    # every cell and direction of the plain row lists, the reference for the bitboards
+    height, width = len(rows), len(rows[0])
+    for r in range(height):
+        for c in range(width):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                cells = [(r + dr * i, c + dc * i) for i in range(connect)]
+                if all(0 <= rr < height and 0 <= cc < width and rows[rr][cc] == piece
+                       for rr, cc in cells):
+                    return True
+    return False
+
+@pytest.mark.parametrize("rows, columns, connect", [(6, 7, 4), (5, 5, 3), (8, 9, 5), (4, 12, 4)])
+def test_win_checks_match_a_full_scan(rows, columns, connect):
+    rng = random.Random(rows * columns + connect)
+    for _ in range(50):
+        board = Board(rows, columns, connect)
+        piece = 1
+        while board.valid_moves():
+            col = rng.choice(board.valid_moves())
+            row = board.drop_piece(col, piece)
+            expected = has_line(board.to_rows(), piece, connect)
+            assert board.winning_move(piece) == expected
+            assert board.wins_at(row, col, piece) == expected
+            if expected:
+                break
+            piece = 2 if piece == 1 else 1
+
+def test_drop_and_undo():
+    board = Board()
+    assert board.drop_piece(3, 1) == 0
+    assert board.drop_piece(3, 2) == 1
+    assert board.get_piece(1, 3) == 2
+    board.undo_piece(3, 2)
+    assert board.get_piece(1, 3) == 0
+    assert board.moves == 1
+    assert board.get_next_open_row(3) == 1
+
+def test_full_column_is_not_valid():
+    board = Board(rows=2, columns=2)
+    board.drop_piece(0, 1)
+    board.drop_piece(0, 2)
+    assert not board.is_valid_location(0)
+    assert board.get_next_open_row(0) is None
+    assert board.valid_moves() == [1]
+    assert not board.is_valid_location(2)
+
+def test_pop_moves_the_column_down():
+    board = Board()
+    for piece in (1, 2, 1):
+        board.drop_piece(4, piece)
+    board.pop_piece(4)
+    assert [board.get_piece(row, 4) for row in range(4)] == [2, 1, 0, 0]
+    assert board.heights[4] == 2
+
+def test_copy_and_pickle_are_independent():
+    board = Board()
+    board.drop_piece(0, 1)
+    copy = board.copy()
+    copy.drop_piece(1, 2)
+    assert board.get_piece(0, 1) == 0
+    restored = pickle.loads(pickle.dumps(copy))
+    assert restored.to_rows() == copy.to_rows()
+    assert restored.lines is board.lines
+
+def test_keys_tell_positions_apart():
+    first, second = Board(), Board()
+    first.drop_piece(0, 1)
+    second.drop_piece(1, 1)
+    assert first.key(1) != second.key(1)
+    assert first.key(1) != first.key(2)
+
+def test_game_validates_moves():
+    game = Game()
+    with pytest.raises(InvalidMove, match="not your turn"):
+        game.play(0, 2)
+    for col in (-1, 7, "3", None, 2.0):
+        with pytest.raises(InvalidMove, match="illegal column"):
+            game.play(col, 1)
+    with pytest.raises(InvalidMove, match="popout"):
+        game.play(0, 1, pop=True)
+    assert game.moves == []
+
+def test_game_ends_on_a_win():
+    game = Game()
+    for col in (0, 1, 0, 1, 0, 1):
+        game.play(col, game.turn)
+    game.play(0, 1)
+    assert game.over and game.winner == 1
+    with pytest.raises(InvalidMove, match="game is over"):
+        game.play(2, 2)
+
+def test_full_board_is_a_draw():
+    game = Game(rules=get_rules(2, 3, 3))
+    for col in (0, 1, 2, 0, 1, 2):
+        game.play(col, game.turn)
+    assert game.over and game.winner == 0
+
+def test_forfeit_gives_the_game_to_the_other_player():
+    game = Game(first_player=2)
+    game.play(3, 2)
+    game.forfeit(1)
+    assert game.over and game.winner == 2
@@ -0,0 +1,65 @@
+import pytest
+
+from engine import Game
+from gamelog import (FLAG_POPOUT, FLAG_TIMEOUT, RECORD, GameLogReader, GameLogWriter,
+                     encode_game, record_connect, stream_games)
+from rules import POP, get_rules
+
+def played(moves, rules=None, first_player=1):
+    game = Game(first_player=first_player, rules=rules)
+    for move in moves:
+        game.replay(move)
+    return game
+
+def write(path, games, **options):
+    writer = GameLogWriter(str(path), **options)
+    for game in games:
+        writer.append(game, room=7)
+    writer.close()
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / "games.log"
+    first = played([3, 3, 4, 4, 5, 5, 6])
+    second = played([0, 1], first_player=2)
+    write(path, [first, second])
+
+    reader = GameLogReader(str(path))
+    records = list(reader)
+    assert [record.moves for record in records] == [bytes([3, 3, 4, 4, 5, 5, 6]), bytes([0, 1])]
+    assert records[0].winner == 1 and records[0].room == 7
+    assert records[1].first_player == 2 and records[1].winner == 0
+    assert reader.record_at(list(reader.offsets())[1]) == records[1]
+    reader.close()
+    assert list(stream_games(str(path), chunk_size=5)) == records
+
+def flags_of(record):
+    return RECORD.unpack_from(record)[6]
+
+def test_flags_hold_variant_and_line_length():
+    game = played([0, 1, 2, POP | 1], rules=get_rules(8, 9, 5, "popout"))
+    record = encode_game(game, flags=FLAG_TIMEOUT)
+    flags = flags_of(record)
+    assert flags & FLAG_TIMEOUT and flags & FLAG_POPOUT
+    assert record_connect(flags) == 5
+    assert record.endswith(bytes([0, 1, 2, POP | 1]))
+    assert record_connect(flags_of(encode_game(played([0])))) == 4
+
+def test_writer_cuts_off_a_torn_record(tmp_path):
+    path = tmp_path / "games.log"
+    write(path, [played([0, 1, 2])])
+    intact = path.stat().st_size
+    # a crash in the middle of the next record
+    with open(path, "ab") as f:
+        f.write(encode_game(played([4, 4, 4]))[:9])
+
+    write(path, [played([5, 6])])
+    reader = GameLogReader(str(path))
+    assert [record.moves for record in reader] == [bytes([0, 1, 2]), bytes([5, 6])]
+    reader.close()
+    assert path.stat().st_size == intact + len(encode_game(played([5, 6])))
+
+def test_writer_refuses_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a log at all")
+    with pytest.raises(ValueError):
+        GameLogWriter(str(path))
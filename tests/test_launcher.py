@@ -0,0 +1,99 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT, free_port, wait_for_port
+from launcher import Coordinator
+from protocol import RECV_SIZE, decode_message
+from test_async_server import pair
+
+STANDARD = [6, 7, 4, "standard"]
+POPOUT = [6, 7, 4, "popout"]
+
+@pytest.fixture
+def workers():
+    # the coordinator's ends and the workers' ends of two channels
+    ends = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(2)]
+    yield [parent for parent, _ in ends], [child for _, child in ends]
+    for parent, child in ends:
+        parent.close()
+        child.close()
+
+def passed_fd():
+    # a descriptor for the coordinator to hand over and close
+    first, second = socket.socketpair()
+    second.close()
+    return first.detach()
+
+def adopted(channel):
+    channel.settimeout(1)
+    data, fds, _, _ = socket.recv_fds(channel, RECV_SIZE, 1)
+    for fd in fds:
+        os.close(fd)
+    assert len(fds) == 1
+    return decode_message(data)
+
+def test_seek_waits_on_its_own_worker(workers):
+    parents, children = workers
+    coordinator = Coordinator(parents)
+    coordinator.handle(0, {"type": "seek", "rules": STANDARD, "hello": {"name": "a"}}, [passed_fd()])
+    assert coordinator.holders == {tuple(STANDARD): 0}
+    assert adopted(children[0]) == {"type": "adopt", "hello": {"name": "a"}}
+
+def test_seek_goes_to_the_waiting_room(workers):
+    parents, children = workers
+    coordinator = Coordinator(parents)
+    coordinator.handle(1, {"type": "hosting", "rules": STANDARD}, [])
+    coordinator.handle(0, {"type": "seek", "rules": STANDARD, "hello": {}}, [passed_fd()])
+    assert adopted(children[1])["type"] == "adopt"
+    assert coordinator.holders == {}
+
+def test_seek_only_joins_a_room_for_the_same_rules(workers):
+    parents, children = workers
+    coordinator = Coordinator(parents)
+    coordinator.handle(1, {"type": "hosting", "rules": STANDARD}, [])
+    coordinator.handle(0, {"type": "seek", "rules": POPOUT, "hello": {}}, [passed_fd()])
+    assert adopted(children[0])["type"] == "adopt"
+    assert coordinator.holders == {tuple(STANDARD): 1, tuple(POPOUT): 0}
+
+def test_route_to_an_unknown_worker_goes_back(workers):
+    parents, children = workers
+    coordinator = Coordinator(parents)
+    coordinator.handle(1, {"type": "route", "worker": 7, "hello": {}}, [passed_fd()])
+    assert adopted(children[1])["type"] == "adopt"
+
+def test_unhosted_only_clears_its_own_worker(workers):
+    parents, _ = workers
+    coordinator = Coordinator(parents)
+    coordinator.handle(1, {"type": "hosting", "rules": STANDARD}, [])
+    coordinator.handle(0, {"type": "unhosted", "rules": STANDARD}, [])
+    coordinator.handle(1, {"type": "unhosted", "rules": POPOUT}, [])
+    assert coordinator.holders == {tuple(STANDARD): 1}
+    coordinator.handle(1, {"type": "unhosted", "rules": STANDARD}, [])
+    assert coordinator.holders == {}
+
+@pytest.mark.skipif(not hasattr(socket, "send_fds"), reason="needs file descriptor passing")
+def test_workers_pair_players(clients):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "launcher.py"), "--port", str(port),
+         "--workers", "2", "--drain-timeout", "0", "--log-level", "off"], cwd=ROOT)
+    try:
+        wait_for_port(port, process)
+        for _ in range(3):
+            first, second = pair(clients, port)
+            first.send({"type": "move", "column": 3})
+            assert second.expect("move") == {"type": "move", "column": 3, "piece": 1}
+        # a player waiting for other rules does not keep the next pair apart
+        popout = clients(port, rules={"variant": "popout"})
+        popout.expect("queued")
+        first, second = pair(clients, port)
+        first.send({"type": "move", "column": 3})
+        assert second.expect("move") == {"type": "move", "column": 3, "piece": 1}
+    finally:
+        # the launcher stops its workers on the way out
+        process.terminate()
+        process.wait()
@@ -0,0 +1,20 @@
+import argparse
+import asyncio
+import os
+
+from loadtest import Stats, run_load
+
+def test_simulated_players_finish_their_games(start_server):
+    port = start_server("--mode", "async", "--rate-limit", "0")
+    args = argparse.Namespace(host="localhost", port=port, players=20, games=2, codec="binary",
+                              think_ms=0, disconnect_rate=0.0,
+                              # any live process will do to check when memory is sampled
+                              server_pid=os.getpid())
+    stats = Stats()
+    asyncio.run(run_load(args, stats))
+    assert stats.errors == 0
+    assert stats.games == 20
+    assert len(stats.setup_times) == 20
+    assert stats.moves == len(stats.relay_latencies)
+    # sampled once every pair was connected, before any game started
+    assert stats.open_connections == 20 and stats.rss_open > 0
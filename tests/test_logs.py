@@ -0,0 +1,46 @@
+import io
+import json
+
+import pytest
+
+import logs
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    yield stream
+    logs.stop_logging()
+
+def test_text_lines_carry_the_fields(output):
+    logs.setup_logging("info", stream=output)
+    log = logs.get_logger("test")
+    log.info("game over", room=3, winner=1)
+    log.debug("move relayed", column=2)
+    logs.stop_logging()
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith(" info connect4.test game over room=3 winner=1")
+
+def test_json_lines(output):
+    logs.setup_logging("debug", "json", stream=output)
+    logs.get_logger("test").warning("rate limited", addr=("127.0.0.1", 5000))
+    logs.stop_logging()
+    entry = json.loads(output.getvalue())
+    assert entry["level"] == "warning" and entry["event"] == "rate limited"
+    assert entry["logger"] == "connect4.test" and entry["addr"] == ["127.0.0.1", 5000]
+
+def test_off_writes_nothing(output):
+    logs.setup_logging("off", stream=output)
+    logs.get_logger("test").error("client handler failed")
+    logs.stop_logging()
+    assert output.getvalue() == ""
+
+def test_full_queue_drops_and_counts(output):
+    logs.setup_logging("info", stream=output, max_queue=1)
+    # keep the listener from draining the queue
+    logs.listener.stop()
+    logs.listener = None
+    log = logs.get_logger("test")
+    for index in range(5):
+        log.info("event", index=index)
+    assert logs.dropped_records() == 4
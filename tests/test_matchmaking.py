@@ -0,0 +1,69 @@
+import pytest
+
+from matchmaking import Matchmaker, RatingStore
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def make_matchmaker(clock, **options):
+    matches = []
+    matchmaker = Matchmaker(lambda first, second: matches.append((first.player, second.player)),
+                            clock=clock, **options)
+    return matchmaker, matches
+
+def test_close_ratings_pair_at_once(clock):
+    matchmaker, matches = make_matchmaker(clock)
+    matchmaker.join("a", 1500)
+    matchmaker.join("b", 1540)
+    assert matches == [("a", "b")]
+    assert matchmaker.queued == 0
+
+def test_window_widens_while_waiting(clock):
+    matchmaker, matches = make_matchmaker(clock, base_window=100, widen_rate=25)
+    matchmaker.join("a", 1500)
+    matchmaker.join("b", 1700)
+    assert matches == []
+    clock.now = 3
+    matchmaker.sweep()
+    assert matches == []
+    clock.now = 4
+    matchmaker.sweep()
+    assert matches == [("a", "b")]
+    assert matchmaker.keys == []
+
+def test_sweep_pairs_every_ticket_in_reach(clock):
+    # nobody is in reach when they join, but everyone is a second later
+    matchmaker, matches = make_matchmaker(clock, base_window=0, widen_rate=100)
+    for index, rating in enumerate((1000, 1010, 1020, 1030, 1300, 1310)):
+        matchmaker.join(index, rating)
+    assert matches == []
+    clock.now = 1
+    matchmaker.sweep()
+    assert sorted(matches) == [(0, 1), (2, 3), (4, 5)]
+    assert matchmaker.queued == 0
+
+def test_cancelled_tickets_are_skipped(clock):
+    matchmaker, matches = make_matchmaker(clock)
+    ticket = matchmaker.join("a", 1500)
+    matchmaker.cancel(ticket)
+    matchmaker.cancel(ticket)
+    assert matchmaker.queued == 0
+    matchmaker.join("b", 1500)
+    assert matches == []
+    matchmaker.join("c", 1500)
+    assert matches == [("b", "c")]
+
+def test_ratings_move_towards_the_result():
+    ratings = RatingStore()
+    first, second = ratings.record("a", "b", 1)
+    assert first == 1516 and second == 1484
+    assert ratings.get("a") == 1516
+    assert ratings.get("nobody") == 1500
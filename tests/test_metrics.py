@@ -0,0 +1,46 @@
+import json
+import urllib.request
+
+from conftest import free_port
+from metrics import Histogram, Metrics, start_stats_server
+
+def test_snapshot_serves_the_last_sample():
+    metrics = Metrics(["moves"])
+    metrics.count("moves")
+    assert metrics.snapshot()["counters"] == {"moves": 0}
+    metrics.sample()
+    metrics.count("moves")
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"moves": 1}
+    # the published copy is not the live dict
+    assert metrics.counters["moves"] == 2
+
+def test_gauges_are_read_when_sampled():
+    metrics = Metrics()
+    depth = [3]
+    metrics.gauge("depth", lambda: depth[0])
+    metrics.sample()
+    depth[0] = 5
+    assert metrics.snapshot()["gauges"] == {"depth": 3}
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = Histogram((1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.percentile(0.5) == 2
+    assert histogram.percentile(0.8) == 4
+    assert histogram.percentile(1.0) == float("inf")
+    assert histogram.snapshot()["buckets"] == {"1": 1, "2": 2, "4": 1, "inf": 1}
+
+def test_stats_server_serves_json():
+    metrics = Metrics(["moves"])
+    metrics.count("moves", 4)
+    metrics.sample()
+    port = free_port()
+    server = start_stats_server(metrics, port=port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/") as response:
+            assert json.load(response)["counters"] == {"moves": 4}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,23 @@
+import pytest
+
+from ai import AIPlayer
+from opening_book import (HEADER, MAGIC, OpeningBook, analyse_position, enumerate_positions,
+                          write_book)
+
+def test_book_holds_the_search_results(tmp_path):
+    path = str(tmp_path / "book.bin")
+    positions = enumerate_positions(4, 5, 2)
+    write_book(path, [analyse_position(position, 4, 0) for position in positions], 4, 5, 2)
+
+    book = OpeningBook(path)
+    try:
+        for board, piece in positions:
+            assert book.lookup(board, piece) == AIPlayer(4, 0).search(board, piece)
+    finally:
+        book.close()
+
+def test_old_books_are_refused(tmp_path):
+    path = tmp_path / "book.bin"
+    path.write_bytes(HEADER.pack(MAGIC, 1, 6, 7, 4, 1) + bytes(13))
+    with pytest.raises(ValueError, match="generate it again"):
+        OpeningBook(str(path))
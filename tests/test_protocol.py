@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from protocol import (BinaryCodec, JsonCodec, MessageBuffer, ProtocolError, accept_hello,
+                      get_codec, hello_message, parse_hello)
+
+MESSAGES = [
+    {"type": "move", "column": 3, "piece": 1},
+    {"type": "restart", "vote": "YES"},
+    {"type": "reset", "result": "NO"},
+    {"type": "game_start", "turn": 1, "first_player": 2},
+    {"type": "ping"},
+    {"type": "move", "column": 3, "piece": 1, "pop": True},
+    {"type": "snapshot", "moves": [3, 3, 4], "votes": {"YES": 1, "NO": 0}},
+]
+
+@pytest.mark.parametrize("codec", [JsonCodec(), BinaryCodec()])
+def test_round_trip_byte_by_byte(codec):
+    data = b"".join(codec.encode(message) for message in MESSAGES)
+    decoder = codec.decoder()
+    decoded = []
+    for i in range(len(data)):
+        decoded.extend(decoder.feed(data[i:i + 1]))
+    assert decoded == MESSAGES
+
+def test_binary_packs_common_messages():
+    assert BinaryCodec().encode({"type": "move", "column": 3, "piece": 1}) == bytes([1, 3, 1])
+
+@pytest.mark.parametrize("frame", [bytes([2, 5]), bytes([3, 2]), bytes([2, 255])])
+def test_binary_rejects_out_of_range_votes(frame):
+    with pytest.raises(ProtocolError):
+        BinaryCodec().decoder().feed(frame)
+
+def test_binary_rejects_unknown_tags_and_non_objects():
+    with pytest.raises(ProtocolError):
+        BinaryCodec().decoder().feed(bytes([99]))
+    with pytest.raises(ProtocolError):
+        BinaryCodec().decoder().feed(bytes([0xFF, 0, 3]) + b"[1]")
+
+def test_json_rejects_garbage_and_non_objects():
+    with pytest.raises(ProtocolError):
+        JsonCodec().decoder().feed(b"{nope\n")
+    with pytest.raises(ProtocolError):
+        JsonCodec().decoder().feed(b"[1, 2]\n")
+    with pytest.raises(ProtocolError):
+        JsonCodec().decoder().feed(b"\xff\xfe\n")
+
+def test_message_buffer_keeps_partial_frames():
+    buffer = MessageBuffer()
+    assert buffer.feed(b'{"a":1}\n{"b"') == [b'{"a":1}']
+    assert buffer.feed(b':2}\n\n') == [b'{"b":2}']
+    assert buffer.pending() == 0
+
+def test_hello_negotiates_codec_and_keeps_early_bytes():
+    buffer = MessageBuffer()
+    frames = buffer.feed(hello_message("binary", name="ann") + bytes([7]))
+    codec, decoder, messages, hello = accept_hello(buffer, frames)
+    assert codec is get_codec("binary")
+    assert hello["name"] == "ann"
+    assert messages == [{"type": "ping"}]
+
+@pytest.mark.parametrize("options", [{"codec": ["json"]}, {"room": "3"}, {"resume": 12},
+                                     {"rules": [6, 7]}, {"name": {}}])
+def test_hello_fields_must_have_their_type(options):
+    with pytest.raises(ProtocolError):
+        parse_hello(json.dumps(dict({"type": "hello", "codec": "json"}, **options)).encode())
+
+def test_unknown_codec_is_a_protocol_error():
+    with pytest.raises(ProtocolError):
+        parse_hello(hello_message("morse").strip())
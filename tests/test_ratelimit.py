@@ -0,0 +1,53 @@
+import pytest
+
+from protocol import BinaryCodec, MessageBuffer, ProtocolError, RateLimited, encode_message
+from ratelimit import TokenBucket, make_bucket
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_allows_a_burst_then_the_rate():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert bucket.take()
+    assert not bucket.take()
+    # an idle bucket refills up to its burst, no further
+    clock.now += 60
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+def test_zero_rate_turns_limiting_off():
+    assert make_bucket(0, 10) is None
+    assert make_bucket(5, 0).burst == 1
+
+def test_buffer_charges_one_token_per_frame():
+    clock = Clock()
+    buffer = MessageBuffer(1024, TokenBucket(rate=1, burst=2, clock=clock))
+    ping = encode_message({"type": "ping"})
+    assert len(buffer.feed(ping * 2 + b"\n\n")) == 2
+    with pytest.raises(RateLimited):
+        buffer.feed(ping)
+
+def test_oversized_frames_are_refused_before_parsing():
+    buffer = MessageBuffer(16)
+    with pytest.raises(ProtocolError, match="too large"):
+        buffer.feed(b"x" * 17 + b"\n")
+    # a partial frame may not grow past the limit either
+    buffer = MessageBuffer(16)
+    buffer.feed(b"x" * 16)
+    with pytest.raises(ProtocolError, match="too large"):
+        buffer.feed(b"x")
+
+def test_binary_decoder_is_rate_limited():
+    clock = Clock()
+    codec = BinaryCodec()
+    decoder = codec.decoder(1024, TokenBucket(rate=1, burst=1, clock=clock))
+    move = codec.encode({"type": "move", "column": 3, "piece": 1})
+    assert len(decoder.feed(move)) == 1
+    with pytest.raises(RateLimited):
+        decoder.feed(move)
@@ -0,0 +1,49 @@
+import pytest
+
+from test_async_server import pair
+
+MODES = ["threaded", "async"]
+
+def play_to_a_win(first, second):
+    for _ in range(3):
+        first.send({"type": "move", "column": 0})
+        second.expect("move")
+        second.send({"type": "move", "column": 1})
+        first.expect("move")
+    first.send({"type": "move", "column": 0})
+    first.expect("game_over")
+    second.expect("game_over")
+
+@pytest.mark.parametrize("mode", MODES)
+def test_votes_during_a_game_are_ignored(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    second.send({"type": "restart", "vote": "YES"})
+    second.send({"type": "restart", "vote": "YES"})
+    second.send({"type": "move", "column": 3})
+    # the game goes on, the next thing the opponent hears is the move
+    assert first.recv() == {"type": "move", "column": 3, "piece": 2}
+
+@pytest.mark.parametrize("mode", MODES)
+def test_each_player_votes_once(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    first, second = pair(clients, port)
+    play_to_a_win(first, second)
+    first.send({"type": "restart", "vote": "YES"})
+    assert second.expect("vote_status")["votes"] == {"YES": 1, "NO": 0}
+    first.send({"type": "restart", "vote": "YES"})
+    second.send({"type": "restart", "vote": "NO"})
+    assert second.expect("vote_status")["votes"] == {"YES": 1, "NO": 1}
+    assert second.expect("reset") == {"type": "reset", "result": "NO"}
+
+@pytest.mark.parametrize("mode", MODES)
+def test_rematch_when_both_agree(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    first, second = pair(clients, port)
+    play_to_a_win(first, second)
+    first.send({"type": "restart", "vote": "YES"})
+    second.send({"type": "restart", "vote": "YES"})
+    assert first.expect("reset") == {"type": "reset", "result": "YES"}
+    assert first.expect("game_start")["first_player"] == 2
@@ -0,0 +1,73 @@
+import pytest
+
+from test_restart import play_to_a_win
+
+MODES = ["threaded", "async"]
+
+def seated_pair(clients, port):
+    # the first player's welcome, and both clients in seat order
+    first = clients(port)
+    # welcome on the threaded server, queued on the async one
+    welcome = first.recv()
+    second = clients(port)
+    if welcome["type"] != "welcome":
+        welcome = first.expect("welcome")
+    second.expect("welcome")
+    return welcome, first, second
+
+@pytest.mark.parametrize("mode", MODES)
+def test_dropped_player_resumes_the_game(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    welcome, first, second = seated_pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+    assert second.expect("opponent_disconnected")["player"] == 1
+
+    resumed = clients(port, resume=welcome["token"])
+    welcome = resumed.expect("welcome")
+    assert welcome["player"] == 1
+    assert welcome["snapshot"]["moves"] == [3]
+    assert second.expect("opponent_reconnected")["player"] == 1
+    second.send({"type": "move", "column": 4})
+    assert resumed.expect("move") == {"type": "move", "column": 4, "piece": 2}
+
+@pytest.mark.parametrize("mode", MODES)
+def test_unknown_session_is_refused(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    client = clients(port, resume="0" * 32)
+    assert client.expect("error")["reason"] == "session expired"
+
+@pytest.mark.parametrize("mode", MODES)
+def test_resume_takes_over_a_half_open_connection(clients, start_server, mode):
+    port = start_server("--mode", mode)
+    welcome, first, second = seated_pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+
+    # the first connection is still registered when its player comes back
+    resumed = clients(port, resume=welcome["token"])
+    welcome = resumed.expect("welcome")
+    assert welcome["player"] == 1
+    assert welcome["snapshot"]["moves"] == [3]
+    assert second.expect("opponent_reconnected")["player"] == 1
+    assert first.closed()
+    second.send({"type": "move", "column": 4})
+    assert resumed.expect("move") == {"type": "move", "column": 4, "piece": 2}
+
+def test_resumed_player_keeps_its_name_and_the_game_is_rated(clients, start_server):
+    port = start_server("--mode", "async")
+    first = clients(port, name="ann")
+    first.expect("queued")
+    second = clients(port, name="bob")
+    welcome = first.expect("welcome")
+    second.expect("welcome")
+    first.close()
+    second.expect("opponent_disconnected")
+
+    resumed = clients(port, resume=welcome["token"])
+    resumed.expect("welcome")
+    second.expect("opponent_reconnected")
+    play_to_a_win(resumed, second)
+    # the winner's rating went up, so the name was carried over
+    assert clients(port, name="ann").expect("queued")["rating"] > 1500
@@ -0,0 +1,86 @@
+import pytest
+
+from engine import Game, InvalidMove
+from rules import POP, STANDARD, Rules, column_lines, get_rules, rules_from_dict, win_lines
+
+@pytest.mark.parametrize("options", [
+    {"rows": 0}, {"columns": 21}, {"rows": "6"}, {"connect": 1}, {"connect": 8},
+    {"variant": "gravity"},
+])
+def test_invalid_rules_are_refused(options):
+    with pytest.raises(ValueError):
+        Rules(**options)
+
+def test_rules_from_dict_fills_in_the_default():
+    rules = rules_from_dict({"variant": "popout"}, get_rules(8, 9, 5))
+    assert rules.to_dict() == {"rows": 8, "columns": 9, "connect": 5, "variant": "popout"}
+    assert rules_from_dict(None) is STANDARD
+    assert rules_from_dict({"rows": 6}) == STANDARD
+    with pytest.raises(ValueError):
+        rules_from_dict(["rows", 6])
+
+@pytest.mark.parametrize("options", [
+    {"rows": [1]}, {"columns": {"a": 1}}, {"connect": None}, {"variant": ["popout"]},
+])
+def test_unhashable_rules_are_refused(options):
+    with pytest.raises(ValueError):
+        rules_from_dict(options)
+
+def test_line_tables():
+    lines = win_lines(6, 7, 4)
+    # 24 horizontal, 21 vertical and 12 of each diagonal
+    assert len({mask for masks in lines for mask in masks}) == 69
+    # the bottom left corner has one line each way but down-right
+    assert len(lines[0]) == 3
+    # the extra bit on top of each column is never part of a line
+    assert lines[6] == ()
+    assert all(mask.bit_count() == 4 for masks in lines for mask in masks)
+    # one horizontal per row, three vertical and three of each diagonal
+    assert len(column_lines(6, 7, 4)[0]) == 6 + 3 + 3 + 3
+
+def popout(*moves):
+    game = Game(rules=get_rules(variant="popout"))
+    for move in moves:
+        game.replay(move)
+    return game
+
+def test_only_your_own_bottom_piece_pops():
+    game = popout(0, 1)
+    with pytest.raises(InvalidMove, match="no piece of yours"):
+        game.play(1, 1, pop=True)
+    with pytest.raises(InvalidMove, match="no piece of yours"):
+        game.play(2, 1, pop=True)
+    game.play(0, 1, pop=True)
+    assert game.moves == [0, 1, POP | 0]
+    assert game.board.heights[0] == 0
+
+def test_pop_completing_both_lines_wins_for_the_popper():
+    # popping the 1 from the bottom of column 3 completes row 0 for 2 and row 2 for 1
+    game = Game(rules=get_rules(variant="popout"))
+    board = game.board
+    for col, piece in ((3, 1), (3, 2), (3, 2), (3, 1)):
+        board.drop_piece(col, piece)
+    for col in (0, 1, 2):
+        board.drop_piece(col, 2)
+        board.drop_piece(col, 2 if col else 1)
+        board.drop_piece(col, 1)
+    for col in (4, 5, 6):
+        board.drop_piece(col, 2)
+    game.play(3, 1, pop=True)
+    assert game.over and game.winner == 1
+
+def test_full_board_is_not_a_draw_in_popout():
+    game = Game(rules=get_rules(2, 3, 3, "popout"))
+    for col in (0, 1, 2, 0, 1, 2):
+        game.play(col, game.turn)
+    assert game.board.is_full() and not game.over
+    game.play(0, 1, pop=True)
+    assert game.turn == 2
+
+def test_third_repetition_is_a_draw():
+    cycle = (0, 1, POP | 0, POP | 1)
+    game = popout(*cycle, *cycle)
+    assert not game.over
+    # the position after the first move of the cycle comes up a third time
+    game.replay(cycle[0])
+    assert game.over and game.winner == 0
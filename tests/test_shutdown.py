@@ -0,0 +1,62 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT, free_port, wait_for_port
+from test_async_server import pair
+
+@pytest.fixture
+def spawn():
+    # server processes the test signals itself
+    processes = []
+
+    def start(port, *options):
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port),
+             "--log-level", "off", *options], cwd=ROOT, stdin=subprocess.PIPE)
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+
+def test_shutdown_lets_the_game_finish(clients, spawn):
+    port = free_port()
+    server = spawn(port, "--mode", "async", "--drain-timeout", "10")
+    wait_for_port(port, server)
+    first, second = pair(clients, port)
+    server.send_signal(signal.SIGTERM)
+    for _ in range(3):
+        first.send({"type": "move", "column": 0})
+        second.expect("move")
+        second.send({"type": "move", "column": 1})
+        first.expect("move")
+    first.send({"type": "move", "column": 0})
+    assert second.expect("game_over")["winner"] == 1
+    assert first.expect("server_shutdown") == {"type": "server_shutdown"}
+    assert second.expect("server_shutdown") == {"type": "server_shutdown"}
+    assert first.closed()
+    assert server.wait(5) == 0
+
+def test_hot_restart_keeps_the_game(clients, spawn, tmp_path):
+    port = free_port()
+    options = ("--mode", "async", "--restart-socket", str(tmp_path / "restart"))
+    old = spawn(port, *options)
+    wait_for_port(port, old)
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+
+    spawn(port, *options)
+    # the old process exits once the new one has everything
+    old.wait(10)
+    second.send({"type": "move", "column": 4})
+    assert first.expect("move") == {"type": "move", "column": 4, "piece": 2}
+    third, fourth = pair(clients, port)
+    third.send({"type": "move", "column": 0})
+    assert fourth.expect("move")["column"] == 0
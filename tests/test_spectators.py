@@ -0,0 +1,34 @@
+import pytest
+
+from test_async_server import pair
+
+@pytest.fixture
+def port(start_server):
+    return start_server("--mode", "async")
+
+def test_spectator_catches_up_then_follows(clients, port):
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+
+    spectator = clients(port, role="spectator", room=1)
+    assert spectator.expect("welcome")["player"] == 0
+    snapshot = spectator.expect("snapshot")
+    assert snapshot["moves"] == [3] and snapshot["room"] == 1
+    second.send({"type": "move", "column": 4})
+    assert spectator.expect("move") == {"type": "move", "column": 4, "piece": 2}
+
+def test_spectators_are_read_only(clients, port):
+    first, second = pair(clients, port)
+    spectator = clients(port, role="spectator")
+    spectator.expect("snapshot")
+    spectator.send({"type": "move", "column": 0})
+    spectator.send({"type": "ping"})
+    assert spectator.expect("pong") == {"type": "pong"}
+    first.send({"type": "move", "column": 1})
+    assert second.expect("move")["column"] == 1
+
+def test_unknown_room_is_refused(clients, port):
+    spectator = clients(port, role="spectator", room=99)
+    assert spectator.expect("error")["reason"] == "no such room"
+    assert spectator.closed()
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import free_port
+from server import GameServer
+from test_async_server import pair, wait_for_stats
+
+def test_moves_are_relayed(clients, start_server):
+    port = start_server()
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    assert second.expect("move") == {"type": "move", "column": 3, "piece": 1}
+
+def test_third_player_is_refused(clients, start_server):
+    port = start_server()
+    pair(clients, port)
+    assert clients(port).expect("full") == {"type": "full"}
+
+def test_empty_server_starts_a_new_game(clients, start_server):
+    stats_port = free_port()
+    port = start_server("--resume-timeout", "0", "--stats-port", str(stats_port))
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+    second.close()
+    wait_for_stats(stats_port, lambda snapshot: snapshot["gauges"].get("clients") == 0)
+
+    first = clients(port)
+    welcome = first.expect("welcome")
+    assert welcome["player"] == 1
+    assert "snapshot" not in welcome
+    second = clients(port)
+    second.expect("welcome")
+    first.send({"type": "move", "column": 0})
+    assert second.expect("move") == {"type": "move", "column": 0, "piece": 1}
+
+def test_server_refuses_moves_and_calls_the_win(clients, start_server):
+    port = start_server()
+    first, second = pair(clients, port)
+    second.send({"type": "move", "column": 0})
+    assert second.expect("invalid_move") == {"type": "invalid_move", "column": 0,
+                                             "reason": "not your turn"}
+    for _ in range(3):
+        first.send({"type": "move", "column": 0})
+        second.expect("move")
+        second.send({"type": "move", "column": 1})
+        first.expect("move")
+    first.send({"type": "move", "column": 0})
+    assert second.expect("game_over") == {"type": "game_over", "winner": 1}
+    assert first.expect("game_over") == {"type": "game_over", "winner": 1}
+
+def test_frames_split_across_reads(clients, start_server):
+    port = start_server()
+    first, second = pair(clients, port)
+    data = first.codec.encode({"type": "move", "column": 5}) + first.codec.encode({"type": "ping"})
+    for byte in data:
+        first.send_raw(bytes([byte]))
+    assert second.expect("move") == {"type": "move", "column": 5, "piece": 1}
+    assert first.expect("pong") == {"type": "pong"}
+
+def test_oversized_message_drops_the_client(clients, start_server):
+    port = start_server("--max-message", "64")
+    first, second = pair(clients, port)
+    first.send_raw(b"{" + b" " * 100)
+    assert first.closed()
+
+def test_dropped_player_forfeits_and_the_room_is_closed(clients, start_server):
+    port = start_server("--resume-timeout", "0")
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+    assert second.expect("opponent_left")["player"] == 1
+    assert second.expect("game_over") == {"type": "game_over", "winner": 2, "reason": "forfeit"}
+    assert second.expect("room_closed")["reason"] == "opponent_left"
+    assert second.closed()
+
+    # a newcomer starts a game of their own
+    newcomer = clients(port)
+    welcome = newcomer.expect("welcome")
+    assert welcome["player"] == 1 and "snapshot" not in welcome
+
+def test_expired_seat_forfeits_and_the_room_is_closed(clients, start_server):
+    port = start_server("--resume-timeout", "1")
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    first.close()
+    assert second.expect("opponent_disconnected")["player"] == 1
+    assert second.expect("opponent_left")["player"] == 1
+    assert second.expect("game_over")["reason"] == "forfeit"
+    assert second.expect("room_closed")["reason"] == "opponent_left"
+    assert second.closed()
+
+def test_metrics_are_sampled_again_after_a_failure():
+    server = GameServer(port=0)
+    try:
+        # observed from client threads, so they exist before the first sample
+        assert {"relay_latency", "send_queue_depth"} <= set(server.metrics.histograms)
+        server.metrics.gauge("broken", lambda: 1 / 0)
+        scheduled = []
+        server.wheel = SimpleNamespace(schedule=lambda delay, callback: scheduled.append(callback))
+        with pytest.raises(ZeroDivisionError):
+            server.sample_metrics()
+        assert scheduled == [server.sample_metrics]
+    finally:
+        server.server.close()
@@ -0,0 +1,24 @@
+import pytest
+
+from test_async_server import pair
+
+MODES = ["threaded", "async"]
+
+@pytest.mark.parametrize("mode", MODES)
+def test_silent_client_is_pinged_then_dropped(clients, start_server, mode):
+    port = start_server("--mode", mode, "--heartbeat-interval", "0.5", "--idle-timeout", "1.5")
+    first, second = pair(clients, port)
+    assert first.expect("ping") == {"type": "ping"}
+    first.send({"type": "pong"})
+    # the pong counts as a sign of life, silence after it does not
+    assert first.expect("ping") == {"type": "ping"}
+    assert first.closed()
+
+@pytest.mark.parametrize("mode", MODES)
+def test_slow_player_loses_on_time(clients, start_server, mode):
+    port = start_server("--mode", mode, "--turn-timeout", "1")
+    first, second = pair(clients, port)
+    first.send({"type": "move", "column": 3})
+    second.expect("move")
+    assert second.expect("game_over") == {"type": "game_over", "winner": 1, "reason": "timeout"}
+    assert first.expect("game_over")["winner"] == 1
@@ -0,0 +1,70 @@
+from timers import TimerWheel
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def make_wheel(**options):
+    clock = Clock()
+    return TimerWheel(clock=clock, **options), clock
+
+def test_timer_fires_after_its_deadline():
+    wheel, clock = make_wheel(tick=0.5)
+    fired = []
+    wheel.schedule(1.2, fired.append, "a")
+    clock.now += 1.0
+    assert wheel.advance() == 0
+    clock.now += 0.5
+    assert wheel.advance() == 1
+    assert fired == ["a"]
+    clock.now += 5
+    assert wheel.advance() == 0
+
+def test_cancelled_timer_does_not_fire():
+    wheel, clock = make_wheel()
+    fired = []
+    wheel.schedule(1, fired.append, "a").cancel()
+    clock.now += 2
+    wheel.advance()
+    assert fired == []
+
+def test_timer_beyond_one_lap_waits_for_its_deadline():
+    wheel, clock = make_wheel(tick=1, slots=4)
+    fired = []
+    wheel.schedule(10, fired.append, "a")
+    for _ in range(9):
+        clock.now += 1
+        wheel.advance()
+    assert fired == []
+    clock.now += 2
+    wheel.advance()
+    assert fired == ["a"]
+
+def test_stall_fires_every_timer_in_deadline_order():
+    wheel, clock = make_wheel(tick=1, slots=8)
+    fired = []
+    for delay in (30, 3, 12, 7, 21, 1):
+        wheel.schedule(delay, fired.append, delay)
+    clock.now += 100
+    assert wheel.advance() == 6
+    assert fired == [1, 3, 7, 12, 21, 30]
+
+def test_callbacks_can_reschedule_and_fail():
+    wheel, clock = make_wheel(tick=1)
+    fired = []
+
+    def again():
+        fired.append("again")
+        wheel.schedule(1, fired.append, "later")
+
+    wheel.schedule(1, lambda: 1 / 0)
+    wheel.schedule(1, again)
+    clock.now += 2
+    wheel.advance()
+    assert fired == ["again"]
+    clock.now += 2
+    wheel.advance()
+    assert fired == ["again", "later"]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from logs import get_logger
+
+# hashed timer wheel: one list per tick, a timer lives in the slot of the tick
+# it expires on. scheduling and cancelling are O(1) and advancing only looks at
+# the slots that came due, so tens of thousands of connections can each keep
+# a timer without one thread or event loop handle apiece.
+
+log = get_logger("timers")
+
+class Timer:
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    def __init__(self, tick=0.5, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [[] for _ in range(slots)]
+        # last tick that was processed
+        self.current = int(clock() / tick)
+        self.lock = threading.Lock()
+
+    def schedule(self, delay, callback, *args):
+        timer = Timer(self.clock() + delay, callback, args)
+        # round up so the timer never fires before its deadline, at most one tick late
+        tick = int(timer.deadline / self.tick) + 1
+        with self.lock:
+            tick = max(tick, self.current + 1)
+            self.slots[tick % len(self.slots)].append(timer)
+        return timer
+
+    def advance(self):
+        now = self.clock()
+        target = int(now / self.tick)
+        due = []
+        with self.lock:
+            # after a long stall one lap over the slots finds every due timer,
+            # but not in the order they came due, so they are sorted below
+            self.current = max(self.current, target - len(self.slots))
+            while self.current < target:
+                self.current += 1
+                slot = self.slots[self.current % len(self.slots)]
+                later = []
+                for timer in slot:
+                    if timer.cancelled:
+                        continue
+                    if timer.deadline <= now:
+                        due.append(timer)
+                    else:
+                        # due on a later lap around the wheel
+                        later.append(timer)
+                slot[:] = later
+        due.sort(key=lambda timer: timer.deadline)
+
+        # callbacks run outside the lock so they can schedule again
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                log.error("timer callback failed", callback=timer.callback, error=repr(e))
+        return len(due)
+
+    def run(self, stop_event):
+        # driver for threaded code, async code calls advance() from a task
+        while not stop_event.wait(self.tick):
+            self.advance()